@@ -1,6 +1,30 @@
 from django.contrib import admin
 
+from .deletion import soft_delete_user
 from .models import FriendShip, User
 
-admin.site.register(User)
+
+@admin.action(description="選択したユーザーを削除する（関連データはバックグラウンドで削除）")
+def soft_delete_users(modeladmin, request, queryset):
+    modeladmin.delete_queryset(request, queryset)
+
+
+class UserAdmin(admin.ModelAdmin):
+    actions = [soft_delete_users]
+
+    def get_actions(self, request):
+        # 標準の一括削除は関連データを 1 リクエストで CASCADE するので使わせない
+        actions = super().get_actions(request)
+        actions.pop("delete_selected", None)
+        return actions
+
+    def delete_model(self, request, obj):
+        soft_delete_user(obj)
+
+    def delete_queryset(self, request, queryset):
+        for user in queryset:
+            soft_delete_user(user)
+
+
+admin.site.register(User, UserAdmin)
 admin.site.register(FriendShip)
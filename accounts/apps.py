@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class AccountsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "accounts"
+
+    def ready(self):
+        from .models import User
+        from .usernames import forget_deleted_user, forget_saved_user
+
+        # ユーザー名の変更や削除があれば、ユーザー名 → ID のキャッシュから消す
+        post_save.connect(forget_saved_user, sender=User, dispatch_uid="accounts.forget_saved_user")
+        post_delete.connect(forget_deleted_user, sender=User, dispatch_uid="accounts.forget_deleted_user")
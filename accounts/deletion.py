@@ -0,0 +1,40 @@
+from django.db.models import Q
+from django.utils import timezone
+
+from accounts.models import FriendShip, User
+from accounts.usernames import forget_user
+from archive.models import ArchivedLike, ArchivedTweet
+from archive.reads import horizon
+from notifications.models import Notification
+from taskqueue.queue import enqueue_on_commit
+from tweets import snapshots
+from tweets.deletion import delete_likes, delete_notifications, delete_tweets, iter_pk_chunks
+from tweets.models import Like, Tweet
+from tweets.versions import bump_profile
+
+
+def soft_delete_user(user):
+    # ログインできなくし、ツイートもまとめて非表示にする
+    now = timezone.now()
+    User.objects.filter(pk=user.pk).update(deleted_at=now, is_active=False)
+    Tweet.all_objects.filter(user=user, deleted_at__isnull=True).update(deleted_at=now)
+    bump_profile(user.pk)
+    snapshots.remove_tweets(user_id=user.pk)
+    forget_user(user.pk, user.username)
+    enqueue_on_commit("accounts.purge_user", {"user_id": user.pk}, idempotency_key=f"purge-user:{user.pk}")
+
+
+def purge_user(user_id):
+    delete_likes(Like.objects.filter(user_id=user_id))
+    delete_tweets(Tweet.all_objects.filter(user_id=user_id))
+    for pks in iter_pk_chunks(FriendShip.objects.filter(Q(following_id=user_id) | Q(followed_id=user_id))):
+        FriendShip.objects.filter(pk__in=pks).delete()
+    delete_notifications(Notification.objects.filter(recipient_id=user_id))
+    if horizon() is not None:
+        # アーカイブのいいね数は読み取り専用なので数え直さない
+        for pks in iter_pk_chunks(ArchivedLike.objects.filter(user_id=user_id)):
+            ArchivedLike.objects.filter(pk__in=pks).delete()
+        for pks in iter_pk_chunks(ArchivedTweet.objects.filter(user_id=user_id)):
+            ArchivedTweet.objects.filter(pk__in=pks).delete()
+    # 関連する行はすべて消えているので、ここでの CASCADE はほぼ何も読み込まない
+    User.objects.filter(pk=user_id).delete()
@@ -0,0 +1,133 @@
+import csv
+import json
+import zlib
+
+from accounts.models import FriendShip
+from archive.models import ArchivedLike, ArchivedTweet
+from archive.reads import horizon
+from tweets.models import Like, Tweet
+from tweets.sharding import like_shards
+
+CSV_COLUMNS = ["type", "id", "user", "content", "tweet_id", "following", "followed", "like_count", "created_at"]
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def iter_records(user, chunk_size=2000):
+    """ユーザーのツイート・いいね・フォロー関係を 1 件ずつ dict で返す。
+
+    values_list と iterator を使うので、件数に関係なくメモリ使用量は一定になる。
+    """
+    yield {
+        "type": "user",
+        "id": user.pk,
+        "user": user.username,
+        "email": user.email,
+        "created_at": user.date_joined.isoformat(),
+    }
+    tweets = [Tweet.objects.filter(user=user)]
+    # シャードごとに順に流す（並べ替えのために全件を読み込まない）
+    likes = [Like.objects.using(alias).filter(user=user) for alias in like_shards()]
+    if horizon() is not None:
+        tweets.append(ArchivedTweet.objects.filter(user_id=user.pk))
+        likes.append(ArchivedLike.objects.filter(user_id=user.pk))
+    tweets = (
+        row
+        for queryset in tweets
+        for row in queryset.order_by("pk")
+        .values_list("pk", "content", "like_count", "created_at")
+        .iterator(chunk_size=chunk_size)
+    )
+    for pk, content, like_count, created_at in tweets:
+        yield {
+            "type": "tweet",
+            "id": pk,
+            "user": user.username,
+            "content": content,
+            "like_count": like_count,
+            "created_at": created_at.isoformat(),
+        }
+    likes = (
+        row
+        for queryset in likes
+        for row in queryset.order_by("pk").values_list("pk", "tweet_id", "created_at").iterator(chunk_size=chunk_size)
+    )
+    for pk, tweet_id, created_at in likes:
+        yield {
+            "type": "like",
+            "id": pk,
+            "user": user.username,
+            "tweet_id": tweet_id,
+            "created_at": created_at.isoformat(),
+        }
+    for lookup in ("following", "followed"):
+        friendships = (
+            FriendShip.objects.filter(**{lookup: user})
+            .order_by("pk")
+            .values_list("pk", "following__username", "followed__username", "created_at")
+        )
+        for pk, following, followed, created_at in friendships.iterator(chunk_size=chunk_size):
+            yield {
+                "type": "follow",
+                "id": pk,
+                "following": following,
+                "followed": followed,
+                "created_at": created_at.isoformat(),
+            }
+
+
+def render_ndjson(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def render_csv(records):
+    writer = csv.DictWriter(_Echo(), fieldnames=CSV_COLUMNS, restval="", extrasaction="ignore")
+    yield writer.writeheader()
+    for record in records:
+        yield writer.writerow(record)
+
+
+def render(records, format):
+    if format == "csv":
+        return render_csv(records)
+    return render_ndjson(records)
+
+
+def buffered(chunks, size=64 * 1024):
+    """細かい行を size バイト程度にまとめてから返す。"""
+    buffer = []
+    length = 0
+    for chunk in chunks:
+        data = chunk.encode()
+        buffer.append(data)
+        length += len(data)
+        if length >= size:
+            yield b"".join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def gzip_stream(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(user, format="ndjson", compress=False, chunk_size=2000):
+    stream = buffered(render(iter_records(user, chunk_size=chunk_size), format))
+    if compress:
+        stream = gzip_stream(stream)
+    return stream
@@ -0,0 +1,260 @@
+import gzip
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import groupby, islice
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from accounts.models import FriendShip, ImportCheckpoint, ImportedTweet, ImportedUser, User
+from tweets.ids import tweet_id_for
+from tweets.models import Like, Tweet
+from tweets.pipeline import tweets_created
+from tweets.sharding import shard_for
+from tweets.tasks import reconcile_like_counts
+
+# 1 パス目でユーザーとツイートを、2 パス目でそれらを参照するいいねとフォローを取り込む
+PASSES = [("user", "tweet"), ("like", "follow")]
+
+
+def read_lines(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        yield from enumerate(f, start=1)
+
+
+def parse(lines):
+    for lineno, line in lines:
+        line = line.strip()
+        if line:
+            yield lineno, json.loads(line)
+
+
+def batched(records, size):
+    """同じ type のレコードが続く間、最大 size 件ずつまとめる。"""
+    for record_type, group in groupby(records, key=lambda item: item[1]["type"]):
+        group = iter(group)
+        while batch := list(islice(group, size)):
+            yield record_type, batch
+
+
+class UsernameConflict(Exception):
+    pass
+
+
+class Checkpoint:
+    """取り込み済みの位置と、旧ツイート ID → 新ツイート ID・ユーザー名 → 作ったユーザーの対応を DB に残す。
+
+    save はバッチを取り込んだのと同じトランザクションの中で呼ぶので、途中で止まっても同じ行を二度取り込まない。
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.pass_index = 0
+        self.lineno = 0
+        self.tweet_ids = {}
+        self.user_ids = {}
+        self.new_tweet_ids = {}
+        self.new_user_ids = {}
+
+    def load(self):
+        self.state, _ = ImportCheckpoint.objects.get_or_create(name=self.name)
+        self.pass_index = self.state.pass_index
+        self.lineno = self.state.lineno
+        self.tweet_ids = dict(self.state.tweets.values_list("source_id", "tweet_id"))
+        self.user_ids = dict(self.state.users.values_list("username", "user_id"))
+
+    def add_tweets(self, tweet_ids):
+        self.tweet_ids.update(tweet_ids)
+        self.new_tweet_ids.update(tweet_ids)
+
+    def add_users(self, user_ids):
+        self.user_ids.update(user_ids)
+        self.new_user_ids.update(user_ids)
+
+    def save(self, pass_index, lineno):
+        ImportedTweet.objects.bulk_create(
+            [
+                ImportedTweet(checkpoint=self.state, source_id=old, tweet_id=new)
+                for old, new in self.new_tweet_ids.items()
+            ]
+        )
+        ImportedUser.objects.bulk_create(
+            [
+                ImportedUser(checkpoint=self.state, username=username, user_id=user_id)
+                for username, user_id in self.new_user_ids.items()
+            ]
+        )
+        ImportCheckpoint.objects.filter(pk=self.state.pk).update(pass_index=pass_index, lineno=lineno)
+        self.new_tweet_ids = {}
+        self.new_user_ids = {}
+        self.pass_index = pass_index
+        self.lineno = lineno
+
+    def clear(self):
+        ImportedTweet.objects.filter(checkpoint__name=self.name).delete()
+        ImportedUser.objects.filter(checkpoint__name=self.name).delete()
+        ImportCheckpoint.objects.filter(name=self.name).delete()
+
+
+class StageStats:
+    def __init__(self):
+        self.rows = {}
+        self.seconds = {}
+
+    @contextmanager
+    def measure(self, stage, rows):
+        started = time.perf_counter()
+        yield
+        self.rows[stage] = self.rows.get(stage, 0) + rows
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + time.perf_counter() - started
+
+    def timed(self, stage, items):
+        """ジェネレータの各要素を取り出すのにかかった時間を stage に加算する。"""
+        items = iter(items)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + time.perf_counter() - started
+            self.rows[stage] = self.rows.get(stage, 0) + 1
+            yield item
+
+    def report(self):
+        return [
+            (
+                stage,
+                self.rows[stage],
+                self.seconds[stage],
+                self.rows[stage] / self.seconds[stage] if self.seconds[stage] else 0.0,
+            )
+            for stage in self.rows
+        ]
+
+
+class ArchiveImporter:
+    def __init__(self, path, batch_size=5000, checkpoint=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.checkpoint = Checkpoint(checkpoint or path)
+        self.stats = StageStats()
+        self.skipped = 0
+
+    def run(self, restart=False):
+        if restart:
+            self.checkpoint.clear()
+        self.checkpoint.load()
+        for pass_index, types in enumerate(PASSES):
+            if pass_index < self.checkpoint.pass_index:
+                continue
+            start = self.checkpoint.lineno if pass_index == self.checkpoint.pass_index else 0
+            records = (
+                item
+                for item in self.stats.timed("parse", parse(read_lines(self.path)))
+                if item[0] > start and item[1]["type"] in types
+            )
+            for record_type, batch in batched(records, self.batch_size):
+                # いいねはシャードに書くが、重複は無視して入れるので、やり直しても二重にならない
+                with transaction.atomic():
+                    getattr(self, f"import_{record_type}s")([record for _, record in batch])
+                    self.checkpoint.save(pass_index, batch[-1][0])
+            with transaction.atomic():
+                self.checkpoint.save(pass_index + 1, 0)
+        self.rebuild_counters()
+        self.checkpoint.clear()
+        return self.stats
+
+    @property
+    def user_ids(self):
+        # 参照先にするのはこの取り込みで作ったユーザーだけ
+        return self.checkpoint.user_ids
+
+    def import_users(self, records):
+        with self.stats.measure("user", len(records)):
+            records = {record["user"]: record for record in records if record["user"] not in self.user_ids}
+            conflicts = sorted(User.objects.filter(username__in=records).values_list("username", flat=True))
+            if conflicts:
+                raise UsernameConflict(f"同じユーザー名のユーザーが既にいます: {', '.join(conflicts)}")
+            password = make_password(None)
+            users = User.objects.bulk_create(
+                [
+                    User(
+                        username=record["user"],
+                        email=record.get("email", ""),
+                        date_joined=datetime.fromisoformat(record["created_at"]),
+                        password=password,
+                    )
+                    for record in records.values()
+                ]
+            )
+            self.checkpoint.add_users({user.username: user.pk for user in users})
+
+    def import_tweets(self, records):
+        with self.stats.measure("tweet", len(records)):
+            records = [
+                record
+                for record in records
+                if record["user"] in self.user_ids and record["id"] not in self.checkpoint.tweet_ids
+            ]
+            created = [datetime.fromisoformat(record["created_at"]) for record in records]
+            tweets = Tweet.objects.bulk_create(
+                [
+                    Tweet(
+                        # 時刻順の ID を使う場合は、取り込んだツイートを元の投稿時刻の位置に並べる
+                        id=tweet_id_for(created_at),
+                        user_id=self.user_ids[record["user"]],
+                        content=record["content"],
+                        created_at=created_at,
+                    )
+                    for record, created_at in zip(records, created)
+                ],
+                batch_size=self.batch_size,
+            )
+            tweets_created(tweets)
+            self.checkpoint.add_tweets({record["id"]: tweet.pk for record, tweet in zip(records, tweets)})
+
+    def import_likes(self, records):
+        with self.stats.measure("like", len(records)):
+            likes = [
+                Like(
+                    tweet_id=self.checkpoint.tweet_ids[record["tweet_id"]],
+                    user_id=self.user_ids[record["user"]],
+                    created_at=datetime.fromisoformat(record["created_at"]),
+                )
+                for record in records
+                if record["tweet_id"] in self.checkpoint.tweet_ids and record["user"] in self.user_ids
+            ]
+            self.skipped += len(records) - len(likes)
+            by_shard = defaultdict(list)
+            for like in likes:
+                by_shard[shard_for(like.tweet_id)].append(like)
+            for alias, shard_likes in by_shard.items():
+                Like.objects.using(alias).bulk_create(shard_likes, batch_size=self.batch_size, ignore_conflicts=True)
+
+    def import_follows(self, records):
+        with self.stats.measure("follow", len(records)):
+            friendships = [
+                FriendShip(
+                    following_id=self.user_ids[record["following"]],
+                    followed_id=self.user_ids[record["followed"]],
+                    created_at=datetime.fromisoformat(record["created_at"]),
+                )
+                for record in records
+                if record["following"] in self.user_ids
+                and record["followed"] in self.user_ids
+                and record["following"] != record["followed"]
+            ]
+            self.skipped += len(records) - len(friendships)
+            FriendShip.objects.bulk_create(friendships, batch_size=self.batch_size, ignore_conflicts=True)
+
+    def rebuild_counters(self):
+        # いいね数は取り込み中には更新せず、最後に取り込んだツイートの分だけまとめて数え直す
+        tweet_ids = list(self.checkpoint.tweet_ids.values())
+        with self.stats.measure("counters", len(tweet_ids)):
+            for i in range(0, len(tweet_ids), self.batch_size):
+                reconcile_like_counts(tweet_ids=tweet_ids[i : i + self.batch_size])
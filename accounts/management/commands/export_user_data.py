@@ -0,0 +1,33 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.exports import FORMATS, export_stream
+from accounts.models import User
+
+
+class Command(BaseCommand):
+    help = "ユーザーのツイート・いいね・フォロー関係を NDJSON または CSV で書き出します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("--format", choices=sorted(FORMATS), default="ndjson")
+        parser.add_argument("--gzip", action="store_true")
+        parser.add_argument("--output", "-o", help="出力先のファイル（省略時は標準出力）")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"ユーザーが存在しません: {options['username']}")
+
+        stream = export_stream(user, options["format"], options["gzip"], options["chunk_size"])
+        if options["output"]:
+            with open(options["output"], "wb") as f:
+                for chunk in stream:
+                    f.write(chunk)
+        else:
+            for chunk in stream:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.imports import ArchiveImporter, UsernameConflict
+
+
+class Command(BaseCommand):
+    help = (
+        "export_user_data で書き出した NDJSON アーカイブ（.gz 可）を取り込みます。中断した場合は続きから再開します。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--checkpoint", help="チェックポイントの名前（既定は path）")
+        parser.add_argument("--restart", action="store_true", help="チェックポイントを無視して最初から取り込む")
+
+    def handle(self, *args, **options):
+        importer = ArchiveImporter(options["path"], options["batch_size"], options["checkpoint"])
+        try:
+            stats = importer.run(restart=options["restart"])
+        except UsernameConflict as e:
+            raise CommandError(f"{e}（ユーザー名を変えてから取り込み直してください）")
+        for stage, rows, seconds, throughput in stats.report():
+            self.stdout.write(f"{stage}: {rows} 行 / {seconds:.2f} 秒 ({throughput:.0f} 行/秒)")
+        if importer.skipped:
+            self.stdout.write(f"参照先が見つからずスキップした行: {importer.skipped}")
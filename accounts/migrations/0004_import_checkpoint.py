@@ -0,0 +1,74 @@
+# Generated by Django 4.1.13 on 2026-10-19 00:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0003_user_deleted_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportCheckpoint",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("name", models.CharField(max_length=255, unique=True)),
+                ("pass_index", models.PositiveSmallIntegerField(default=0)),
+                ("lineno", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name="friendship",
+            name="created_at",
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.CreateModel(
+            name="ImportedUser",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("username", models.CharField(max_length=150)),
+                (
+                    "checkpoint",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="users",
+                        to="accounts.importcheckpoint",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="+", to=settings.AUTH_USER_MODEL
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ImportedTweet",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("source_id", models.BigIntegerField()),
+                ("tweet_id", models.BigIntegerField()),
+                (
+                    "checkpoint",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="tweets",
+                        to="accounts.importcheckpoint",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="importeduser",
+            constraint=models.UniqueConstraint(fields=("checkpoint", "username"), name="OnlyOneImportedUser"),
+        ),
+        migrations.AddConstraint(
+            model_name="importedtweet",
+            constraint=models.UniqueConstraint(fields=("checkpoint", "source_id"), name="OnlyOneImportedTweet"),
+        ),
+    ]
@@ -1,16 +1,18 @@
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.utils import timezone
 
 
 class User(AbstractUser):
     email = models.EmailField()
+    deleted_at = models.DateTimeField(null=True, blank=True)
 
 
 class FriendShip(models.Model):
     following = models.ForeignKey(User, related_name="following", on_delete=models.CASCADE)
     followed = models.ForeignKey(User, related_name="followed", on_delete=models.CASCADE)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         # 再度同じユーザーをフォローすることを出来なくする。
@@ -22,3 +24,30 @@ class FriendShip(models.Model):
 
     def __str__(self):
         return f"{self.following} follows {self.followed}"
+
+
+class ImportCheckpoint(models.Model):
+    # import_archive の取り込み済みの位置。取り込んだ行と同じトランザクションで進める
+    name = models.CharField(max_length=255, unique=True)
+    pass_index = models.PositiveSmallIntegerField(default=0)
+    lineno = models.PositiveIntegerField(default=0)
+
+
+class ImportedUser(models.Model):
+    # 取り込みで作ったユーザー。同じ名前の既存ユーザーに取り込んだ行を付けないよう、これだけを参照先にする
+    checkpoint = models.ForeignKey(ImportCheckpoint, on_delete=models.CASCADE, related_name="users")
+    username = models.CharField(max_length=150)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["checkpoint", "username"], name="OnlyOneImportedUser")]
+
+
+class ImportedTweet(models.Model):
+    # アーカイブのツイート ID → 取り込んだツイートの ID
+    checkpoint = models.ForeignKey(ImportCheckpoint, on_delete=models.CASCADE, related_name="tweets")
+    source_id = models.BigIntegerField()
+    tweet_id = models.BigIntegerField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["checkpoint", "source_id"], name="OnlyOneImportedTweet")]
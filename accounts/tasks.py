@@ -0,0 +1,8 @@
+from taskqueue.queue import task
+
+from .deletion import purge_user
+
+
+@task("accounts.purge_user")
+def purge_user_task(user_id):
+    purge_user(user_id)
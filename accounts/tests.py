@@ -1,10 +1,27 @@
+import gzip
+import json
+import tempfile
+from io import StringIO
+from unittest import mock
+
 from django.conf import settings
 from django.contrib.auth import SESSION_KEY, get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from accounts.deletion import soft_delete_user
+from accounts.exports import export_stream
+from accounts.imports import ArchiveImporter, Checkpoint
 from accounts.models import FriendShip
-from tweets.models import Tweet
+from accounts.usernames import LocalUsernameCache, local_cache, resolve_username
+from metrics.querybudget import QueryBudgetTestMixin
+from ratelimit.stores import get_store
+from taskqueue.queue import run_pending
+from tweets.models import Like, Tweet
 
 User = get_user_model()
 
@@ -255,7 +272,35 @@ class TestUserProfileView(TestCase):
         response = self.client.get(self.url)
         context_tweets = response.context["tweets"]
         user_tweets_in_db = Tweet.objects.filter(user=self.user).order_by("-created_at")
-        self.assertQuerysetEqual(context_tweets, user_tweets_in_db, ordered=False)
+        self.assertEqual({tweet.pk for tweet in context_tweets}, {tweet.pk for tweet in user_tweets_in_db})
+
+
+class TestUserProfileConditionalGet(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", email="test@test.com", password="testpassword")
+        self.other_user = User.objects.create_user(username="other", email="other@test.com", password="testpassword")
+        Tweet.objects.create(user=self.user, content="TestContent")
+        self.url = reverse("accounts:user_profile", kwargs={"username": self.user.username})
+
+    def test_success_anonymous_get(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("public", response["Cache-Control"])
+
+    def test_success_not_modified(self):
+        etag = self.client.get(self.url)["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_after_follow(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.client.login(username="other", password="testpassword")
+        self.client.post(reverse("accounts:follow", kwargs={"username": self.user.username}))
+        self.client.logout()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
 
 
 class TestUserProfileEditView(TestCase):
@@ -362,3 +407,265 @@ class TestFollowerListView(TestCase):
     def test_success_get(self):
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, 200)
+
+
+class TestDataExportView(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="tester", password="testpassword")
+        self.other_user = User.objects.create_user(username="other_user", password="testpassword")
+        self.client.login(username="tester", password="testpassword")
+        self.tweet = Tweet.objects.create(user=self.user, content="TestContent")
+        other_tweet = Tweet.objects.create(user=self.other_user, content="OtherContent")
+        Like.objects.create(user=self.user, tweet=other_tweet)
+        FriendShip.objects.create(following=self.user, followed=self.other_user)
+        FriendShip.objects.create(following=self.other_user, followed=self.user)
+        self.url = reverse("accounts:export")
+
+    def test_success_get_ndjson(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        records = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([record["type"] for record in records], ["user", "tweet", "like", "follow", "follow"])
+        self.assertEqual(records[1]["content"], "TestContent")
+
+    def test_success_get_csv_with_gzip(self):
+        response = self.client.get(self.url, {"format": "csv", "gzip": "1"})
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        lines = gzip.decompress(b"".join(response.streaming_content)).decode().splitlines()
+        self.assertTrue(lines[0].startswith("type,id,user"))
+        self.assertEqual(len(lines), 6)
+
+    def test_failure_get_with_invalid_format(self):
+        response = self.client.get(self.url, {"format": "xml"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_success_profile_of_user_named_export(self):
+        User.objects.create_user(username="export", password="testpassword")
+        response = self.client.get(reverse("accounts:user_profile", kwargs={"username": "export"}))
+        self.assertEqual(response.status_code, 200)
+
+    def test_success_command(self):
+        with tempfile.NamedTemporaryFile(suffix=".ndjson.gz") as f:
+            call_command("export_user_data", "tester", "--gzip", "--output", f.name)
+            lines = gzip.decompress(f.read()).decode().splitlines()
+        self.assertEqual(json.loads(lines[0])["user"], "tester")
+        self.assertEqual(len(lines), 5)
+
+
+class TestArchiveImporter(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="tester", password="testpassword")
+        self.other_user = User.objects.create_user(username="other_user", password="testpassword")
+        tweets = [Tweet.objects.create(user=user, content=f"{user}Content") for user in (self.user, self.other_user)]
+        Like.objects.create(user=self.user, tweet=tweets[1])
+        Like.objects.create(user=self.other_user, tweet=tweets[0])
+        FriendShip.objects.create(following=self.user, followed=self.other_user)
+        self.created_at = tweets[0].created_at
+
+        self.archive = tempfile.NamedTemporaryFile(suffix=".ndjson.gz")
+        self.addCleanup(self.archive.close)
+        for user in (self.user, self.other_user):
+            for chunk in export_stream(user, compress=True):
+                self.archive.write(chunk)
+        self.archive.flush()
+        User.objects.all().delete()
+
+    def assertImported(self):
+        self.assertEqual(User.objects.count(), 2)
+        self.assertEqual(Tweet.objects.count(), 2)
+        self.assertEqual(Like.objects.count(), 2)
+        self.assertEqual(FriendShip.objects.count(), 1)
+        tweet = Tweet.objects.get(user__username="tester")
+        self.assertEqual(tweet.like_count, 1)
+        self.assertEqual(tweet.created_at, self.created_at)
+
+    def test_success_import(self):
+        out = StringIO()
+        call_command("import_archive", self.archive.name, stdout=out)
+        self.assertImported()
+        self.assertIn("tweet: 2 行", out.getvalue())
+
+    def test_success_resume_from_checkpoint(self):
+        with mock.patch.object(ArchiveImporter, "import_follows", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                ArchiveImporter(self.archive.name, batch_size=1).run()
+        self.assertEqual(Tweet.objects.count(), 2)
+        ArchiveImporter(self.archive.name, batch_size=1).run()
+        self.assertImported()
+
+    def test_success_resume_after_crash_before_commit(self):
+        save = Checkpoint.save
+        calls = []
+
+        def crash_on_tweet(checkpoint, *args):
+            # 2 回目（最初のツイートのバッチ）の位置を書いた直後、コミットする前に止まる
+            save(checkpoint, *args)
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError
+
+        with mock.patch.object(Checkpoint, "save", crash_on_tweet):
+            with self.assertRaises(RuntimeError):
+                ArchiveImporter(self.archive.name, batch_size=1).run()
+        self.assertFalse(Tweet.objects.exists())
+        ArchiveImporter(self.archive.name, batch_size=1).run()
+        self.assertImported()
+
+    def test_failure_username_conflict(self):
+        existing = User.objects.create_user(username="other_user", password="testpassword")
+        with self.assertRaisesMessage(CommandError, "other_user"):
+            call_command("import_archive", self.archive.name, stdout=StringIO())
+        self.assertFalse(Tweet.objects.filter(user=existing).exists())
+        self.assertFalse(FriendShip.objects.exists())
+
+
+class TestSoftDeleteUser(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="tester", password="testpassword")
+        self.other_user = User.objects.create_user(username="other_user", password="testpassword")
+        self.other_tweet = Tweet.objects.create(user=self.other_user, content="OtherContent", like_count=1)
+        Like.objects.create(user=self.user, tweet=self.other_tweet)
+        tweet = Tweet.objects.create(user=self.user, content="TestContent")
+        Like.objects.create(user=self.other_user, tweet=tweet)
+        FriendShip.objects.create(following=self.user, followed=self.other_user)
+
+    def test_success_soft_delete_and_purge(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            soft_delete_user(self.user)
+        self.assertFalse(Tweet.objects.filter(user=self.user).exists())
+        response = self.client.get(reverse("accounts:user_profile", kwargs={"username": self.user.username}))
+        self.assertEqual(response.status_code, 404)
+
+        with self.settings(DELETION_CHUNK_SIZE=1):
+            run_pending()
+        self.assertFalse(User.objects.filter(username="tester").exists())
+        self.assertFalse(Tweet.all_objects.filter(user__username="tester").exists())
+        self.assertFalse(Like.objects.exists())
+        self.assertFalse(FriendShip.objects.exists())
+        self.other_tweet.refresh_from_db()
+        self.assertEqual(self.other_tweet.like_count, 0)
+
+    def test_success_admin_delete_is_soft(self):
+        User.objects.create_superuser(username="admin", password="testpassword")
+        self.client.login(username="admin", password="testpassword")
+        changelist = reverse("admin:accounts_user_changelist")
+        choices = self.client.get(changelist).context["action_form"].fields["action"].choices
+        self.assertEqual([name for name, _ in choices if name], ["soft_delete_users"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("admin:accounts_user_delete", args=(self.user.pk,)), {"post": "yes"})
+        self.assertEqual(response.status_code, 302)
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.deleted_at)
+        self.assertFalse(Tweet.objects.filter(user=self.user).exists())
+        self.assertTrue(Like.objects.filter(user=self.user).exists())
+        run_pending()
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+
+
+class TestUsernameCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.user = User.objects.create_user(username="tester", password="testpassword")
+
+    def test_success_resolve_once(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(resolve_username("tester"), self.user.pk)
+            self.assertEqual(resolve_username("tester"), self.user.pk)
+        local_cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_username("tester"), self.user.pk)
+
+    def test_failure_unknown_or_deleted(self):
+        self.assertIsNone(resolve_username("nobody"))
+        resolve_username("tester")
+        with self.captureOnCommitCallbacks():
+            soft_delete_user(self.user)
+        self.assertIsNone(resolve_username("tester"))
+
+    def test_invalidate_on_username_change(self):
+        resolve_username("tester")
+        self.user.username = "renamed"
+        self.user.save()
+        self.assertIsNone(resolve_username("tester"))
+        self.assertEqual(resolve_username("renamed"), self.user.pk)
+
+    def test_bounded_and_expiring(self):
+        local = LocalUsernameCache(max_size=2, ttl=60)
+        for i in range(3):
+            local.set(f"user{i}", i)
+        self.assertIsNone(local.get("user0"))
+        self.assertEqual(local.get("user2"), 2)
+        with mock.patch("accounts.usernames.time.monotonic", return_value=10**9):
+            self.assertIsNone(local.get("user2"))
+
+    def test_follow_without_user_lookup(self):
+        User.objects.create_user(username="other", password="testpassword")
+        self.client.login(username="tester", password="testpassword")
+        resolve_username("other")
+        url = reverse("accounts:follow", kwargs={"username": "other"})
+        with CaptureQueriesContext(connection) as context:
+            self.client.post(url)
+        self.assertFalse(any('"username" =' in query["sql"] for query in context.captured_queries))
+
+    def test_failure_list_unknown_user(self):
+        response = self.client.get(reverse("accounts:following_list", kwargs={"username": "nobody"}))
+        self.assertEqual(response.status_code, 404)
+
+
+class TestQueryBudgets(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        get_store().reset()
+        self.addCleanup(get_store().reset)
+        self.user = User.objects.create_user(username="tester", password="testpassword")
+        self.author = User.objects.create_user(username="author", password="testpassword")
+        Tweet.objects.create(user=self.author, content="test_content")
+        self.client.login(username="tester", password="testpassword")
+
+    def clear_caches(self):
+        cache.clear()
+        local_cache.clear()
+
+    def test_success_pages_within_budget(self):
+        FriendShip.objects.create(following=self.user, followed=self.author)
+        for name in ("accounts:user_profile", "accounts:following_list", "accounts:follower_list"):
+            path = reverse(name, kwargs={"username": "author"})
+            with self.subTest(path=path):
+                self.clear_caches()
+                self.assertEqual(self.assertWithinViewBudget(path).status_code, 200)
+
+    def test_success_follow_within_budget(self):
+        for name in ("accounts:follow", "accounts:unfollow"):
+            path = reverse(name, kwargs={"username": "author"})
+            self.clear_caches()
+            self.assertWithinViewBudget(path, lambda: self.client.post(path))
+
+    def test_success_profile_queries_constant(self):
+        def grow(size):
+            tweets = Tweet.objects.bulk_create(
+                [Tweet(user=self.author, content=f"tweet {i}") for i in range(Tweet.objects.count(), size)]
+            )
+            Like.objects.bulk_create([Like(user=self.user, tweet=tweet) for tweet in tweets[::3]])
+
+        def request():
+            self.clear_caches()
+            self.client.get(reverse("accounts:user_profile", kwargs={"username": "author"}))
+
+        self.assertConstantQueries(request, grow)
+
+    def test_success_follower_list_queries_constant(self):
+        def grow(size):
+            users = User.objects.bulk_create(
+                [User(username=f"follower{i}") for i in range(User.objects.count(), size)]
+            )
+            FriendShip.objects.bulk_create([FriendShip(following=user, followed=self.author) for user in users])
+
+        def request():
+            self.clear_caches()
+            self.client.get(reverse("accounts:follower_list", kwargs={"username": "author"}))
+
+        self.assertConstantQueries(request, grow)
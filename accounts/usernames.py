@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from accounts.models import User
+
+# ユーザー名 → ユーザー ID を、プロセス内の LRU とキャッシュ（共有）の 2 段で覚えておく。
+# 共有キャッシュには逆引き（ID → ユーザー名）も置き、ユーザー名が変わったときに古い名前を消せるようにする。
+# 他のプロセスのプロセス内キャッシュは消せないので、そちらの TTL は短くしておく。
+USERNAME_KEY = "username:id:{}"
+USER_ID_KEY = "username:name:{}"
+
+
+class LocalUsernameCache:
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, username):
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return None
+            user_id, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[username]
+                return None
+            self._entries.move_to_end(username)
+            return user_id
+
+    def set(self, username, user_id):
+        with self._lock:
+            self._entries[username] = (user_id, time.monotonic() + self.ttl)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, username):
+        with self._lock:
+            self._entries.pop(username, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_cache = LocalUsernameCache(
+    getattr(settings, "USERNAME_CACHE_LOCAL_SIZE", 10_000), getattr(settings, "USERNAME_CACHE_LOCAL_TTL", 30)
+)
+
+
+def resolve_username(username):
+    """有効な（退会していない）ユーザーの ID を返す。いなければ None。
+
+    プロセス内 → 共有キャッシュ → username のインデックスを使う 1 クエリの順に探す。
+    """
+    user_id = local_cache.get(username)
+    if user_id is not None:
+        return user_id
+    user_id = cache.get(USERNAME_KEY.format(username))
+    if user_id is None:
+        user_id = User.objects.filter(username=username, deleted_at__isnull=True).values_list("pk", flat=True).first()
+        if user_id is None:
+            return None
+        timeout = getattr(settings, "USERNAME_CACHE_TTL", 3600)
+        cache.set_many({USERNAME_KEY.format(username): user_id, USER_ID_KEY.format(user_id): username}, timeout)
+    local_cache.set(username, user_id)
+    return user_id
+
+
+def forget_user(user_id, username=None):
+    """ユーザー名の変更・退会・削除のときに呼ぶ。以前のユーザー名の対応も消す。"""
+    usernames = {username, cache.get(USER_ID_KEY.format(user_id))} - {None}
+    cache.delete_many([USERNAME_KEY.format(name) for name in usernames] + [USER_ID_KEY.format(user_id)])
+    for name in usernames:
+        local_cache.delete(name)
+
+
+def forget_saved_user(sender, instance, update_fields=None, **kwargs):
+    # ログイン時の last_login だけの更新などではユーザー名は変わらない
+    if update_fields is not None and not {"username", "deleted_at", "is_active"} & set(update_fields):
+        return
+    forget_user(instance.pk, instance.username)
+
+
+def forget_deleted_user(sender, instance, **kwargs):
+    forget_user(instance.pk, instance.username)
@@ -2,14 +2,27 @@
 from django.conf import settings
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Prefetch
-from django.http import HttpResponseBadRequest
-from django.shortcuts import get_object_or_404, redirect
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
+from django.shortcuts import redirect
 from django.urls import reverse_lazy
+from django.utils.decorators import method_decorator
 from django.views.generic import CreateView, ListView, TemplateView, View
 
-from accounts.models import FriendShip, User
-from tweets.models import Like, Tweet
+from accounts.exports import FORMATS, export_stream
+from accounts.models import FriendShip
+from accounts.usernames import resolve_username
+from archive.models import ArchivedTweet
+from archive.reads import read_through
+from metrics.collectors import record_write
+from notifications.delivery import notify
+from notifications.models import Notification
+from ratelimit.mixins import RateLimitMixin
+from tweets import snapshots
+from tweets.cursors import CursorMixin, before_q, next_cursor, tweet_before_q, tweet_order
+from tweets.models import Tweet
+from tweets.timeline import archived_items, timeline_items
+from tweets.versions import bump_profile, conditional_page, profile_stamp
+from tweets.viewer import attach_viewer_state
 
 from .forms import SignupForm
 
@@ -28,79 +41,123 @@ class SignupView(CreateView):
         return response
 
 
-class UserProfileView(TemplateView):
+def get_user_id_or_404(username):
+    user_id = resolve_username(username)
+    if user_id is None:
+        raise Http404("ユーザーが見つかりません。")
+    return user_id
+
+
+def profile_page_stamp(request, username):
+    user_id = resolve_username(username)
+    return profile_stamp(user_id) if user_id is not None else None
+
+
+@method_decorator(conditional_page(profile_page_stamp), name="dispatch")
+class UserProfileView(CursorMixin, TemplateView):
+    query_budget = 11
     model = Tweet
     template_name = "accounts/user_profile.html"
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        username = self.kwargs["username"]
-        profile_user = get_object_or_404(User, username=username)
-        tweets = (
-            Tweet.objects.select_related("user")
-            .prefetch_related(
-                Prefetch("likes", queryset=Like.objects.filter(user=self.request.user), to_attr="liked_by_user")
-            )
-            .filter(user=profile_user)
-            .order_by("-created_at")
+        profile_user_id = get_user_id_or_404(self.kwargs["username"])
+        limit = getattr(settings, "PROFILE_PAGE_SIZE", 20)
+        tweets = Tweet.objects.filter(tweet_before_q(self.before), user_id=profile_user_id).order_by(*tweet_order())
+        # 最後のページまで来たら、アーカイブに移した古いツイートを続けて読む
+        archived = ArchivedTweet.objects.filter(before_q(self.before), user_id=profile_user_id).order_by(
+            "-created_at", "-pk"
+        )
+        tweets = read_through(
+            timeline_items(tweets[: limit + 1]), limit, lambda count: archived_items(archived[:count])
         )
-        followers_count = FriendShip.objects.filter(followed=profile_user).count()
-        following_count = FriendShip.objects.filter(following=profile_user).count()
-        context["profile_user"] = profile_user
+        context["next_cursor"] = next_cursor(tweets, limit)
+        tweets = attach_viewer_state(self.request.user, tweets[:limit])
+        followers_count = FriendShip.objects.filter(followed_id=profile_user_id).count()
+        following_count = FriendShip.objects.filter(following_id=profile_user_id).count()
+        context["profile_user_id"] = profile_user_id
         context["tweets"] = tweets
         context["followers_count"] = followers_count
         context["following_count"] = following_count
         return context
 
 
-class FollowView(LoginRequiredMixin, View):
+class FollowView(LoginRequiredMixin, RateLimitMixin, View):
+    query_budget = 6
+    ratelimits = [("user", "30/m"), ("ip", "120/m")]
     model = FriendShip
 
     def post(self, request, username):
-        followed_user = get_object_or_404(User, username=username)
+        followed_user_id = get_user_id_or_404(username)
         following_user = self.request.user
 
         # 自分自身をフォローしようとした場合
-        if followed_user == following_user:
+        if followed_user_id == following_user.pk:
             return HttpResponseBadRequest("自分自身をフォローすることはできません。")
         # 既にフォローしている場合
-        if FriendShip.objects.filter(following=following_user, followed=followed_user).exists():
+        if FriendShip.objects.filter(following=following_user, followed_id=followed_user_id).exists():
             return HttpResponseBadRequest("既にフォローしています。")
 
         # フォロー関係を作成
-        FriendShip.objects.get_or_create(following=following_user, followed=followed_user)
+        _, created = FriendShip.objects.get_or_create(following=following_user, followed_id=followed_user_id)
+        if created:
+            record_write("follow")
+            bump_profile(following_user.pk, followed_user_id)
+            snapshots.update_follow(following_user.pk, followed_user_id, True)
+            notify(Notification.Verb.FOLLOW, following_user.pk, followed_user_id)
         return redirect(settings.LOGIN_REDIRECT_URL)
 
 
-class UnFollowView(LoginRequiredMixin, View):
+class UnFollowView(LoginRequiredMixin, RateLimitMixin, View):
+    query_budget = 5
+    ratelimits = [("user", "30/m"), ("ip", "120/m")]
+
     def post(self, request, *args, **kwargs):
-        username_to_unfollow = self.kwargs.get("username")
-        followed_user = get_object_or_404(User, username=username_to_unfollow)
+        followed_user_id = get_user_id_or_404(self.kwargs.get("username"))
         following_user = self.request.user
 
         try:
-            friendship = FriendShip.objects.get(following=following_user, followed=followed_user)
+            friendship = FriendShip.objects.get(following=following_user, followed_id=followed_user_id)
             friendship.delete()
+            record_write("unfollow")
+            bump_profile(following_user.pk, followed_user_id)
+            snapshots.update_follow(following_user.pk, followed_user_id, False)
             return redirect(settings.LOGIN_REDIRECT_URL)
         except FriendShip.DoesNotExist:
             return HttpResponseBadRequest("このユーザーをフォローしていません。")
 
 
 class FollowingListView(ListView):
+    query_budget = 2
     model = FriendShip
     template_name = "accounts/following_list.html"
 
     def get_queryset(self):
-        username = self.kwargs["username"]
-        user = User.objects.get(username=username)
-        return FriendShip.objects.filter(following=user)
+        user_id = get_user_id_or_404(self.kwargs["username"])
+        return FriendShip.objects.filter(following_id=user_id).select_related("followed")
 
 
 class FollowerListView(ListView):
+    query_budget = 2
     model = FriendShip
     template_name = "accounts/follower_list.html"
 
     def get_queryset(self):
-        username = self.kwargs["username"]
-        user = User.objects.get(username=username)
-        return FriendShip.objects.filter(followed=user)
+        user_id = get_user_id_or_404(self.kwargs["username"])
+        return FriendShip.objects.filter(followed_id=user_id).select_related("following")
+
+
+class DataExportView(LoginRequiredMixin, View):
+    def get(self, request, *args, **kwargs):
+        format = request.GET.get("format", "ndjson")
+        if format not in FORMATS:
+            return HttpResponseBadRequest("format には ndjson か csv を指定してください。")
+        compress = request.GET.get("gzip") == "1"
+
+        filename = f"{request.user.username}.{format}" + (".gz" if compress else "")
+        response = StreamingHttpResponse(
+            export_stream(request.user, format, compress),
+            content_type="application/gzip" if compress else FORMATS[format],
+        )
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
@@ -0,0 +1,84 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from tweets.deletion import delete_tweets, iter_pk_chunks
+from tweets.ids import is_snowflake
+from tweets.models import Like, Tweet, TweetTag
+from tweets.versions import bump_profile, bump_tweet
+
+from .models import ArchivedLike, ArchivedTweet, ArchivedTweetTag, ArchiveRun
+from .reads import forget_horizon
+from .routers import archive_database
+
+
+def default_horizon():
+    return timezone.now() - timedelta(days=getattr(settings, "ARCHIVE_AFTER_DAYS", 365))
+
+
+def archived_like_id(alias, pk):
+    """アーカイブでのいいねの ID。シャードごとの自動採番は重なりうるので、default 以外は負の値に振り直す。"""
+    if alias == "default" or is_snowflake(pk):
+        return pk
+    shards = list(getattr(settings, "LIKE_SHARD_DATABASES", ()))
+    return -(pk * len(shards) + shards.index(alias))
+
+
+def archivable(horizon):
+    # 論理削除済みのツイートは削除タスクに任せる
+    return Tweet.all_objects.filter(created_at__lt=horizon, deleted_at__isnull=True)
+
+
+def archive_chunk(pks):
+    """ツイートとそのいいね・タグをアーカイブにコピーしてから、元のデータベースから消す。
+
+    コピーは重複を無視するので、途中で落ちても同じチャンクをやり直せる。
+    """
+    tweets = list(
+        Tweet.all_objects.filter(pk__in=pks).values(
+            "id", "user_id", "content", "created_at", "updated_at", "like_count"
+        )
+    )
+    likes = [
+        {**row, "id": archived_like_id(alias, row["id"])}
+        for alias, row in Like.objects.for_tweets(
+            pks,
+            lambda queryset: (
+                (queryset.db, row) for row in queryset.values("id", "tweet_id", "user_id", "created_at")
+            ),
+        )
+    ]
+    tags = list(TweetTag.objects.filter(tweet_id__in=pks).values("tag", "tweet_id", "created_at"))
+    with transaction.atomic(using=archive_database()):
+        ArchivedTweet.objects.bulk_create([ArchivedTweet(**row) for row in tweets], ignore_conflicts=True)
+        ArchivedLike.objects.bulk_create([ArchivedLike(**row) for row in likes], ignore_conflicts=True)
+        ArchivedTweetTag.objects.bulk_create([ArchivedTweetTag(**row) for row in tags], ignore_conflicts=True)
+    with transaction.atomic():
+        delete_tweets(Tweet.all_objects.filter(pk__in=pks))
+    for row in tweets:
+        bump_tweet(row["id"])
+    bump_profile(*{row["user_id"] for row in tweets})
+    return len(tweets), len(likes)
+
+
+def start_run(horizon=None):
+    run = ArchiveRun.objects.create(horizon=horizon or default_horizon())
+    # この時点からアーカイブにあるツイートを読みにいく
+    forget_horizon()
+    return run
+
+
+def archive_tweets(run, max_chunks=None, chunk_size=None):
+    """run.horizon より古いツイートをチャンクごとにアーカイブへ移す。残りがなくなったら True を返す。"""
+    for i, pks in enumerate(iter_pk_chunks(archivable(run.horizon), chunk_size)):
+        if max_chunks is not None and i >= max_chunks:
+            return False
+        tweets, likes = archive_chunk(pks)
+        run.tweets += tweets
+        run.likes += likes
+        run.save(update_fields=["tweets", "likes"])
+    run.finished_at = timezone.now()
+    run.save(update_fields=["finished_at"])
+    return True
@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from archive.archiver import archive_tweets, start_run
+from taskqueue.queue import enqueue
+
+
+class Command(BaseCommand):
+    help = "指定した日数より古いツイートといいねをアーカイブ用のデータベースに移します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=getattr(settings, "ARCHIVE_AFTER_DAYS", 365))
+        parser.add_argument("--chunk-size", type=int, help="1 チャンクのツイート数（既定は DELETION_CHUNK_SIZE）")
+        parser.add_argument("--enqueue", action="store_true", help="その場で移さずバックグラウンドのタスクに登録する")
+
+    def handle(self, *args, **options):
+        run = start_run(timezone.now() - timedelta(days=options["days"]))
+        if options["enqueue"]:
+            enqueue("archive.archive_tweets", {"run_id": run.pk}, idempotency_key=f"archive-tweets:{run.pk}:0")
+            self.stdout.write(f"{run.horizon} より古いツイートのアーカイブをタスクに登録しました。")
+            return
+        archive_tweets(run, chunk_size=options["chunk_size"])
+        self.stdout.write(
+            f"{run.horizon} より古いツイート {run.tweets} 件といいね {run.likes} 件をアーカイブしました。"
+        )
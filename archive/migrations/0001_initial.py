@@ -0,0 +1,103 @@
+# Generated by Django 4.1.13 on 2026-10-18 23:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedTweet",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("content", models.TextField(max_length=200)),
+                ("created_at", models.DateTimeField()),
+                ("updated_at", models.DateTimeField()),
+                ("like_count", models.PositiveIntegerField(default=0)),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ArchiveRun",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("horizon", models.DateTimeField()),
+                ("started_at", models.DateTimeField(auto_now_add=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                ("tweets", models.PositiveIntegerField(default=0)),
+                ("likes", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ArchivedTweetTag",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("tag", models.CharField(max_length=151)),
+                ("created_at", models.DateTimeField()),
+                (
+                    "tweet",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="tags", to="archive.archivedtweet"
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ArchivedLike",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("created_at", models.DateTimeField()),
+                (
+                    "tweet",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="likes", to="archive.archivedtweet"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="archivedtweettag",
+            index=models.Index(fields=["tag", "created_at", "tweet"], name="archivedtweettag_timeline"),
+        ),
+        migrations.AddConstraint(
+            model_name="archivedtweettag",
+            constraint=models.UniqueConstraint(fields=("tag", "tweet"), name="OnlyOneArchivedTagPerTweet"),
+        ),
+        migrations.AddIndex(
+            model_name="archivedtweet",
+            index=models.Index(fields=["user", "created_at", "id"], name="archivedtweet_user"),
+        ),
+        migrations.AddIndex(
+            model_name="archivedtweet",
+            index=models.Index(fields=["created_at", "id"], name="archivedtweet_created"),
+        ),
+        migrations.AddConstraint(
+            model_name="archivedlike",
+            constraint=models.UniqueConstraint(fields=("tweet", "user"), name="OnlyOneArchivedLike"),
+        ),
+    ]
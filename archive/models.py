@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.db import models
+from django.db.models import Index, UniqueConstraint
+
+# ArchivedTweet / ArchivedLike / ArchivedTweetTag はアーカイブ用のデータベース（ARCHIVE_DATABASE）に置く。
+# ユーザーは default のデータベースにあるので、ユーザーへの外部キーには DB の制約を付けない。
+
+
+class ArchivedTweet(models.Model):
+    # 元のツイートの ID をそのまま使う（URL やカーソルが変わらないように）
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    content = models.TextField(max_length=200)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    like_count = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    # テンプレートでアーカイブ済み（いいねできない）ツイートを見分ける
+    is_archived = True
+
+    class Meta:
+        indexes = [
+            Index(fields=["user", "created_at", "id"], name="archivedtweet_user"),
+            Index(fields=["created_at", "id"], name="archivedtweet_created"),
+        ]
+
+
+class ArchivedLike(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    tweet = models.ForeignKey(ArchivedTweet, on_delete=models.CASCADE, related_name="likes")
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [UniqueConstraint(fields=["tweet", "user"], name="OnlyOneArchivedLike")]
+
+
+class ArchivedTweetTag(models.Model):
+    tag = models.CharField(max_length=151)
+    tweet = models.ForeignKey(ArchivedTweet, on_delete=models.CASCADE, related_name="tags")
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [UniqueConstraint(fields=["tag", "tweet"], name="OnlyOneArchivedTagPerTweet")]
+        indexes = [Index(fields=["tag", "created_at", "tweet"], name="archivedtweettag_timeline")]
+
+
+class ArchiveRun(models.Model):
+    # default のデータベースに置く。最新の horizon より古いツイートはアーカイブにある可能性がある
+    horizon = models.DateTimeField()
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    tweets = models.PositiveIntegerField(default=0)
+    likes = models.PositiveIntegerField(default=0)
@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+
+from accounts.models import User
+
+from .models import ArchivedTweet, ArchiveRun
+
+HORIZON_KEY = "archive:horizon"
+
+
+def horizon():
+    """アーカイブの境界（これより古いツイートはアーカイブにある可能性がある）。アーカイブしたことがなければ None。"""
+    cached = cache.get(HORIZON_KEY)
+    if cached is None:
+        cached = (ArchiveRun.objects.aggregate(horizon=Max("horizon"))["horizon"],)
+        cache.set(HORIZON_KEY, cached, getattr(settings, "ARCHIVE_HORIZON_CACHE_TIMEOUT", 60))
+    return cached[0]
+
+
+def forget_horizon():
+    cache.delete(HORIZON_KEY)
+
+
+def attach_users(tweets):
+    """アーカイブのツイートに投稿者をまとめて付ける（データベースをまたぐので select_related は使えない）。"""
+    users = User.objects.in_bulk({tweet.user_id for tweet in tweets})
+    for tweet in tweets:
+        if tweet.user_id in users:
+            tweet.user = users[tweet.user_id]
+    return tweets
+
+
+def archived_tweet(pk):
+    if horizon() is None:
+        return None
+    tweet = ArchivedTweet.objects.filter(pk=pk).first()
+    return attach_users([tweet])[0] if tweet is not None else None
+
+
+def read_through(tweets, limit, read_archived):
+    """新しい順に limit + 1 件まで読んだツイートに、足りない分をアーカイブから補う。
+
+    read_archived(count) は同じ条件でアーカイブから新しい順に最大 count 件を
+    （tweets.timeline.archived_items などで投稿者名まで付けて）返す関数。
+    アーカイブにあるのは境界より古いツイートだけなので、ページの下端（limit + 1 件目）が境界より新しければ読まない。
+    ページが埋まらなければ新しい側は読み切っているので、アーカイブも読む。
+    """
+    boundary = horizon()
+    if boundary is None or len(tweets) > limit and tweets[limit].created_at >= boundary:
+        return tweets
+    merged = sorted(tweets + read_archived(limit + 1), key=lambda tweet: (tweet.created_at, tweet.pk), reverse=True)
+    return merged[: limit + 1]
@@ -0,0 +1,29 @@
+from django.conf import settings
+
+ARCHIVED_MODELS = {"archivedtweet", "archivedlike", "archivedtweettag"}
+
+
+def archive_database():
+    return getattr(settings, "ARCHIVE_DATABASE", "archive")
+
+
+class ArchiveRouter:
+    """アーカイブのモデルだけをアーカイブ用のデータベースに振り分ける。"""
+
+    def _is_archived(self, model):
+        return model._meta.app_label == "archive" and model._meta.model_name in ARCHIVED_MODELS
+
+    def db_for_read(self, model, **hints):
+        # アーカイブのツイートから辿るユーザーなども default から読む
+        return archive_database() if self._is_archived(model) else "default"
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if self._is_archived(obj1) or self._is_archived(obj2):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        archived = app_label == "archive" and model_name in ARCHIVED_MODELS
+        return db == archive_database() if archived else db == "default"
@@ -0,0 +1,18 @@
+from django.conf import settings
+
+from taskqueue.queue import enqueue, task
+
+from .archiver import archive_tweets
+from .models import ArchiveRun
+
+
+@task("archive.archive_tweets")
+def archive_tweets_task(run_id, batch=0):
+    # 1 回のタスクでは ARCHIVE_CHUNKS_PER_TASK チャンクまで移し、残りは次のタスクに回す
+    run = ArchiveRun.objects.get(pk=run_id)
+    if not archive_tweets(run, max_chunks=getattr(settings, "ARCHIVE_CHUNKS_PER_TASK", 10)):
+        enqueue(
+            "archive.archive_tweets",
+            {"run_id": run_id, "batch": batch + 1},
+            idempotency_key=f"archive-tweets:{run_id}:{batch + 1}",
+        )
@@ -0,0 +1,138 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.deletion import purge_user
+from accounts.exports import iter_records
+from archive.models import ArchivedLike, ArchivedTweet, ArchivedTweetTag, ArchiveRun
+from archive.reads import horizon
+from taskqueue.queue import run_pending
+from tweets.models import Like, Tweet, TweetTag
+from tweets.tags import index_tweets
+
+User = get_user_model()
+
+
+class ArchiveTestCase(TestCase):
+    databases = {"default", "archive"}
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username="tester", password="testpassword")
+        self.other_user = User.objects.create_user(username="other", password="testpassword")
+        now = timezone.now()
+        for i in range(3):
+            tweet = Tweet.objects.create(user=self.user, content=f"#old {i}")
+            Tweet.objects.filter(pk=tweet.pk).update(created_at=now - timedelta(days=400 + i))
+        for i in range(2):
+            Tweet.objects.create(user=self.user, content=f"#new {i}")
+        self.old_tweets = list(Tweet.objects.filter(content__startswith="#old").order_by("-created_at"))
+        Like.objects.create(user=self.other_user, tweet=self.old_tweets[0])
+        Tweet.objects.filter(pk=self.old_tweets[0].pk).update(like_count=1)
+        index_tweets(Tweet.objects.all())
+
+    def archive(self):
+        call_command("archive_tweets", days=365, stdout=StringIO())
+
+
+class TestArchiveTweets(ArchiveTestCase):
+    def test_success_move_old_rows(self):
+        self.archive()
+        self.assertEqual(Tweet.all_objects.count(), 2)
+        self.assertFalse(Like.objects.exists())
+        self.assertEqual(TweetTag.objects.count(), 2)
+        self.assertEqual(set(ArchivedTweet.objects.values_list("pk", flat=True)), {t.pk for t in self.old_tweets})
+        self.assertEqual(ArchivedLike.objects.get().tweet_id, self.old_tweets[0].pk)
+        self.assertEqual(ArchivedTweetTag.objects.filter(tag="#old").count(), 3)
+        run = ArchiveRun.objects.get()
+        self.assertEqual((run.tweets, run.likes), (3, 1))
+        self.assertIsNotNone(run.finished_at)
+        self.assertEqual(horizon(), run.horizon)
+
+    def test_success_background_batches(self):
+        with self.settings(DELETION_CHUNK_SIZE=1, ARCHIVE_CHUNKS_PER_TASK=1):
+            call_command("archive_tweets", days=365, enqueue=True, stdout=StringIO())
+            for _ in range(4):
+                run_pending()
+        self.assertEqual(ArchivedTweet.objects.count(), 3)
+        self.assertIsNotNone(ArchiveRun.objects.get().finished_at)
+
+
+class TestReadThrough(ArchiveTestCase):
+    def test_success_detail(self):
+        self.archive()
+        response = self.client.get(reverse("tweets:detail", args=[self.old_tweets[0].pk]))
+        self.assertContains(response, "#old 0")
+        self.assertContains(response, "tester")
+        self.assertEqual(self.client.get(reverse("tweets:detail", args=[10**9])).status_code, 404)
+
+    def test_success_profile_pages(self):
+        self.archive()
+        url = reverse("accounts:user_profile", kwargs={"username": "tester"})
+        contents = []
+        with self.settings(PROFILE_PAGE_SIZE=2):
+            response = self.client.get(url)
+            while True:
+                contents += [tweet.content for tweet in response.context["tweets"]]
+                if response.context["next_cursor"] is None:
+                    break
+                response = self.client.get(url, {"before": response.context["next_cursor"]})
+        self.assertEqual(contents, ["#new 1", "#new 0", "#old 0", "#old 1", "#old 2"])
+
+    def test_success_live_rows_older_than_horizon(self):
+        self.archive()
+        # 取り込んだツイートなど、境界より古くても新しいデータベースに残っているものと混ぜて並べる
+        now = timezone.now()
+        for days in (500, 501):
+            tweet = Tweet.objects.create(user=self.user, content=f"#imported {days}")
+            Tweet.objects.filter(pk=tweet.pk).update(created_at=now - timedelta(days=days))
+        url = reverse("accounts:user_profile", kwargs={"username": "tester"})
+        with self.settings(PROFILE_PAGE_SIZE=3):
+            response = self.client.get(url)
+        self.assertEqual([tweet.content for tweet in response.context["tweets"]], ["#new 1", "#new 0", "#old 0"])
+
+    def test_success_home_pages(self):
+        self.archive()
+        self.client.login(username="other", password="testpassword")
+        contents = []
+        with self.settings(HOME_PAGE_SIZE=2):
+            response = self.client.get(reverse("tweets:home"))
+            while True:
+                contents += [tweet.content for tweet in response.context["tweets"]]
+                if response.context["next_cursor"] is None:
+                    break
+                response = self.client.get(reverse("tweets:home"), {"before": response.context["next_cursor"]})
+        self.assertEqual(contents, ["#new 1", "#new 0", "#old 0", "#old 1", "#old 2"])
+
+    def test_success_first_page_skips_archive(self):
+        self.archive()
+        url = reverse("accounts:user_profile", kwargs={"username": "tester"})
+        with self.settings(PROFILE_PAGE_SIZE=1), self.assertNumQueries(0, using="archive"):
+            self.client.get(url)
+
+    def test_success_tag_timeline(self):
+        self.archive()
+        response = self.client.get(reverse("tweets:hashtag", kwargs={"tag": "old"}))
+        self.assertEqual([tweet.content for tweet in response.context["tweets"]], ["#old 0", "#old 1", "#old 2"])
+
+
+class TestArchivedUserData(ArchiveTestCase):
+    def test_success_export_and_purge(self):
+        self.archive()
+        records = list(iter_records(self.user))
+        self.assertEqual(len([record for record in records if record["type"] == "tweet"]), 5)
+        self.assertEqual(
+            len([record for record in list(iter_records(self.other_user)) if record["type"] == "like"]), 1
+        )
+
+        purge_user(self.other_user.pk)
+        self.assertFalse(ArchivedLike.objects.exists())
+        purge_user(self.user.pk)
+        self.assertFalse(ArchivedTweet.objects.exists())
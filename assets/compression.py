@@ -0,0 +1,147 @@
+import re
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "image/svg+xml")
+accept_encoding_re = re.compile(r"\s*([^\s;,]+)\s*(?:;\s*q=([0-9.]+))?")
+
+
+class GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level):
+        # wbits=31 で gzip ヘッダ付きのストリームになる
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliEncoder:
+    name = "br"
+
+    def __init__(self, quality):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+def available_encodings():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encoding):
+    """Accept-Encoding から使えるエンコーディングを選ぶ。brotli があれば優先する。"""
+    accepted = {}
+    for match in accept_encoding_re.finditer(accept_encoding):
+        try:
+            accepted[match[1].lower()] = float(match[2]) if match[2] else 1.0
+        except ValueError:
+            continue
+    for name in available_encodings():
+        if accepted.get(name, 0) > 0:
+            return name
+    return None
+
+
+def encoder_for(name):
+    if name == "br":
+        return BrotliEncoder(getattr(settings, "COMPRESSION_BROTLI_QUALITY", 5))
+    return GzipEncoder(getattr(settings, "COMPRESSION_GZIP_LEVEL", 6))
+
+
+def compress_bytes(name, data):
+    encoder = encoder_for(name)
+    return encoder.compress(data) + encoder.finish()
+
+
+def compress_stream(name, iterator):
+    # チャンクごとに flush して、ストリーミングのレスポンスを溜め込まずに送る
+    encoder = encoder_for(name)
+    for chunk in iterator:
+        data = encoder.compress(chunk) + encoder.flush()
+        if data:
+            yield data
+    yield encoder.finish()
+
+
+def is_compressible(response):
+    content_type = response.get("Content-Type", "").split(";")[0].strip().lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def uses_csrf_token(request, response):
+    """レスポンスに CSRF トークンを埋め込んだか。
+
+    get_token() を呼ぶと CsrfViewMiddleware がレスポンスに CSRF の Cookie を付け直すので、それで判断する。
+    CSRF_USE_SESSIONS の場合は判断できないので、Cookie を付けたかどうかによらず埋め込んだものとみなす。
+    """
+    if settings.CSRF_USE_SESSIONS:
+        return True
+    return settings.CSRF_COOKIE_NAME in response.cookies
+
+
+class CompressionMiddleware:
+    """レスポンスを gzip（brotli があれば brotli）で圧縮する。
+
+    COMPRESSION_MIN_SIZE バイト未満のレスポンスはそのまま返す。ストリーミングのレスポンスはチャンクごとに圧縮する。
+    CSRF トークンを埋め込んだレスポンスは、入力を反映した部分と一緒に圧縮すると圧縮後の長さからトークンを
+    推測される（BREACH）ので圧縮しない。
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "COMPRESSION_ENABLED", True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.min_size = getattr(settings, "COMPRESSION_MIN_SIZE", 200)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.has_header("Content-Encoding") or not is_compressible(response):
+            return response
+        if uses_csrf_token(request, response):
+            return response
+        patch_vary_headers(response, ["Accept-Encoding"])
+        encoding = negotiate(request.headers.get("Accept-Encoding", ""))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_stream(encoding, response.streaming_content)
+            del response["Content-Length"]
+        else:
+            if len(response.content) < self.min_size:
+                return response
+            compressed = compress_bytes(encoding, response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response["Content-Length"] = str(len(compressed))
+
+        # 圧縮後の内容はバイト単位では別物になるので、強い ETag は弱い ETag にする
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        response["Content-Encoding"] = encoding
+        return response
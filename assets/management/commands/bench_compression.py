@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.test import RequestFactory, override_settings
+
+from assets.compression import available_encodings, compress_bytes
+from loadtest.runner import cpu_ms
+from tweets.models import Tweet
+from tweets.timeline import timeline_items
+
+User = get_user_model()
+
+
+def minified_templates():
+    templates = [dict(settings.TEMPLATES[0], APP_DIRS=False)]
+    templates[0]["OPTIONS"] = dict(
+        templates[0]["OPTIONS"],
+        loaders=[
+            (
+                "assets.loaders.Loader",
+                ["django.template.loaders.filesystem.Loader", "django.template.loaders.app_directories.Loader"],
+            )
+        ],
+    )
+    return templates
+
+
+class Command(BaseCommand):
+    help = "ツイート N 件のホーム画面について、圧縮方式・空白の圧縮ごとの転送バイト数と 1 レスポンスあたりの CPU 時間を測ります。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tweets", type=int, default=50)
+        parser.add_argument("--iterations", type=int, default=200)
+
+    def handle(self, *args, **options):
+        iterations = options["iterations"]
+        # 計測用のデータは最後にロールバックする
+        with transaction.atomic():
+            user = User.objects.create_user(username="bench_compression_user")
+            Tweet.objects.bulk_create(
+                [Tweet(user=user, content=f"compression benchmark tweet {i} " * 3) for i in range(options["tweets"])]
+            )
+            tweets = timeline_items(Tweet.objects.filter(user=user).order_by("-created_at"))
+            request = RequestFactory().get("/tweets/home/")
+            request.user = user
+
+            def render():
+                return render_to_string("tweets/home.html", {"tweets": tweets}, request).encode()
+
+            def measure(label):
+                return label, render(), cpu_ms(render, iterations)
+
+            pages = [measure("default")]
+            with override_settings(TEMPLATES=minified_templates()):
+                pages.append(measure("minified"))
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            f"{'template':<10} {'encoding':<9} {'bytes':>8} {'ratio':>7} {'render ms':>10} {'compress ms':>12}"
+        )
+        for label, body, render_ms in pages:
+            self.stdout.write(f"{label:<10} {'identity':<9} {len(body):>8} {1:>7.2f} {render_ms:>10.3f} {0:>12.3f}")
+            for encoding in available_encodings():
+                compressed = compress_bytes(encoding, body)
+                compress_ms = cpu_ms(lambda: compress_bytes(encoding, body), iterations)
+                self.stdout.write(
+                    f"{label:<10} {encoding:<9} {len(compressed):>8} {len(compressed) / len(body):>7.2f} "
+                    f"{render_ms:>10.3f} {compress_ms:>12.3f}"
+                )
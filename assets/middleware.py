@@ -0,0 +1,103 @@
+import mimetypes
+import os
+from email.utils import formatdate
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponse, HttpResponseNotAllowed
+from django.utils.cache import patch_vary_headers
+
+from .storage import CompressedManifestStaticFilesStorage
+
+# ハッシュ付きのファイル名は内容が変われば名前も変わるので、1 年間キャッシュさせてよい
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+class StaticFile:
+    def __init__(self, path, immutable):
+        self.path = path
+        stat = os.stat(path)
+        self.size = stat.st_size
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        content_type, _ = mimetypes.guess_type(path)
+        self.content_type = content_type or "application/octet-stream"
+        self.immutable = immutable
+        # {Content-Encoding: (パス, サイズ)}
+        self.variants = {
+            encoding: (path + suffix, os.path.getsize(path + suffix))
+            for encoding, suffix in ENCODINGS
+            if os.path.exists(path + suffix)
+        }
+
+    def choose(self, accept_encoding):
+        accepted = {item.split(";")[0].strip() for item in accept_encoding.split(",")}
+        for encoding, _ in ENCODINGS:
+            if encoding in accepted and encoding in self.variants:
+                return (encoding, *self.variants[encoding])
+        return None, self.path, self.size
+
+
+def scan(root, prefix):
+    """STATIC_ROOT 以下のファイルを {URL のパス: StaticFile} にする。"""
+    manifest = os.path.join(root, CompressedManifestStaticFilesStorage.manifest_name)
+    hashed = set()
+    if os.path.exists(manifest):
+        hashed = set(CompressedManifestStaticFilesStorage(location=root).load_manifest().values())
+    files = {}
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith((".gz", ".br")):
+                continue
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, root).replace(os.sep, "/")
+            files[prefix + name] = StaticFile(path, name in hashed)
+    return files
+
+
+class StaticFilesMiddleware:
+    """collectstatic 済みの STATIC_ROOT をプロセス内で配信する。
+
+    起動時にファイル一覧を読み込んでおき、Accept-Encoding に応じて事前に圧縮した .br / .gz を返す。
+    ハッシュ付きのファイルには長期間の Cache-Control を付ける。
+    """
+
+    def __init__(self, get_response):
+        root = settings.STATIC_ROOT
+        if not getattr(settings, "STATIC_SERVE", True) or not root or not os.path.isdir(root):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = "/" + settings.STATIC_URL.lstrip("/")
+        self.max_age = getattr(settings, "STATIC_MAX_AGE", 60)
+        self.files = scan(root, self.prefix)
+
+    def __call__(self, request):
+        if not request.path_info.startswith(self.prefix):
+            return self.get_response(request)
+        static_file = self.files.get(request.path_info)
+        if static_file is None:
+            return self.get_response(request)
+        if request.method not in ("GET", "HEAD"):
+            return HttpResponseNotAllowed(["GET", "HEAD"])
+        return self.serve(request, static_file)
+
+    def serve(self, request, static_file):
+        encoding, path, size = static_file.choose(request.headers.get("Accept-Encoding", ""))
+        if request.headers.get("If-Modified-Since") == static_file.last_modified:
+            response = HttpResponse(status=304)
+        elif request.method == "HEAD":
+            response = HttpResponse(content_type=static_file.content_type)
+            response["Content-Length"] = size
+        else:
+            response = FileResponse(open(path, "rb"), content_type=static_file.content_type)
+            response["Content-Length"] = size
+        if encoding:
+            response["Content-Encoding"] = encoding
+        if static_file.variants:
+            patch_vary_headers(response, ["Accept-Encoding"])
+        response["Last-Modified"] = static_file.last_modified
+        if static_file.immutable:
+            response["Cache-Control"] = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+        else:
+            response["Cache-Control"] = f"public, max-age={self.max_age}"
+        return response
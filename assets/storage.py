@@ -0,0 +1,50 @@
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".json", ".map", ".svg", ".txt", ".html", ".xml"}
+# 圧縮してもこの割合より小さくならないファイルは圧縮版を置かない
+MIN_RATIO = 0.95
+
+
+def compress(path):
+    """path の隣に .gz（brotli があれば .br も）を書き出し、書き出したファイルのパスを返す。"""
+    with open(path, "rb") as f:
+        data = f.read()
+    encoders = [(".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        encoders.append((".br", lambda data: brotli.compress(data, quality=11)))
+    written = []
+    for suffix, encode in encoders:
+        compressed = encode(data)
+        if len(compressed) >= len(data) * MIN_RATIO:
+            continue
+        with open(path + suffix, "wb") as f:
+            f.write(compressed)
+        written.append(path + suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ファイル名に内容のハッシュを付け、collectstatic の時点で gzip / brotli 版も作っておく。"""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if os.path.splitext(name)[1] in COMPRESSIBLE_EXTENSIONS and self.exists(name):
+                compress(self.path(name))
+
+    def stored_name(self, name):
+        # collectstatic 前（開発中やテスト）はマニフェストがないので元のファイル名をそのまま使う
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
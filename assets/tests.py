@@ -0,0 +1,125 @@
+import gzip
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from assets.compression import CompressionMiddleware, compress_stream
+from assets.loaders import minify
+
+User = get_user_model()
+
+
+class TestStaticAssetPipeline(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.settings_override = override_settings(STATIC_ROOT=tmp.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        call_command("collectstatic", interactive=False, verbosity=0)
+        self.url = staticfiles_storage.url("tweets/like_unlike.js")
+
+    def test_hashed_and_precompressed(self):
+        self.assertRegex(self.url, r"^/static/tweets/like_unlike\.[0-9a-f]{12}\.js$")
+        path = staticfiles_storage.path(self.url[len("/static/") :])
+        with open(path, "rb") as f, gzip.open(path + ".gz") as compressed:
+            self.assertEqual(f.read(), compressed.read())
+
+    def test_serve_compressed_with_far_future_headers(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertIn("Accept-Encoding", response["Vary"])
+        body = gzip.decompress(b"".join(response.streaming_content))
+        self.assertIn(b"like-button", body)
+
+    def test_serve_identity_for_unhashed_name(self):
+        response = self.client.get("/static/tweets/like_unlike.js")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Content-Encoding", response)
+        self.assertEqual(response["Cache-Control"], f"public, max-age={settings.STATIC_MAX_AGE}")
+
+    def test_page_references_hashed_script(self):
+        User.objects.create_user(username="tester", password="testpassword")
+        self.client.login(username="tester", password="testpassword")
+        response = self.client.get(reverse("tweets:home"))
+        self.assertContains(response, f'<script src="{self.url}" defer></script>')
+        self.assertNotContains(response, "addEventListener")
+
+
+class TestCompressionMiddleware(TestCase):
+    def get(self, response, accept_encoding="gzip"):
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_compress_large_html(self):
+        body = b"<p>tweet</p>" * 100
+        response = self.get(HttpResponse(body))
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        self.assertEqual(int(response["Content-Length"]), len(response.content))
+        self.assertEqual(gzip.decompress(response.content), body)
+
+    def test_weaken_etag(self):
+        response = HttpResponse(b"<p>tweet</p>" * 100)
+        response["ETag"] = '"abc"'
+        self.assertEqual(self.get(response)["ETag"], 'W/"abc"')
+
+    def test_skip_small_or_unaccepted(self):
+        self.assertNotIn("Content-Encoding", self.get(HttpResponse(b"<p>tweet</p>")))
+        self.assertNotIn("Content-Encoding", self.get(HttpResponse(b"<p>tweet</p>" * 100), "identity, gzip;q=0"))
+        response = HttpResponse(b"\0" * 1000, content_type="application/octet-stream")
+        self.assertNotIn("Content-Encoding", self.get(response))
+
+    def test_skip_response_with_csrf_token(self):
+        response = HttpResponse(b"<p>tweet</p>" * 100)
+        response.set_cookie(settings.CSRF_COOKIE_NAME, "token")
+        self.assertNotIn("Content-Encoding", self.get(response))
+
+    def test_skip_page_with_csrf_token(self):
+        User.objects.create_user(username="tester", password="testpassword")
+        self.client.login(username="tester", password="testpassword")
+        response = self.client.get(reverse("tweets:create"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertContains(response, "csrfmiddlewaretoken")
+        self.assertNotIn("Content-Encoding", response)
+
+    def test_compress_streaming(self):
+        chunks = [b"<p>tweet %d</p>" % i for i in range(100)]
+        response = self.get(StreamingHttpResponse(iter(chunks)))
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), b"".join(chunks))
+
+    def test_compress_stream_flushes_each_chunk(self):
+        compressed = list(compress_stream("gzip", iter([b"first", b"second"])))
+        self.assertTrue(all(compressed[:2]))
+
+    def test_home_page(self):
+        User.objects.create_user(username="tester", password="testpassword")
+        self.client.login(username="tester", password="testpassword")
+        response = self.client.get(reverse("tweets:home"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("こんにちは".encode(), gzip.decompress(response.content))
+
+
+class TestMinifyingLoader(TestCase):
+    def test_collapse_whitespace(self):
+        source = "<ul>\n    <li>a</li>\n\n    <li>b</li>  \n</ul>"
+        self.assertEqual(minify(source), "<ul>\n<li>a</li>\n<li>b</li>\n</ul>")
+
+    def test_keep_preformatted(self):
+        source = "<div>\n  <pre>\n  x\n</pre>\n  <script>\n  let a = `\n  b`\n</script>\n</div>"
+        self.assertEqual(minify(source), "<div>\n<pre>\n  x\n</pre>\n<script>\n  let a = `\n  b`\n</script>\n</div>")
+
+    def test_bench_compression_command(self):
+        out = StringIO()
+        call_command("bench_compression", tweets=5, iterations=1, stdout=out)
+        self.assertIn("minified", out.getvalue())
+        self.assertFalse(User.objects.exists())
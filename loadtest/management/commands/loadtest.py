@@ -0,0 +1,135 @@
+import asyncio
+import json
+import logging
+import subprocess
+import time
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+
+from loadtest.runner import (
+    DEFAULT_MIX,
+    OPERATIONS,
+    AsgiTransport,
+    HttpTransport,
+    PreforkProcess,
+    VirtualUser,
+    Workload,
+    WsgiServer,
+    parse_mix,
+    run_clients,
+    seed,
+    summarize,
+)
+from tweets.models import Tweet
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = "アプリをプロセス内で起動し、asyncio のクライアントで混合ワークロードをかけて結果を報告します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--server",
+            choices=["wsgi", "prefork", "asgi"],
+            default="wsgi",
+            help="wsgi は runserver と同じ 1 プロセスのスレッド方式、prefork は manage.py serve と同じプリフォーク方式",
+        )
+        parser.add_argument("--workers", type=int, help="prefork のワーカー数（既定は manage.py serve と同じ）")
+        parser.add_argument("--concurrency", type=int, default=20)
+        parser.add_argument("--duration", type=float, default=10.0, help="秒数")
+        parser.add_argument("--mix", default=DEFAULT_MIX, help=f"操作ごとの重み（{', '.join(OPERATIONS)}）")
+        parser.add_argument("--users", type=int, default=50, help="使うユーザー数（足りなければ作成する）")
+        parser.add_argument("--no-ratelimit", action="store_true", help="レート制限を無効にする")
+        parser.add_argument("--output", "-o", help="結果を書き出す JSON ファイル")
+        parser.add_argument("--compare", help="比較する以前の結果の JSON ファイル")
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options["mix"])
+        except ValueError as e:
+            raise CommandError(e)
+        if options["no_ratelimit"]:
+            settings.RATELIMIT_ENABLED = False
+
+        users = seed(options["users"])
+        virtual_users = [VirtualUser(user) for user in users]
+        usernames = [user.username for user in users]
+        tweet_ids = list(Tweet.objects.values_list("pk", flat=True)[:10000])
+        workload = Workload(virtual_users, usernames, tweet_ids, mix)
+
+        self.stdout.write(
+            f"{options['server']} / 同時接続 {options['concurrency']} / {options['duration']} 秒 / {options['mix']}"
+        )
+        app = get_asgi_application() if options["server"] == "asgi" else get_wsgi_application()
+        # エラーは結果として集計するので、リクエストごとのログは出さない
+        logging.getLogger("django.request").setLevel(logging.CRITICAL)
+
+        started = time.monotonic()
+        if options["server"] == "asgi":
+            transport = AsgiTransport(app)
+            results = asyncio.run(run_clients(transport, workload, options["concurrency"], options["duration"]))
+        else:
+            if options["server"] == "prefork":
+                try:
+                    server = PreforkProcess(app, options["workers"])
+                except ImproperlyConfigured as e:
+                    raise CommandError(e)
+                for warning in server.warnings:
+                    self.stderr.write(warning)
+            else:
+                server = WsgiServer(app)
+            with server:
+                transport = HttpTransport("127.0.0.1", server.port)
+                results = asyncio.run(run_clients(transport, workload, options["concurrency"], options["duration"]))
+        summary = summarize(results, time.monotonic() - started)
+
+        report = {
+            "revision": git_revision(),
+            "server": options["server"],
+            "workers": server.workers if options["server"] == "prefork" else 1,
+            "concurrency": options["concurrency"],
+            "duration": options["duration"],
+            "mix": mix,
+            "results": summary,
+        }
+        self.print_summary(summary)
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                self.print_comparison(json.load(f), report)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+
+    def print_summary(self, summary):
+        self.stdout.write(f"{'op':<8} {'req':>7} {'req/s':>8} {'p50':>8} {'p90':>8} {'p99':>8} {'err%':>6}")
+        for op, row in sorted(summary.items(), key=lambda item: item[0] == "total"):
+            self.stdout.write(
+                f"{op:<8} {row['requests']:>7} {row['throughput']:>8.1f} {row['p50_ms']:>7.1f}ms "
+                f"{row['p90_ms']:>7.1f}ms {row['p99_ms']:>7.1f}ms {row['error_rate'] * 100:>5.1f}%"
+            )
+            for error, count in row["errors"].items():
+                self.stdout.write(f"    {error}: {count}")
+
+    def print_comparison(self, before, after):
+        self.stdout.write(f"{before.get('revision')} → {after.get('revision')}")
+        for op, row in after["results"].items():
+            old = before["results"].get(op)
+            if old is None:
+                continue
+            self.stdout.write(
+                f"{op:<8} req/s {old['throughput']:.1f} → {row['throughput']:.1f}, "
+                f"p99 {old['p99_ms']:.1f}ms → {row['p99_ms']:.1f}ms, "
+                f"err% {old['error_rate'] * 100:.1f} → {row['error_rate'] * 100:.1f}"
+            )
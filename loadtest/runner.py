@@ -0,0 +1,307 @@
+import asyncio
+import math
+import os
+import random
+import secrets
+import signal
+import socket
+import threading
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connections
+from django.test import Client
+
+from accounts.models import FriendShip, User
+from startup.prefork import PreforkServer, check_shared_state, choose_workers
+from tweets.models import Tweet
+
+OPERATIONS = ("home", "profile", "like", "create", "follow")
+DEFAULT_MIX = "home=50,profile=20,like=20,create=5,follow=5"
+# 操作ごとに正常とみなすステータスコード
+EXPECTED_STATUS = {
+    "home": {200},
+    "profile": {200},
+    "like": {200},
+    "create": {302},
+    "follow": {302, 400},
+}
+USERNAME_PREFIX = "loadtest_user_"
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(","):
+        op, _, weight = item.partition("=")
+        op = op.strip()
+        if op not in OPERATIONS:
+            raise ValueError(f"不明な操作です: {op}")
+        mix[op] = int(weight)
+    return mix
+
+
+def seed(users=50, tweets_per_user=20, follows_per_user=10):
+    """負荷試験用のユーザー・ツイート・フォロー関係を作る。既にあれば作った分だけ使い回す。"""
+    existing = User.objects.filter(username__startswith=USERNAME_PREFIX).count()
+    if existing < users:
+        password = make_password("loadtest-password")
+        new_users = User.objects.bulk_create(
+            [User(username=f"{USERNAME_PREFIX}{i}", password=password) for i in range(existing, users)]
+        )
+        Tweet.objects.bulk_create(
+            [Tweet(user=user, content=f"seed tweet {i}") for user in new_users for i in range(tweets_per_user)]
+        )
+        user_ids = list(User.objects.filter(username__startswith=USERNAME_PREFIX).values_list("pk", flat=True))
+        FriendShip.objects.bulk_create(
+            [
+                FriendShip(following=user, followed_id=followed_id)
+                for user in new_users
+                for followed_id in random.sample(user_ids, min(follows_per_user, len(user_ids)))
+                if followed_id != user.pk
+            ],
+            ignore_conflicts=True,
+        )
+    return list(User.objects.filter(username__startswith=USERNAME_PREFIX).order_by("pk")[:users])
+
+
+class VirtualUser:
+    def __init__(self, user):
+        client = Client()
+        client.force_login(user)
+        self.username = user.username
+        self.csrf_token = secrets.token_hex(16)
+        self.cookie = (
+            f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}; "
+            f"{settings.CSRF_COOKIE_NAME}={self.csrf_token}"
+        )
+
+
+class Workload:
+    def __init__(self, virtual_users, usernames, tweet_ids, mix, rng=None):
+        self.virtual_users = virtual_users
+        self.usernames = usernames
+        self.tweet_ids = tweet_ids
+        self.ops = list(mix)
+        self.weights = [mix[op] for op in self.ops]
+        self.rng = rng or random.Random()
+
+    def next_request(self, virtual_user):
+        """(操作名, メソッド, パス, ボディ) を返す。"""
+        op = self.rng.choices(self.ops, self.weights)[0]
+        if op == "home":
+            return op, "GET", "/tweets/home/", b""
+        if op == "profile":
+            return op, "GET", f"/accounts/{self.rng.choice(self.usernames)}/", b""
+        if op == "like":
+            action = self.rng.choice(["like", "unlike"])
+            return op, "POST", f"/tweets/{self.rng.choice(self.tweet_ids)}/{action}/", b""
+        if op == "create":
+            body = urlencode({"content": f"load test {self.rng.random()}"}).encode()
+            return op, "POST", "/tweets/create/", body
+        return op, "POST", f"/accounts/{self.rng.choice(self.usernames)}/follow/", b""
+
+
+class HttpTransport:
+    """asyncio のストリームで HTTP/1.0 のリクエストを送る最小限のクライアント。"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+    async def send(self, method, path, headers, body):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f"{method} {path} HTTP/1.0", f"Host: {self.host}", f"Content-Length: {len(body)}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+        data = await reader.read()
+        writer.close()
+        await writer.wait_closed()
+        head, _, payload = data.partition(b"\r\n\r\n")
+        return int(head.split(b" ", 2)[1]), payload
+
+
+class AsgiTransport:
+    """ASGI アプリケーションをネットワークを介さずに直接呼び出す。"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def send(self, method, path, headers, body):
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+            + [(b"host", b"127.0.0.1"), (b"content-length", str(len(body)).encode())],
+            "client": ("127.0.0.1", 0),
+            "server": ("127.0.0.1", 80),
+        }
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+        status = None
+        chunks = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await asyncio.Event().wait()
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, send)
+        return status, b"".join(chunks)
+
+
+def classify_error(op, status, body):
+    if status in EXPECTED_STATUS[op]:
+        return None
+    if status == 429:
+        return "rate limited"
+    if b"database is locked" in body:
+        return "database is locked"
+    return f"HTTP {status}"
+
+
+async def run_client(transport, workload, virtual_user, deadline, results):
+    while time.monotonic() < deadline:
+        op, method, path, body = workload.next_request(virtual_user)
+        headers = {"Cookie": virtual_user.cookie, "X-CSRFToken": virtual_user.csrf_token}
+        if body:
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        started = time.perf_counter()
+        try:
+            status, payload = await transport.send(method, path, headers, body)
+            error = classify_error(op, status, payload)
+        except Exception as e:
+            error = type(e).__name__
+        results.append((op, time.perf_counter() - started, error))
+
+
+async def run_clients(transport, workload, concurrency, duration):
+    results = []
+    deadline = time.monotonic() + duration
+    await asyncio.gather(
+        *(
+            run_client(transport, workload, workload.virtual_users[i % len(workload.virtual_users)], deadline, results)
+            for i in range(concurrency)
+        )
+    )
+    return results
+
+
+class WsgiServer:
+    """負荷試験の間だけ別スレッドでマルチスレッドの WSGI サーバーを立てる。"""
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    def __init__(self, app):
+        self.server = ThreadedWSGIServer(("127.0.0.1", 0), self.QuietHandler)
+        self.server.daemon_threads = True
+        self.server.set_app(app)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class PreforkProcess:
+    """負荷試験の間だけ子プロセスでプリフォークの WSGI サーバー（manage.py serve と同じもの）を立てる。"""
+
+    def __init__(self, app, workers=None):
+        self.app = app
+        # manage.py serve と同じく、キャッシュがプロセスごとならワーカーを 1 個にし、複数なら共有できるか確かめる
+        self.workers = choose_workers(workers)
+        self.warnings = check_shared_state(self.workers)
+        self.sock = socket.create_server(("127.0.0.1", 0))
+        self.pid = None
+
+    @property
+    def port(self):
+        return self.sock.getsockname()[1]
+
+    def __enter__(self):
+        # 開いている接続を子プロセスに持ち越さない
+        connections.close_all()
+        self.pid = os.fork()
+        if self.pid == 0:
+            code = 0
+            try:
+                PreforkServer(
+                    lambda: self.app, self.sock, workers=self.workers, handler_class=WsgiServer.QuietHandler
+                ).run()
+            except BaseException:
+                code = 1
+            finally:
+                os._exit(code)
+        return self
+
+    def __exit__(self, *exc_info):
+        os.kill(self.pid, signal.SIGTERM)
+        os.waitpid(self.pid, 0)
+        self.sock.close()
+
+
+def cpu_ms(func, iterations):
+    """func() を iterations 回呼び、1 回あたりの CPU 時間（ミリ秒）を返す。ベンチマークのコマンドで使う。"""
+    started = time.process_time()
+    for _ in range(iterations):
+        func()
+    return (time.process_time() - started) / iterations * 1000
+
+
+def percentile(sorted_values, p):
+    """nearest-rank 法のパーセンタイル。"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def summarize(results, elapsed):
+    by_op = defaultdict(list)
+    errors = defaultdict(Counter)
+    for op, latency, error in results:
+        by_op[op].append(latency)
+        by_op["total"].append(latency)
+        if error:
+            errors[op][error] += 1
+            errors["total"][error] += 1
+    summary = {}
+    for op, latencies in by_op.items():
+        latencies.sort()
+        error_count = sum(errors[op].values())
+        summary[op] = {
+            "requests": len(latencies),
+            "throughput": len(latencies) / elapsed if elapsed else 0.0,
+            "error_rate": error_count / len(latencies),
+            "errors": dict(errors[op]),
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p90_ms": percentile(latencies, 90) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "max_ms": latencies[-1] * 1000,
+        }
+    return summary
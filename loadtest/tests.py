@@ -0,0 +1,50 @@
+import random
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase
+
+from loadtest.runner import PreforkProcess, Workload, classify_error, cpu_ms, parse_mix, percentile, summarize
+
+
+class TestRunner(SimpleTestCase):
+    def test_success_parse_mix(self):
+        self.assertEqual(parse_mix("home=3,like=1"), {"home": 3, "like": 1})
+
+    def test_failure_parse_mix_with_unknown_operation(self):
+        with self.assertRaises(ValueError):
+            parse_mix("home=3,search=1")
+
+    def test_success_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([], 99), 0.0)
+
+    def test_success_classify_error(self):
+        self.assertIsNone(classify_error("follow", 400, b""))
+        self.assertEqual(classify_error("like", 429, b""), "rate limited")
+        self.assertEqual(classify_error("like", 500, b"OperationalError: database is locked"), "database is locked")
+        self.assertEqual(classify_error("home", 502, b""), "HTTP 502")
+
+    def test_success_summarize(self):
+        results = [("home", 0.01, None), ("home", 0.03, None), ("like", 0.02, "database is locked")]
+        summary = summarize(results, elapsed=1.0)
+        self.assertEqual(summary["total"]["requests"], 3)
+        self.assertEqual(summary["home"]["p50_ms"], 10.0)
+        self.assertEqual(summary["like"]["errors"], {"database is locked": 1})
+        self.assertAlmostEqual(summary["total"]["error_rate"], 1 / 3)
+
+    def test_success_workload(self):
+        workload = Workload([None], ["user"], [1], {"like": 1}, rng=random.Random(0))
+        op, method, path, _ = workload.next_request(None)
+        self.assertEqual((op, method), ("like", "POST"))
+        self.assertRegex(path, r"^/tweets/1/(un)?like/$")
+
+    def test_failure_prefork_workers_with_local_cache(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, "LocMemCache"):
+            PreforkProcess(None, 2)
+
+    def test_success_cpu_ms(self):
+        calls = []
+        self.assertGreaterEqual(cpu_ms(lambda: calls.append(1), 3), 0)
+        self.assertEqual(len(calls), 3)
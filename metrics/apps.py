@@ -0,0 +1,18 @@
+import atexit
+
+from django.apps import AppConfig
+from django.conf import settings
+
+
+class MetricsConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "metrics"
+
+    def ready(self):
+        from .registry import REGISTRY
+
+        REGISTRY.configure(
+            getattr(settings, "METRICS_MULTIPROCESS_DIR", None), getattr(settings, "METRICS_FLUSH_INTERVAL", 1.0)
+        )
+        REGISTRY.start()
+        atexit.register(REGISTRY.flush)
@@ -0,0 +1,37 @@
+from .registry import Counter, Histogram
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "ビューごとのリクエスト処理時間", ["view", "method"])
+REQUESTS = Counter("http_requests_total", "ビューとステータスごとのリクエスト数", ["view", "method", "status"])
+DB_QUERIES = Counter("db_queries_total", "ビューごとの DB クエリ数", ["view"])
+DB_QUERY_SECONDS = Counter("db_query_duration_seconds_total", "ビューごとの DB クエリ時間の合計", ["view"])
+CACHE_REQUESTS = Counter("cache_requests_total", "キャッシュの参照数（result は hit か miss）", ["cache", "result"])
+WRITES = Counter("writes_total", "種類ごとの書き込み数（tweet, like, unlike, follow, unfollow）", ["kind"])
+HOME_SNAPSHOT_AGE = Histogram(
+    "home_snapshot_age_seconds", "ホームのスナップショットを返したときの作ってからの経過時間"
+)
+HOME_SNAPSHOT_LAG = Histogram(
+    "home_snapshot_lag_seconds", "新しいツイートが作られてからホームのスナップショットに入るまでの時間"
+)
+PIPELINE_STAGE_SECONDS = Histogram(
+    "tweet_pipeline_stage_duration_seconds", "ツイート作成後のステージごとの処理時間", ["stage", "mode"]
+)
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def record_write(kind):
+    WRITES.inc(kind=kind)
+
+
+def record_snapshot_age(seconds):
+    HOME_SNAPSHOT_AGE.observe(seconds)
+
+
+def record_snapshot_lag(seconds):
+    HOME_SNAPSHOT_LAG.observe(seconds)
+
+
+def record_pipeline_stage(stage, mode, seconds):
+    PIPELINE_STAGE_SECONDS.observe(seconds, stage=stage, mode=mode)
@@ -0,0 +1,45 @@
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+from .collectors import DB_QUERIES, DB_QUERY_SECONDS, REQUEST_LATENCY, REQUESTS
+from .registry import REGISTRY
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryCounter()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            # いいねのシャードやアーカイブへのクエリも数える
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(queries))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.view_name if match is not None and match.view_name else "unknown"
+        REQUEST_LATENCY.observe(elapsed, view=view, method=request.method)
+        REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+        DB_QUERIES.inc(queries.count, view=view)
+        DB_QUERY_SECONDS.inc(queries.seconds, view=view)
+        REGISTRY.maybe_flush()
+        return response
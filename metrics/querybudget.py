@@ -0,0 +1,116 @@
+import difflib
+import re
+from collections import Counter
+from contextlib import ContextDecorator
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+# テストでクエリ数の上限（予算）を確かめる。ビューごとの予算は各ビューの query_budget 属性に書く。
+# 予算を超えたときは、同じ形のクエリをまとめて数えた一覧か、予算内だった実行との差分を出す。
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"IN \(\?(?:, \?)*\)")
+_SPACES = re.compile(r"\s+")
+_SAVEPOINT = re.compile(r"^(?:SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT) ")
+
+
+def normalize_sql(sql):
+    """値を ? に置き換え、IN のリストの長さをそろえる。行数によって変わらない形にする。"""
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _IN_LIST.sub("IN (...)", sql)
+    return _SPACES.sub(" ", sql).strip()
+
+
+def normalized_queries(captured):
+    return [normalize_sql(query["sql"]) for query in captured if not _SAVEPOINT.match(query["sql"])]
+
+
+def summarize(queries):
+    """同じ形のクエリを回数の多い順に並べる（N+1 は回数の多い行として目立つ）。"""
+    return "\n".join(f"{count:>4} × {sql}" for sql, count in Counter(queries).most_common())
+
+
+def diff(expected, actual, expected_label="expected", actual_label="actual"):
+    return "\n".join(difflib.unified_diff(expected, actual, expected_label, actual_label, lineterm=""))
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryBudget(ContextDecorator):
+    """ブロック（またはデコレートした関数）の中のクエリ数が budget 以下であることを確かめる。
+
+    baseline に正規化したクエリのリストを渡すと、超えたときに baseline との差分を出す。
+    SAVEPOINT は数えない。
+    """
+
+    def __init__(self, budget, using="default", baseline=None):
+        self.budget = budget
+        self.using = using
+        self.baseline = baseline
+        self.queries = []
+
+    def __enter__(self):
+        self.context = CaptureQueriesContext(connections[self.using])
+        self.context.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.context.__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return False
+        self.queries = normalized_queries(self.context.captured_queries)
+        if len(self.queries) > self.budget:
+            raise QueryBudgetExceeded(self.report())
+        return False
+
+    def report(self):
+        lines = [f"クエリ数が予算を超えました: {len(self.queries)} > {self.budget}"]
+        if self.baseline is not None:
+            lines.append(diff(self.baseline, self.queries, "予算内の実行", "今回の実行"))
+        else:
+            lines.append(summarize(self.queries))
+        return "\n".join(lines)
+
+
+def view_budget(path):
+    """path を処理するビューの query_budget 属性。宣言がなければ None。"""
+    func = resolve(path).func
+    return getattr(getattr(func, "view_class", func), "query_budget", None)
+
+
+class QueryBudgetTestMixin:
+    """TestCase で使う。ビューの予算と、行を増やしてもクエリ数が変わらないことを確かめる。"""
+
+    def assertWithinViewBudget(self, path, request=None):
+        """path へのリクエストがビューの query_budget に収まることを確かめ、レスポンスを返す。"""
+        budget = view_budget(path)
+        self.assertIsNotNone(budget, f"{path} のビューに query_budget がありません。")
+        with QueryBudget(budget):
+            return request() if request is not None else self.client.get(path)
+
+    def assertConstantQueries(self, request, grow, sizes=(10, 1000)):
+        """grow(n) で行を n 件まで増やしながら request() を呼び、クエリ数が増えないことを確かめる。
+
+        最後のページでだけ読むもの（アーカイブの境界など）があるので、減るのは許す。
+        """
+        baseline = None
+        for size in sizes:
+            grow(size)
+            with CaptureQueriesContext(connections["default"]) as context:
+                request()
+            queries = normalized_queries(context.captured_queries)
+            if baseline is None:
+                baseline = (size, queries)
+                continue
+            if len(queries) > len(baseline[1]):
+                raise QueryBudgetExceeded(
+                    f"行数を {baseline[0]} 件から {size} 件に増やすとクエリ数が増えました: "
+                    f"{len(baseline[1])} → {len(queries)}\n"
+                    + diff(baseline[1], queries, f"{baseline[0]} 件", f"{size} 件")
+                )
@@ -0,0 +1,237 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 終了したプロセスのカウンタとヒストグラムをまとめておくファイル
+DEAD_FILENAME = "dead.json"
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def dump(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    @staticmethod
+    def merge(a, b):
+        return a + b
+
+    def samples(self, key, value):
+        yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Gauge(Counter):
+    """最後に設定した値を持つ。複数プロセスの値は最大値でまとめる。"""
+
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    @staticmethod
+    def merge(a, b):
+        return max(a, b)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [各バケットの件数..., +Inf の件数, 合計値]
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    @staticmethod
+    def merge(a, b):
+        return [x + y for x, y in zip(a, b)]
+
+    def samples(self, key, value):
+        labels = dict(zip(self.labelnames, key))
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), value[:-1]):
+            cumulative += count
+            yield f"{self.name}_bucket", {**labels, "le": format_value(bound)}, cumulative
+        yield f"{self.name}_count", labels, cumulative
+        yield f"{self.name}_sum", labels, value[-1]
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return f"{value:.1f}"
+    return str(value)
+
+
+def escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Registry:
+    """メトリクスをプロセス内で集計する。
+
+    multiprocess_dir を指定すると、各プロセスが自分の値を <pid>.json に書き出し、
+    出力するときにディレクトリ内の全ファイルを合算する。
+    プロセスの開始時に start() を呼ぶと、終了したプロセスのファイルを dead.json にまとめて消す
+    （ゲージは終了したプロセスの値を残さない）。同じ PID を前に使っていたプロセスのファイルもここでまとめる。
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.multiprocess_dir = None
+        self.flush_interval = 1.0
+        self._flushed_at = 0.0
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+
+    def configure(self, multiprocess_dir=None, flush_interval=1.0):
+        self.multiprocess_dir = Path(multiprocess_dir) if multiprocess_dir else None
+        self.flush_interval = flush_interval
+
+    def dump(self):
+        return {name: metric.dump() for name, metric in self.metrics.items()}
+
+    def flush(self):
+        if self.multiprocess_dir is None:
+            return
+        self.multiprocess_dir.mkdir(parents=True, exist_ok=True)
+        path = self.multiprocess_dir / f"{os.getpid()}.json"
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.dump(), f)
+        os.replace(tmp, path)
+        self._flushed_at = time.monotonic()
+
+    def start(self):
+        self.reset()
+        if self.multiprocess_dir is None:
+            return
+        self.multiprocess_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.multiprocess_dir / ".lock", "w") as lock:
+            # 同時に起動したワーカーが同じファイルを二重にまとめないようにする
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            dead = [
+                path
+                for path in self.multiprocess_dir.glob("*.json")
+                if path.stem.isdigit() and (int(path.stem) == os.getpid() or not pid_alive(int(path.stem)))
+            ]
+            if not dead:
+                return
+            dead_path = self.multiprocess_dir / DEAD_FILENAME
+            merged = self.merge(self.read([dead_path] + dead), skip_types=("gauge",))
+            tmp = dead_path.with_suffix(".tmp")
+            with open(tmp, "w") as f:
+                json.dump(
+                    {name: [[list(key), value] for key, value in values.items()] for name, values in merged.items()}, f
+                )
+            os.replace(tmp, dead_path)
+            for path in dead:
+                path.unlink(missing_ok=True)
+
+    def maybe_flush(self):
+        if self.multiprocess_dir is not None and time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def collect(self):
+        """{メトリクス名: {ラベル: 値}} を返す。マルチプロセスモードでは全プロセス分を合算する。"""
+        if self.multiprocess_dir is None:
+            return self.merge([self.dump()])
+        self.flush()
+        return self.merge(self.read(self.multiprocess_dir.glob("*.json")))
+
+    def read(self, paths):
+        dumps = []
+        for path in paths:
+            try:
+                with open(path) as f:
+                    dumps.append(json.load(f))
+            except FileNotFoundError:
+                # start() でまとめて消されたファイル
+                continue
+        return dumps
+
+    def merge(self, dumps, skip_types=()):
+        merged = {name: {} for name in self.metrics}
+        for dump in dumps:
+            for name, values in dump.items():
+                metric = self.metrics.get(name)
+                if metric is None or metric.type in skip_types:
+                    continue
+                for key, value in values:
+                    key = tuple(key)
+                    current = merged[name].get(key)
+                    merged[name][key] = value if current is None else metric.merge(current, value)
+        return merged
+
+    def exposition(self):
+        lines = []
+        for name, values in self.collect().items():
+            metric = self.metrics[name]
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for key, value in sorted(values.items()):
+                for sample_name, labels, sample_value in metric.samples(key, value):
+                    label_text = ",".join(f'{k}="{escape(v)}"' for k, v in labels.items())
+                    label_text = f"{{{label_text}}}" if label_text else ""
+                    lines.append(f"{sample_name}{label_text} {format_value(sample_value)}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        for metric in self.metrics.values():
+            metric.reset()
+
+
+REGISTRY = Registry()
@@ -0,0 +1,143 @@
+import json
+import os
+import subprocess
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from metrics.collectors import DB_QUERIES
+from metrics.querybudget import QueryBudget, QueryBudgetExceeded, QueryBudgetTestMixin, normalize_sql
+from metrics.registry import Counter, Gauge, Histogram, Registry
+from tweets.models import Tweet
+
+User = get_user_model()
+
+
+class TestRegistry(SimpleTestCase):
+    def setUp(self):
+        self.registry = Registry()
+        self.counter = Counter("writes_total", "writes", ["kind"], registry=self.registry)
+        self.histogram = Histogram("latency_seconds", "latency", ["view"], buckets=(0.1, 1.0), registry=self.registry)
+
+    def test_success_exposition(self):
+        self.counter.inc(kind="like")
+        self.counter.inc(2, kind="like")
+        self.histogram.observe(0.05, view="home")
+        self.histogram.observe(0.5, view="home")
+        text = self.registry.exposition()
+        self.assertIn("# TYPE writes_total counter", text)
+        self.assertIn('writes_total{kind="like"} 3', text)
+        self.assertIn('latency_seconds_bucket{view="home",le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{view="home",le="1.0"} 2', text)
+        self.assertIn('latency_seconds_bucket{view="home",le="+Inf"} 2', text)
+        self.assertIn('latency_seconds_count{view="home"} 2', text)
+
+    def test_success_multiprocess_merge(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.registry.configure(directory)
+            self.counter.inc(kind="like")
+            other = {"writes_total": [[["like"], 4]], "latency_seconds": [[["home"], [1, 0, 0, 0.05]]]}
+            with open(os.path.join(directory, "99999.json"), "w") as f:
+                json.dump(other, f)
+            text = self.registry.exposition()
+        self.assertIn('writes_total{kind="like"} 5', text)
+        self.assertIn('latency_seconds_count{view="home"} 1', text)
+
+    def test_success_start_folds_dead_processes(self):
+        gauge = Gauge("workers", "workers", registry=self.registry)
+        process = subprocess.Popen(["true"])
+        process.wait()
+        with tempfile.TemporaryDirectory() as directory:
+            self.registry.configure(directory)
+            # 終了したプロセスと、同じ PID を前に使っていたプロセスのファイル
+            for pid, count in ((process.pid, 4), (os.getpid(), 2)):
+                with open(os.path.join(directory, f"{pid}.json"), "w") as f:
+                    json.dump({"writes_total": [[["like"], count]], "workers": [[[], 3]]}, f)
+            self.counter.inc(kind="like")
+            self.registry.start()
+            self.assertEqual(sorted(os.listdir(directory)), [".lock", "dead.json"])
+            gauge.set(1)
+            merged = self.registry.collect()
+        self.assertEqual(merged["writes_total"], {("like",): 6})
+        self.assertEqual(merged["workers"], {(): 1})
+
+
+class TestMetricsView(TestCase):
+    databases = {"default", "likes_0", "likes_1"}
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="tester", password="testpassword")
+        self.client.login(username="tester", password="testpassword")
+
+    def test_success_get(self):
+        tweet = Tweet.objects.create(user=self.user, content="test_content")
+        self.client.get(reverse("tweets:home"))
+        self.client.post(reverse("tweets:like", args=(tweet.id,)))
+        response = self.client.get(reverse("metrics:index"))
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('http_request_duration_seconds_count{view="tweets:home",method="GET"}', text)
+        self.assertIn('db_queries_total{view="tweets:home"}', text)
+        self.assertIn('writes_total{kind="like"}', text)
+
+    @override_settings(LIKE_SHARDS=["likes_0", "likes_1"])
+    def test_success_count_queries_on_every_database(self):
+        tweet = Tweet.objects.create(user=self.user, content="test_content")
+        before = DB_QUERIES._values.get(("tweets:like",), 0)
+        with CaptureQueriesContext(connections["likes_0"]) as likes_0, CaptureQueriesContext(
+            connections["likes_1"]
+        ) as likes_1, CaptureQueriesContext(connections["default"]) as default:
+            self.client.post(reverse("tweets:like", args=(tweet.id,)))
+        self.assertGreater(len(likes_0) + len(likes_1), 0)
+        self.assertEqual(DB_QUERIES._values[("tweets:like",)] - before, len(likes_0) + len(likes_1) + len(default))
+
+    @override_settings(METRICS_ALLOWED_IPS=["10.0.0.1"])
+    def test_failure_get_from_not_allowed_ip(self):
+        response = self.client.get(reverse("metrics:index"))
+        self.assertEqual(response.status_code, 403)
+
+
+class TestQueryBudget(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="tester", password="testpassword")
+
+    def test_normalize_sql(self):
+        self.assertEqual(
+            normalize_sql("SELECT *  FROM \"likes_0\" WHERE id IN (1, 2, 3) AND name = 'it''s' LIMIT 21"),
+            'SELECT * FROM "likes_0" WHERE id IN (...) AND name = ? LIMIT ?',
+        )
+
+    def test_success_within_budget(self):
+        @QueryBudget(1)
+        def read():
+            return list(Tweet.objects.all())
+
+        self.assertEqual(read(), [])
+
+    def test_failure_report_groups_repeated_queries(self):
+        with self.assertRaises(QueryBudgetExceeded) as context:
+            with QueryBudget(1):
+                for pk in (1, 2, 3):
+                    Tweet.objects.filter(pk=pk).exists()
+        self.assertIn("3 > 1", str(context.exception))
+        self.assertIn('   3 × SELECT ? AS "a" FROM "tweets_tweet"', str(context.exception))
+
+    def test_failure_constant_queries_shows_diff(self):
+        def grow(size):
+            Tweet.objects.bulk_create(
+                [Tweet(user=self.user, content="test") for _ in range(Tweet.objects.count(), size)]
+            )
+
+        def request():
+            # 投稿者を select_related していない N+1
+            for tweet in Tweet.objects.order_by("-pk")[:20]:
+                tweet.user.username
+
+        with self.assertRaises(QueryBudgetExceeded) as context:
+            self.assertConstantQueries(request, grow, sizes=(1, 20))
+        self.assertIn("1 件から 20 件に増やすとクエリ数が増えました: 2 → 21", str(context.exception))
+        self.assertIn('+SELECT "accounts_user"."id"', str(context.exception))
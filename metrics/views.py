@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.views.generic import View
+
+from .registry import REGISTRY
+
+
+class MetricsView(View):
+    def get(self, request, *args, **kwargs):
+        allowed_ips = getattr(settings, "METRICS_ALLOWED_IPS", None)
+        if allowed_ips is not None and request.META.get("REMOTE_ADDR") not in allowed_ips:
+            return HttpResponseForbidden()
+        return HttpResponse(REGISTRY.exposition(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -40,10 +41,24 @@ INSTALLED_APPS = [
     "accounts.apps.AccountsConfig",
     "tweets.apps.TweetsConfig",
     "welcome.apps.WelcomeConfig",
+    "taskqueue.apps.TaskqueueConfig",
+    "notifications.apps.NotificationsConfig",
+    "ratelimit.apps.RatelimitConfig",
+    "profiler.apps.ProfilerConfig",
+    "metrics.apps.MetricsConfig",
+    "loadtest.apps.LoadtestConfig",
+    "assets.apps.AssetsConfig",
+    "startup.apps.StartupConfig",
+    "archive.apps.ArchiveConfig",
 ]
 
 MIDDLEWARE = [
+    # 他のミドルウェアにかかる時間も計測するので先頭に置く
+    "profiler.middleware.SamplingProfilerMiddleware",
+    "metrics.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "assets.middleware.StaticFilesMiddleware",
+    "assets.compression.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -70,6 +85,18 @@ TEMPLATES = [
     },
 ]
 
+# True にするとテンプレートを読み込むときに空白を詰める（assets.loaders.Loader がキャッシュも兼ねる）
+TEMPLATE_MINIFY = False
+
+if TEMPLATE_MINIFY:
+    TEMPLATES[0]["APP_DIRS"] = False
+    TEMPLATES[0]["OPTIONS"]["loaders"] = [
+        (
+            "assets.loaders.Loader",
+            ["django.template.loaders.filesystem.Loader", "django.template.loaders.app_directories.Loader"],
+        )
+    ]
+
 WSGI_APPLICATION = "mysite.wsgi.application"
 
 LOGIN_URL = "accounts:login"
@@ -83,11 +110,173 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
-    }
+        # 書き込みが重なったときにすぐ "database is locked" にせず待つ
+        "OPTIONS": {"timeout": 20},
+        # ウォームアップで開いた接続をリクエストをまたいで使い回す
+        "CONN_MAX_AGE": 60,
+        "CONN_HEALTH_CHECKS": True,
+    },
+    # 古いツイートといいねの移動先。テーブルは manage.py migrate --database archive で作る
+    "archive": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "archive.sqlite3",
+        "OPTIONS": {"timeout": 20},
+    },
+    # いいねのシャードは下の LIKE_SHARD_DATABASES から足す
 }
 
+DATABASE_ROUTERS = ["tweets.sharding.LikeShardRouter", "archive.routers.ArchiveRouter"]
+
+# Startup
+# wsgi.py / asgi.py でアプリケーションを読み込んだ直後に startup.warmup.warm_up() を実行する
+
+WARMUP_ON_STARTUP = True
+
+# Prefork server
+# manage.py serve のワーカー数（None なら CPU 数）。ワーカーは SERVER_MAX_REQUESTS 件（+ 0〜SERVER_MAX_REQUESTS_JITTER 件）
+# 処理すると入れ替える。停止時は処理中のリクエストを SERVER_GRACEFUL_TIMEOUT 秒まで待つ
+# ワーカーが 2 個以上のときは、CACHES に LocMemCache 以外の（ワーカーの間で共有できる）バックエンドが必要。
+# SERVER_WORKERS が None のときは CPU 数だが、CACHES が LocMemCache なら 1 個で起動する
+
+SERVER_BIND = "127.0.0.1:8000"
+SERVER_WORKERS = None
+SERVER_MAX_REQUESTS = 1000
+SERVER_MAX_REQUESTS_JITTER = 50
+SERVER_GRACEFUL_TIMEOUT = 30
+
 AUTH_USER_MODEL = "accounts.User"
 
+# Task queue
+# 失敗したタスクは TASKQUEUE_RETRY_BACKOFF * 2 ** (試行回数 - 1) 秒後に再実行する
+
+TASKQUEUE_RETRY_BACKOFF = 2
+TASKQUEUE_RETRY_BACKOFF_MAX = 600
+TASKQUEUE_LEASE = 300
+
+# Notifications
+# 同じツイートへのいいねなどは NOTIFICATIONS_AGGREGATION_WINDOW 秒の間 1 件の通知にまとめる
+
+NOTIFICATIONS_AGGREGATION_WINDOW = 3600
+# いいね・フォローのイベントはプロセス内に貯め、NOTIFICATIONS_BATCH_SIZE 件ごとか
+# 最初のイベントから NOTIFICATIONS_FLUSH_INTERVAL 秒ごとに 1 つの配信タスクにまとめる
+NOTIFICATIONS_BATCH_SIZE = 50
+NOTIFICATIONS_FLUSH_INTERVAL = 2.0
+NOTIFICATIONS_PAGE_SIZE = 20
+
+# Deletion
+# 論理削除したツイート・ユーザーの関連行は DELETION_CHUNK_SIZE 件ずつ削除する
+
+DELETION_CHUNK_SIZE = 1000
+
+# Rate limiting
+# 複数プロセスで制限を共有する場合は "ratelimit.stores.CacheSlidingWindowStore" を指定する
+
+RATELIMIT_ENABLED = True
+RATELIMIT_STORE = "ratelimit.stores.LocalTokenBucketStore"
+RATELIMIT_TRUST_X_FORWARDED_FOR = False
+
+# Likes
+# Idempotency-Key 付きのいいね・いいね解除の結果を覚えておく秒数
+
+LIKE_IDEMPOTENCY_TIMEOUT = 300
+
+# Like shards
+# いいねを tweet_id のハッシュで LIKE_SHARDS のデータベースに分ける。空なら default に置く（シャーディングしない）。
+# LIKE_SHARD_DATABASES には Like のテーブルだけを作る。並べ方を変えるときは reshard_likes で移してから LIKE_SHARDS を変える。
+
+# LIKE_SHARD_DATABASES のデータベースだけを DATABASES に足す（テーブルは manage.py migrate --database likes_0 などで作る）。
+# シャーディングしないときは足さないので、ウォームアップで空の likes_*.sqlite3 が作られることもない。
+# default から分けるときは、先に移す先を LIKE_SHARD_DATABASES に並べてから reshard_likes を実行する。
+
+LIKE_SHARDS = []
+LIKE_SHARD_DATABASES = ["likes_0", "likes_1"] if LIKE_SHARDS or sys.argv[1:2] == ["test"] else []
+LIKE_SHARD_WORKERS = 8
+
+DATABASES.update(
+    {
+        alias: {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / f"{alias}.sqlite3",
+            "OPTIONS": {"timeout": 20},
+        }
+        for alias in LIKE_SHARD_DATABASES
+    }
+)
+
+# Snowflake IDs
+# SNOWFLAKE_IDS に入れたモデルは時刻順の 64 ビットの ID（tweets.ids）を主キーにする。ワーカー ID は SNOWFLAKE_WORKER_IDS の
+# うち空いているものを SNOWFLAKE_LOCK_DIR（None なら一時ディレクトリ）のファイルロックで取る。複数ホストでは重ならない範囲を設定する。
+# 既存のツイートは rekey_tweets で created_at 順の ID に振り直してから TIMELINE_ORDER_BY_ID を有効にする
+
+SNOWFLAKE_IDS = []
+SNOWFLAKE_WORKER_IDS = range(1024)
+SNOWFLAKE_LOCK_DIR = None
+TIMELINE_ORDER_BY_ID = False
+
+# Tweet pipeline
+# ツイート作成後のステージ（tweets/stages.py などで登録）ごとの実行方法。"inline" はコミット直後にそのリクエストの中で、
+# "deferred" は taskqueue のワーカーで実行する。書いていないステージは登録時の既定（inline）になる
+
+TWEET_PIPELINE = {}
+
+# Home timeline snapshots
+# 1 分間に HOME_SNAPSHOT_MIN_READS 回以上ホームを開いたユーザー（最大 HOME_SNAPSHOT_MAX_USERS 人）には、
+# 1 ページ目（HOME_PAGE_SIZE 件）をキャッシュに詰めて置き、新しいツイートや本人のいいね・フォローのたびに書き換える。
+# いいね数は読むときに重ねる
+
+HOME_PAGE_SIZE = 20
+HOME_SNAPSHOT_MIN_READS = 3
+HOME_SNAPSHOT_MAX_USERS = 100
+HOME_SNAPSHOT_TIMEOUT = 300
+
+# Hashtags and mentions
+# ツイート作成時に転置インデックスへまとめて書き込む件数と、タグのタイムラインの 1 ページの件数
+
+TAG_INDEX_BATCH_SIZE = 500
+TAG_TIMELINE_PAGE_SIZE = 20
+
+# Username cache
+# ユーザー名 → ID の対応。共有キャッシュの TTL と、プロセス内キャッシュの件数・TTL（他のプロセスでの変更は TTL まで残る）
+
+USERNAME_CACHE_TTL = 3600
+USERNAME_CACHE_LOCAL_SIZE = 10_000
+USERNAME_CACHE_LOCAL_TTL = 30
+
+# Archive
+# ARCHIVE_AFTER_DAYS 日より古いツイートを archive データベースに移す（archive_tweets コマンド / archive.archive_tweets タスク）
+
+ARCHIVE_DATABASE = "archive"
+ARCHIVE_AFTER_DAYS = 365
+ARCHIVE_CHUNKS_PER_TASK = 10
+ARCHIVE_HORIZON_CACHE_TIMEOUT = 60
+PROFILE_PAGE_SIZE = 20
+
+# Conditional GET
+# プロフィールとツイート詳細のバージョンはキャッシュに置くので、複数プロセスでは共有キャッシュを使うこと
+
+PAGE_VERSION_TIMEOUT = 86400
+PAGE_SHARED_MAX_AGE = 60
+
+# Profiling
+# 有効にすると PROFILING_SAMPLE_RATE の割合のリクエストと、スタッフが X-Profile ヘッダを付けたリクエストを
+# サンプリングして、ビューごとの collapsed stack を PROFILING_DIR に書き出す（flamegraph.pl などで描画できる）
+
+PROFILING_ENABLED = False
+PROFILING_SAMPLE_RATE = 0.01
+PROFILING_INTERVAL = 0.005
+PROFILING_HEADER = "X-Profile"
+PROFILING_DIR = BASE_DIR / "profiles"
+# ルートごとのファイルがこの大きさを超えたら .folded.1 に回して新しく書き始める（1 世代だけ残す）
+PROFILING_MAX_BYTES = 5 * 1024 * 1024
+
+# Metrics
+# 複数のワーカープロセスで動かす場合は METRICS_MULTIPROCESS_DIR に共有ディレクトリを指定すると、
+# /metrics が全プロセスの値を合算して返す
+
+METRICS_MULTIPROCESS_DIR = None
+METRICS_FLUSH_INTERVAL = 1.0
+METRICS_ALLOWED_IPS = ["127.0.0.1", "::1"]
+
 SQL_DEBUG = False
 
 if SQL_DEBUG:
@@ -136,6 +325,22 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/4.0/howto/static-files/
 
 STATIC_URL = "static/"
+STATIC_ROOT = BASE_DIR / "staticfiles"
+
+# ファイル名に内容のハッシュを付け、collectstatic 時に gzip / brotli 版も作る（brotli は入っていれば使う）
+STATICFILES_STORAGE = "assets.storage.CompressedManifestStaticFilesStorage"
+# collectstatic 済みの STATIC_ROOT をアプリケーションのプロセスから配信する
+STATIC_SERVE = True
+# ハッシュの付いていないファイルのキャッシュ期間（秒）
+STATIC_MAX_AGE = 60
+
+# Response compression
+# gzip（brotli パッケージがあれば brotli を優先）でレスポンスを圧縮する。小さいレスポンスは圧縮しない
+
+COMPRESSION_ENABLED = True
+COMPRESSION_MIN_SIZE = 200
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
@@ -20,6 +20,9 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path("accounts/", include("accounts.urls")),
     path("tweets/", include("tweets.urls")),
+    path("notifications/", include("notifications.urls")),
+    path("profiler/", include("profiler.urls")),
+    path("metrics", include("metrics.urls")),
     path("", include("welcome.urls")),
 ]
 
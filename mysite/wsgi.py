@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
 
 application = get_wsgi_application()
+
+# リクエストを受け付ける前に、テンプレートのコンパイルや URL の解決などを済ませておく
+from startup.warmup import warm_up_on_startup  # noqa: E402
+
+warm_up_on_startup()
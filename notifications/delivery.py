@@ -0,0 +1,100 @@
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from startup.prefork import worker_exit
+from taskqueue.queue import enqueue
+
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+
+def aggregation_key(verb, tweet_id=None):
+    if verb == Notification.Verb.LIKE:
+        return f"like:{tweet_id}"
+    return verb
+
+
+class EventBuffer:
+    """コミット済みのイベントをプロセス内に貯め、まとめて 1 つの notifications.deliver タスクとして登録する。
+
+    NOTIFICATIONS_BATCH_SIZE 件たまるか、最初のイベントから NOTIFICATIONS_FLUSH_INTERVAL 秒経つと書き出す。
+    時間での書き出しはタイマーのスレッドで行うので、後にイベントが続かなくても待たされない。
+    プロセスの終了時（atexit と、prefork のワーカーが os._exit する前の worker_exit）にも残りを書き出す。
+    強制終了されたプロセスに残っていた分（最大 NOTIFICATIONS_FLUSH_INTERVAL 秒分）は失われる。
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._lock = threading.Lock()
+        self._events = []
+        self._timer = None
+
+    def add(self, event):
+        batch_size = getattr(settings, "NOTIFICATIONS_BATCH_SIZE", 50)
+        with self._lock:
+            self._events.append(event)
+            if len(self._events) < batch_size:
+                self._schedule()
+                return
+        self.flush()
+
+    def _schedule(self):
+        if self._timer is None:
+            self._timer = threading.Timer(getattr(settings, "NOTIFICATIONS_FLUSH_INTERVAL", 2.0), self._flush_later)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_later(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("failed to flush notification events")
+        finally:
+            # タイマーのスレッドの DB 接続を閉じる
+            connection.close()
+
+    def flush(self):
+        with self._lock:
+            events, self._events = self._events, []
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+        if not events:
+            return
+        try:
+            enqueue("notifications.deliver", {"events": events})
+        except Exception:
+            # 登録できなかった分は戻して、次の書き出しでもう一度登録する
+            with self._lock:
+                self._events[:0] = events
+                self._schedule()
+            raise
+
+
+buffer = EventBuffer()
+atexit.register(buffer.flush)
+# fork した子プロセスには親が貯めていたイベントを持ち込まない（親が書き出す）
+os.register_at_fork(after_in_child=buffer.reset)
+
+
+def flush_on_worker_exit(**kwargs):
+    buffer.flush()
+
+
+worker_exit.connect(flush_on_worker_exit)
+
+
+def notify(verb, actor_id, recipient_id, tweet_id=None):
+    # 自分自身への操作は通知しない
+    if actor_id == recipient_id:
+        return
+    event = {"verb": verb, "actor_id": actor_id, "recipient_id": recipient_id, "tweet_id": tweet_id}
+    transaction.on_commit(lambda: buffer.add(event))
@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+
+class Notification(models.Model):
+    class Verb(models.TextChoices):
+        LIKE = "like"
+        FOLLOW = "follow"
+
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="notifications")
+    verb = models.CharField(max_length=10, choices=Verb.choices)
+    # 同じキーのイベントは時間枠の中で 1 件の通知にまとめる（例: "like:12", "follow"）
+    aggregation_key = models.CharField(max_length=100)
+    tweet = models.ForeignKey("tweets.Tweet", on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    last_actor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name="+")
+    # 異なるユーザーの数（同じユーザーのいいね・いいね解除の繰り返しは数えない）
+    actor_count = models.PositiveIntegerField(default=1)
+    is_read = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["recipient", "-updated_at", "-id"], name="notification_page"),
+            models.Index(fields=["recipient", "aggregation_key", "created_at"], name="notification_aggregation"),
+        ]
+
+    @property
+    def other_count(self):
+        return self.actor_count - 1
+
+    def __str__(self):
+        return f"{self.recipient}への通知（{self.aggregation_key} x{self.actor_count}）"
+
+
+class NotificationActor(models.Model):
+    # 通知にまとめたユーザー。actor_count を異なるユーザーの数にするために使う
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name="actors")
+    actor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["notification", "actor"], name="OnlyOneActorPerNotification")]
+
+
+class NotificationCounter(models.Model):
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name="notification_counter"
+    )
+    unread = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user}の未読通知：{self.unread}件"
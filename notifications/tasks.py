@@ -0,0 +1,83 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from taskqueue.queue import task
+
+from .delivery import aggregation_key
+from .models import Notification, NotificationActor, NotificationCounter
+
+
+@task("notifications.deliver")
+def deliver(events):
+    now = timezone.now()
+    window = timedelta(seconds=getattr(settings, "NOTIFICATIONS_AGGREGATION_WINDOW", 3600))
+
+    # (受信者, 集約キー) ごとにイベントをまとめる
+    groups = {}
+    for event in events:
+        key = (event["recipient_id"], aggregation_key(event["verb"], event["tweet_id"]))
+        groups.setdefault(key, []).append(event)
+
+    with transaction.atomic():
+        open_notifications = {
+            (n.recipient_id, n.aggregation_key): n
+            for n in Notification.objects.filter(
+                recipient_id__in={recipient_id for recipient_id, _ in groups},
+                aggregation_key__in={key for _, key in groups},
+                is_read=False,
+                created_at__gte=now - window,
+            ).only("pk", "recipient_id", "aggregation_key")
+        }
+
+        # 既にまとめたユーザーのイベント（いいねし直しなど）は数えない
+        known_actors = set(
+            NotificationActor.objects.filter(
+                notification_id__in=[n.pk for n in open_notifications.values()],
+                actor_id__in={event["actor_id"] for event in events},
+            ).values_list("notification_id", "actor_id")
+        )
+
+        new_notifications = []
+        new_actors = []
+        for (recipient_id, key), grouped in groups.items():
+            last = grouped[-1]
+            actor_ids = list(dict.fromkeys(event["actor_id"] for event in grouped))
+            notification = open_notifications.get((recipient_id, key))
+            if notification is not None:
+                actor_ids = [actor_id for actor_id in actor_ids if (notification.pk, actor_id) not in known_actors]
+                if not actor_ids:
+                    continue
+                Notification.objects.filter(pk=notification.pk).update(
+                    actor_count=F("actor_count") + len(actor_ids), last_actor_id=last["actor_id"], updated_at=now
+                )
+                new_actors += [
+                    NotificationActor(notification=notification, actor_id=actor_id) for actor_id in actor_ids
+                ]
+                continue
+            notification = Notification(
+                recipient_id=recipient_id,
+                verb=last["verb"],
+                aggregation_key=key,
+                tweet_id=last["tweet_id"],
+                last_actor_id=last["actor_id"],
+                actor_count=len(actor_ids),
+                created_at=now,
+                updated_at=now,
+            )
+            new_notifications.append(notification)
+            new_actors += [NotificationActor(notification=notification, actor_id=actor_id) for actor_id in actor_ids]
+        Notification.objects.bulk_create(new_notifications)
+        NotificationActor.objects.bulk_create(new_actors, ignore_conflicts=True)
+
+        unread = {}
+        for notification in new_notifications:
+            unread[notification.recipient_id] = unread.get(notification.recipient_id, 0) + 1
+        NotificationCounter.objects.bulk_create(
+            [NotificationCounter(user_id=user_id) for user_id in unread], ignore_conflicts=True
+        )
+        for user_id, count in unread.items():
+            NotificationCounter.objects.filter(user_id=user_id).update(unread=F("unread") + count)
@@ -0,0 +1,138 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from notifications.delivery import buffer
+from notifications.models import Notification, NotificationCounter
+from notifications.tasks import deliver
+from taskqueue.models import Task
+from taskqueue.queue import run_pending
+from tweets.models import Tweet
+
+User = get_user_model()
+
+
+class TestDeliver(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="tester", password="testpassword")
+        self.tweet = Tweet.objects.create(user=self.user, content="test_content")
+        self.actors = [User.objects.create_user(username=f"actor{i}", password="testpassword") for i in range(3)]
+
+    def like_event(self, actor):
+        return {"verb": "like", "actor_id": actor.pk, "recipient_id": self.user.pk, "tweet_id": self.tweet.pk}
+
+    def test_success_coalesce_events(self):
+        deliver([self.like_event(actor) for actor in self.actors[:2]])
+        deliver([self.like_event(self.actors[2])])
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor_count, 3)
+        self.assertEqual(notification.last_actor, self.actors[2])
+        self.assertEqual(NotificationCounter.objects.get(user=self.user).unread, 1)
+
+    def test_success_count_distinct_actors(self):
+        # いいね・いいね解除・いいねを繰り返しても「他 N 人」は増えない
+        deliver([self.like_event(self.actors[0]), self.like_event(self.actors[0])])
+        deliver([self.like_event(self.actors[0]), self.like_event(self.actors[1])])
+        deliver([self.like_event(self.actors[1])])
+        self.assertEqual(Notification.objects.get().actor_count, 2)
+
+    def test_success_new_notification_after_read(self):
+        deliver([self.like_event(self.actors[0])])
+        Notification.objects.update(is_read=True)
+        NotificationCounter.objects.update(unread=0)
+        deliver([self.like_event(self.actors[1])])
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(NotificationCounter.objects.get(user=self.user).unread, 1)
+
+
+class TestNotify(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="tester", password="testpassword")
+        self.other_user = User.objects.create_user(username="other_user", password="testpassword")
+        self.client.login(username="tester", password="testpassword")
+        # タイマーが他のテストの途中で書き出さないよう、残りはテストの中で書き出す
+        self.addCleanup(buffer.flush)
+
+    def deliver_pending(self):
+        buffer.flush()
+        run_pending()
+
+    def test_success_like(self):
+        tweet = Tweet.objects.create(user=self.other_user, content="test_content")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("tweets:like", args=(tweet.id,)))
+        self.deliver_pending()
+        notification = Notification.objects.get(recipient=self.other_user)
+        self.assertEqual(notification.verb, Notification.Verb.LIKE)
+        self.assertEqual(notification.tweet, tweet)
+
+    def test_success_follow(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("accounts:follow", kwargs={"username": self.other_user.username}))
+        self.deliver_pending()
+        self.assertTrue(Notification.objects.filter(recipient=self.other_user, verb="follow").exists())
+
+    def test_success_not_notify_self(self):
+        tweet = Tweet.objects.create(user=self.user, content="test_content")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("tweets:like", args=(tweet.id,)))
+        self.deliver_pending()
+        self.assertFalse(Notification.objects.exists())
+
+    def like_from_actors(self, count):
+        tweet = Tweet.objects.create(user=self.other_user, content="test_content")
+        for i in range(count):
+            User.objects.create_user(username=f"actor{i}", password="testpassword")
+            self.client.login(username=f"actor{i}", password="testpassword")
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse("tweets:like", args=(tweet.id,)))
+        return tweet
+
+    def test_success_batch_events_into_one_task(self):
+        self.like_from_actors(5)
+        self.assertFalse(Task.objects.exists())
+        buffer.flush()
+        self.assertEqual(Task.objects.count(), 1)
+        run_pending()
+        self.assertEqual(Notification.objects.get(recipient=self.other_user).actor_count, 5)
+
+    @override_settings(NOTIFICATIONS_BATCH_SIZE=2)
+    def test_success_flush_when_batch_full(self):
+        self.like_from_actors(5)
+        self.assertEqual(Task.objects.count(), 2)
+        self.deliver_pending()
+        self.assertEqual(Task.objects.count(), 3)
+        self.assertEqual(Notification.objects.get(recipient=self.other_user).actor_count, 5)
+
+
+@override_settings(NOTIFICATIONS_PAGE_SIZE=2)
+class TestNotificationListView(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="tester", password="testpassword")
+        self.client.login(username="tester", password="testpassword")
+        actor = User.objects.create_user(username="actor", password="testpassword")
+        tweets = [Tweet.objects.create(user=self.user, content=f"content{i}") for i in range(3)]
+        deliver(
+            [{"verb": "like", "actor_id": actor.pk, "recipient_id": self.user.pk, "tweet_id": t.pk} for t in tweets]
+        )
+        self.url = reverse("notifications:list")
+
+    def test_success_get(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["notifications"]), 2)
+        self.assertEqual(response.context["unread_count"], 3)
+
+        response = self.client.get(self.url, {"before": response.context["next_cursor"]})
+        self.assertEqual(len(response.context["notifications"]), 1)
+        self.assertIsNone(response.context["next_cursor"])
+
+    def test_failure_get_with_invalid_cursor(self):
+        response = self.client.get(self.url, {"before": "invalid"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_success_mark_all_read(self):
+        response = self.client.post(reverse("notifications:read"))
+        self.assertRedirects(response, self.url)
+        self.assertFalse(Notification.objects.filter(is_read=False).exists())
+        self.assertEqual(NotificationCounter.objects.get(user=self.user).unread, 0)
@@ -0,0 +1,63 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db.models import Q
+from django.http import HttpResponseBadRequest
+from django.shortcuts import redirect
+from django.utils import timezone
+from django.views.generic import TemplateView, View
+
+from .models import Notification, NotificationCounter
+
+
+def encode_cursor(notification):
+    return f"{int(notification.updated_at.timestamp() * 1_000_000)}_{notification.pk}"
+
+
+def decode_cursor(cursor):
+    timestamp, pk = cursor.split("_")
+    return datetime.fromtimestamp(int(timestamp) / 1_000_000, tz=timezone.utc), int(pk)
+
+
+class NotificationListView(LoginRequiredMixin, TemplateView):
+    template_name = "notifications/list.html"
+
+    def get(self, request, *args, **kwargs):
+        cursor = request.GET.get("before")
+        if cursor:
+            try:
+                self.before = decode_cursor(cursor)
+            except ValueError:
+                return HttpResponseBadRequest("不正なカーソルです。")
+        else:
+            self.before = None
+        return super().get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        page_size = getattr(settings, "NOTIFICATIONS_PAGE_SIZE", 20)
+        notifications = (
+            Notification.objects.filter(recipient=self.request.user)
+            .select_related("last_actor", "tweet")
+            .only("verb", "actor_count", "is_read", "updated_at", "last_actor__username", "tweet__content")
+            .order_by("-updated_at", "-id")
+        )
+        if self.before is not None:
+            # (updated_at, id) のキーセットで前のページの続きから読む
+            updated_at, pk = self.before
+            notifications = notifications.filter(Q(updated_at__lt=updated_at) | Q(updated_at=updated_at, pk__lt=pk))
+        page = list(notifications[: page_size + 1])
+        context["notifications"] = page[:page_size]
+        context["next_cursor"] = encode_cursor(page[page_size - 1]) if len(page) > page_size else None
+        context["unread_count"] = (
+            NotificationCounter.objects.filter(user=self.request.user).values_list("unread", flat=True).first() or 0
+        )
+        return context
+
+
+class MarkAllReadView(LoginRequiredMixin, View):
+    def post(self, request, *args, **kwargs):
+        Notification.objects.filter(recipient=request.user, is_read=False).update(is_read=True)
+        NotificationCounter.objects.filter(user=request.user).update(unread=0)
+        return redirect("notifications:list")
@@ -0,0 +1,53 @@
+import random
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.exceptions import MiddlewareNotUsed
+
+from .sampler import StackSampler, write_stacks
+
+
+class SamplingProfilerMiddleware:
+    """PROFILING_SAMPLE_RATE の割合のリクエスト（またはスタッフが X-Profile ヘッダを付けたリクエスト）を
+    サンプリングプロファイラで計測し、ビューごとに PROFILING_DIR へ書き出す。
+
+    MIDDLEWARE の先頭に置くので、計測を始める時点ではまだ request.user がない。
+    ヘッダが付いていれば、計測を始める前にセッションから利用者を引いてスタッフかどうかを確かめる。
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "PROFILING_ENABLED", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, "PROFILING_SAMPLE_RATE", 0.0)
+        self.interval = getattr(settings, "PROFILING_INTERVAL", 0.005)
+        self.header = getattr(settings, "PROFILING_HEADER", "X-Profile")
+
+    def is_staff(self, request):
+        session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        if session_key is None:
+            return False
+        # SessionMiddleware より前なので、ここだけのセッションを作って get_user に渡す
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+        try:
+            return get_user(request).is_staff
+        finally:
+            del request.session
+
+    def should_profile(self, request):
+        if self.header in request.headers and self.is_staff(request):
+            return True
+        return random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        with StackSampler(self.interval) as sampler:
+            response = self.get_response(request)
+        match = request.resolver_match
+        route = match.view_name if match is not None and match.view_name else "unknown"
+        write_stacks(route, sampler.stacks)
+        response["X-Profiled-Route"] = route
+        return response
@@ -0,0 +1,116 @@
+import os
+import sys
+import threading
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+
+
+def frame_label(frame):
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}.{code.co_name}".replace(";", ":")
+
+
+class StackSampler:
+    """別スレッドから対象スレッドのスタックを一定間隔で読み取り、collapsed stack 形式で数える。"""
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def profile_dir():
+    return Path(getattr(settings, "PROFILING_DIR", settings.BASE_DIR / "profiles"))
+
+
+def route_filename(route):
+    return route.replace(":", "__") + ".folded"
+
+
+def rotated(path):
+    return path.with_name(path.name + ".1")
+
+
+def write_stacks(route, stacks):
+    """ルートごとのファイルに追記する。同じスタックの行は読むときに合算する。
+
+    PROFILING_MAX_BYTES を超えたファイルは .folded.1 に回す（前の .folded.1 は消える）。
+    """
+    if not stacks:
+        return
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / route_filename(route)
+    max_bytes = getattr(settings, "PROFILING_MAX_BYTES", 5 * 1024 * 1024)
+    try:
+        if max_bytes and path.stat().st_size >= max_bytes:
+            # 名前の付け替えだけなので、他のプロセスが同時に回しても壊れない
+            os.replace(path, rotated(path))
+    except FileNotFoundError:
+        pass
+    with open(path, "a") as f:
+        f.writelines(f"{stack} {count}\n" for stack, count in stacks.items())
+
+
+def read_stacks(path):
+    stacks = Counter()
+    with open(path) as f:
+        for line in f:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            if stack:
+                stacks[stack] += int(count)
+    return stacks
+
+
+def hot_functions(stacks, limit=20):
+    """(関数, 自身のサンプル数, 呼び出し先を含むサンプル数) をサンプル数の多い順に返す。"""
+    own = Counter()
+    total = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        for label in set(frames):
+            total[label] += count
+    return [(label, own[label], total[label]) for label, _ in own.most_common(limit)]
+
+
+def routes():
+    directory = profile_dir()
+    if not directory.exists():
+        return []
+    result = []
+    for path in sorted(directory.glob("*.folded")):
+        stacks = read_stacks(path)
+        if rotated(path).exists():
+            stacks.update(read_stacks(rotated(path)))
+        result.append(
+            {
+                "route": path.stem.replace("__", ":"),
+                "samples": sum(stacks.values()),
+                "functions": hot_functions(stacks),
+            }
+        )
+    return result
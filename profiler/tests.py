@@ -0,0 +1,76 @@
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from profiler.sampler import StackSampler, hot_functions, read_stacks, write_stacks
+
+User = get_user_model()
+
+
+def slow_function():
+    time.sleep(0.05)
+
+
+class TestStackSampler(SimpleTestCase):
+    def test_success_sample(self):
+        with StackSampler(interval=0.001) as sampler:
+            slow_function()
+        self.assertTrue(any("profiler.tests.slow_function" in stack for stack in sampler.stacks))
+
+    def test_success_hot_functions(self):
+        stacks = {"a;b;c": 3, "a;b": 1, "a;d": 2}
+        self.assertEqual(hot_functions(stacks), [("c", 3, 3), ("d", 2, 2), ("b", 1, 4)])
+
+
+class TestProfilingMiddleware(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        override = override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=0.0, PROFILING_DIR=self.directory)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create_user(username="tester", password="testpassword")
+        self.client.login(username="tester", password="testpassword")
+
+    def test_success_profile_with_header_by_staff(self):
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        response = self.client.get(reverse("tweets:home"), HTTP_X_PROFILE="1")
+        self.assertEqual(response["X-Profiled-Route"], "tweets:home")
+
+    def test_failure_profile_with_header_by_non_staff(self):
+        response = self.client.get(reverse("tweets:home"), HTTP_X_PROFILE="1")
+        self.assertNotIn("X-Profiled-Route", response)
+
+    def test_failure_profile_with_header_by_anonymous(self):
+        self.client.logout()
+        with mock.patch("profiler.middleware.StackSampler") as sampler:
+            self.client.get(reverse("accounts:login"), HTTP_X_PROFILE="1")
+        sampler.assert_not_called()
+
+    def test_success_index(self):
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        write_stacks("tweets:home", {"a;b": 2})
+        write_stacks("tweets:home", {"a;b": 1})
+        self.assertEqual(read_stacks(self.directory / "tweets__home.folded"), {"a;b": 3})
+        response = self.client.get(reverse("profiler:index"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["routes"][0]["route"], "tweets:home")
+        self.assertEqual(response.context["routes"][0]["samples"], 3)
+
+    def test_success_rotate(self):
+        with self.settings(PROFILING_MAX_BYTES=5):
+            write_stacks("tweets:home", {"a;b": 2})
+            write_stacks("tweets:home", {"a;c": 1})
+            write_stacks("tweets:home", {"a;d": 1})
+        self.assertEqual(read_stacks(self.directory / "tweets__home.folded"), {"a;d": 1})
+        self.assertEqual(read_stacks(self.directory / "tweets__home.folded.1"), {"a;c": 1})
+
+    def test_failure_index_by_non_staff(self):
+        response = self.client.get(reverse("profiler:index"))
+        self.assertEqual(response.status_code, 403)
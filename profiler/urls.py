@@ -0,0 +1,9 @@
+from django.urls import path
+
+from . import views
+
+app_name = "profiler"
+
+urlpatterns = [
+    path("", views.ProfileIndexView.as_view(), name="index"),
+]
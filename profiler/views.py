@@ -0,0 +1,16 @@
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.views.generic import TemplateView
+
+from .sampler import routes
+
+
+class ProfileIndexView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
+    template_name = "profiler/index.html"
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["routes"] = routes()
+        return context
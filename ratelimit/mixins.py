@@ -0,0 +1,57 @@
+import math
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.http import HttpResponse
+
+from .stores import get_store
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+@lru_cache(maxsize=None)
+def parse_rate(rate):
+    """ "10/m" のような指定を (回数, 秒数) にする。"""
+    limit, period = rate.split("/")
+    return int(limit), PERIODS[period]
+
+
+def client_ip(request):
+    if getattr(settings, "RATELIMIT_TRUST_X_FORWARDED_FOR", False):
+        forwarded = request.META.get("HTTP_X_FORWARDED_FOR")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.META.get("REMOTE_ADDR", "")
+
+
+class RateLimitMixin:
+    """ratelimits に [("user", "10/m"), ("ip", "30/m")] のように指定した回数を超えたら 429 を返す。"""
+
+    ratelimits = []
+    ratelimit_methods = ("POST",)
+
+    def dispatch(self, request, *args, **kwargs):
+        if getattr(settings, "RATELIMIT_ENABLED", True) and request.method in self.ratelimit_methods:
+            store = get_store()
+            for scope, rate in self.ratelimits:
+                key = self.get_ratelimit_key(request, scope)
+                if key is None:
+                    continue
+                limit, period = parse_rate(rate)
+                allowed, retry_after = store.hit(key, limit, period)
+                if not allowed:
+                    response = HttpResponse("リクエストが多すぎます。しばらくしてから再度お試しください。", status=429)
+                    response["Retry-After"] = str(max(1, math.ceil(retry_after)))
+                    return response
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_ratelimit_key(self, request, scope):
+        if scope == "user":
+            # request.user を読むとユーザーの行まで読むので、セッションに入っているユーザー ID を使う
+            ident = request.session.get(SESSION_KEY)
+            if ident is None:
+                return None
+        else:
+            ident = client_ip(request)
+        return f"{type(self).__name__}:{scope}:{ident}"
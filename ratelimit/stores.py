@@ -0,0 +1,81 @@
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+
+class LocalTokenBucketStore:
+    """プロセス内のトークンバケット。
+
+    バケットは (残りトークン, 最終更新時刻) のタプルで、辞書への代入だけで更新するのでロックを取らない。
+    同時アクセスでまれに 1 回分の消費が失われることはあるが、制限としては十分な精度になる。
+    キーが max_keys を超えたら、最も長く使われていないバケットから捨てる（満タンのバケットと同じ扱いになる）。
+    """
+
+    def __init__(self, max_keys=100_000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def hit(self, key, limit, period):
+        now = time.monotonic()
+        rate = limit / period
+        tokens, updated_at = self._buckets.get(key, (limit, now))
+        tokens = min(limit, tokens + (now - updated_at) * rate)
+        if tokens >= 1:
+            self._buckets[key] = (tokens - 1, now)
+            allowed, retry_after = True, 0
+        else:
+            self._buckets[key] = (tokens, now)
+            allowed, retry_after = False, (1 - tokens) / rate
+        try:
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        except KeyError:
+            # 他のスレッドが同時に捨てたキー
+            pass
+        return allowed, retry_after
+
+    def reset(self):
+        self._buckets = OrderedDict()
+
+
+class CacheSlidingWindowStore:
+    """Django のキャッシュを使ったスライディングウィンドウカウンタ。複数プロセスで制限を共有する。"""
+
+    def __init__(self, alias="default", prefix="ratelimit"):
+        self.cache = caches[alias]
+        self.prefix = prefix
+
+    def hit(self, key, limit, period):
+        now = time.time()
+        window, elapsed = divmod(now, period)
+        current_key = f"{self.prefix}:{key}:{int(window)}"
+        previous_key = f"{self.prefix}:{key}:{int(window) - 1}"
+        counts = self.cache.get_many([current_key, previous_key])
+        current = counts.get(current_key, 0)
+        previous = counts.get(previous_key, 0)
+        # 前のウィンドウの件数を、まだ重なっている割合だけ数える
+        if previous * (1 - elapsed / period) + current >= limit:
+            if previous and current < limit:
+                retry_after = period * (1 - (limit - current) / previous) - elapsed
+            else:
+                retry_after = period - elapsed
+            return False, max(retry_after, 0)
+        self.cache.add(current_key, 0, timeout=int(period * 2))
+        try:
+            self.cache.incr(current_key)
+        except ValueError:
+            self.cache.set(current_key, 1, timeout=int(period * 2))
+        return True, 0
+
+    def reset(self):
+        pass
+
+
+@lru_cache(maxsize=None)
+def get_store():
+    return import_string(getattr(settings, "RATELIMIT_STORE", "ratelimit.stores.LocalTokenBucketStore"))()
@@ -0,0 +1,83 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from ratelimit.stores import CacheSlidingWindowStore, LocalTokenBucketStore, get_store
+from tweets.models import Tweet
+from tweets.views import TweetCreateView
+
+User = get_user_model()
+
+
+class TestLocalTokenBucketStore(SimpleTestCase):
+    def test_success_hit(self):
+        store = LocalTokenBucketStore()
+        self.assertEqual(store.hit("key", 2, 60), (True, 0))
+        self.assertEqual(store.hit("key", 2, 60), (True, 0))
+        allowed, retry_after = store.hit("key", 2, 60)
+        self.assertFalse(allowed)
+        self.assertGreater(retry_after, 0)
+        self.assertLessEqual(retry_after, 30)
+        self.assertTrue(store.hit("other_key", 2, 60)[0])
+
+    def test_success_evict_least_recently_used(self):
+        store = LocalTokenBucketStore(max_keys=2)
+        store.hit("old", 1, 60)
+        store.hit("recent", 1, 60)
+        store.hit("old", 1, 60)
+        store.hit("new", 1, 60)
+        # 最後に使われたのが古い "recent" だけが捨てられ、"old" は制限されたまま
+        self.assertEqual(list(store._buckets), ["old", "new"])
+        self.assertFalse(store.hit("old", 1, 60)[0])
+        self.assertTrue(store.hit("recent", 1, 60)[0])
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class TestCacheSlidingWindowStore(SimpleTestCase):
+    def test_success_hit(self):
+        store = CacheSlidingWindowStore(prefix="test")
+        self.assertTrue(store.hit("key", 2, 60)[0])
+        self.assertTrue(store.hit("key", 2, 60)[0])
+        allowed, retry_after = store.hit("key", 2, 60)
+        self.assertFalse(allowed)
+        self.assertGreater(retry_after, 0)
+
+
+class TestRateLimitMixin(TestCase):
+    def setUp(self):
+        get_store().reset()
+        self.addCleanup(get_store().reset)
+        User.objects.create_user(username="tester", password="testpassword")
+        self.client.login(username="tester", password="testpassword")
+        self.url = reverse("tweets:create")
+
+    @mock.patch.object(TweetCreateView, "ratelimits", [("user", "2/m")])
+    def test_failure_post_over_limit(self):
+        for _ in range(2):
+            response = self.client.post(self.url, {"content": "test_content"})
+            self.assertEqual(response.status_code, 302)
+        response = self.client.post(self.url, {"content": "test_content"})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response["Retry-After"]), 1)
+        self.assertEqual(Tweet.objects.count(), 2)
+
+    @mock.patch.object(TweetCreateView, "ratelimits", [("user", "1/m")])
+    def test_success_rejected_without_loading_user(self):
+        self.client.post(self.url, {"content": "test_content"})
+        # 制限されたリクエストはセッションを読むだけで、ユーザーの行は読まない
+        with self.assertNumQueries(1):
+            response = self.client.post(self.url, {"content": "test_content"})
+        self.assertEqual(response.status_code, 429)
+
+    @mock.patch.object(TweetCreateView, "ratelimits", [("ip", "1/m")])
+    def test_success_get_not_limited(self):
+        for _ in range(3):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    @override_settings(RATELIMIT_ENABLED=False)
+    @mock.patch.object(TweetCreateView, "ratelimits", [("user", "1/m")])
+    def test_success_post_when_disabled(self):
+        for _ in range(2):
+            self.assertEqual(self.client.post(self.url, {"content": "test_content"}).status_code, 302)
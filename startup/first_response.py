@@ -0,0 +1,64 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+# 新しいインタープリタで実行し、起動からの各時点の経過時間を JSON で出力するスクリプト
+SCRIPT = """
+import io, json, os, sys, time
+started = time.perf_counter()
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+loaded = time.perf_counter()
+if {warm!r}:
+    from startup.warmup import warm_up
+    warm_up()
+ready = time.perf_counter()
+
+def request():
+    environ = {{
+        "REQUEST_METHOD": "GET", "PATH_INFO": {path!r}, "QUERY_STRING": "", "SERVER_NAME": "127.0.0.1",
+        "SERVER_PORT": "80", "HTTP_HOST": "127.0.0.1", "REMOTE_ADDR": "127.0.0.1", "SERVER_PROTOCOL": "HTTP/1.1",
+        "wsgi.input": io.BytesIO(), "wsgi.errors": sys.stderr, "wsgi.url_scheme": "http",
+        "wsgi.multithread": False, "wsgi.multiprocess": False, "wsgi.run_once": False,
+    }}
+    statuses = []
+    body = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    b"".join(body)
+    body.close()
+    return statuses[0]
+
+status = request()
+first = time.perf_counter()
+request()
+second = time.perf_counter()
+print(json.dumps({{
+    "status": status,
+    "startup": loaded - started,
+    "warmup": ready - loaded,
+    "first_response": first - ready,
+    "second_response": second - first,
+    "time_to_first_response": first - started,
+}}))
+"""
+
+
+def measure(path="/accounts/login/", warm=True, cwd=None):
+    """新しいプロセスで WSGI アプリケーションを読み込み、path への最初のリクエストまでの時間を測る。
+
+    インタープリタ自体の起動時間も含めた値を total に入れる。
+    """
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", SCRIPT.format(path=path, warm=warm)],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=cwd,
+        env=dict(os.environ),
+    )
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["total"] = time.perf_counter() - started
+    return timings
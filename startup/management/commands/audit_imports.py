@@ -0,0 +1,68 @@
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# python -X importtime の出力: "import time: self [us] | cumulative | imported package"
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+# importlib.import_module での import は -X importtime に記録されないので、
+# Django が読み込むより前に __import__ を使うものに差し替えてから、アプリケーションを読み込む
+SCRIPT = """
+import importlib, importlib.util, os, sys
+
+def import_module(name, package=None):
+    if name.startswith("."):
+        name = importlib.util.resolve_name(name, package)
+    __import__(name)
+    return sys.modules[name]
+
+importlib.import_module = import_module
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+from django.urls import get_resolver
+get_resolver().url_patterns
+"""
+
+
+def import_times():
+    """新しいプロセスでアプリケーションを読み込み、[(モジュール名, 自身の秒数, 累積の秒数)] を返す。"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", SCRIPT],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=settings.BASE_DIR,
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            times.append((match[4], int(match[1]) / 1_000_000, int(match[2]) / 1_000_000))
+    return times
+
+
+class Command(BaseCommand):
+    help = "アプリケーションを読み込むときの import を計測し、指定したパッケージで時間のかかるものを表示します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("packages", nargs="*", default=["mysite", "accounts", "tweets"])
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument("--sort", choices=["self", "cumulative"], default="cumulative")
+
+    def handle(self, *args, **options):
+        times = import_times()
+        packages = tuple(options["packages"])
+        selected = [row for row in times if row[0].split(".")[0] in packages]
+        selected.sort(key=lambda row: row[1] if options["sort"] == "self" else row[2], reverse=True)
+
+        self.stdout.write(f"{'module':<40} {'self ms':>9} {'cumulative ms':>14}")
+        for module, own, cumulative in selected[: options["limit"]]:
+            self.stdout.write(f"{module:<40} {own * 1000:>9.2f} {cumulative * 1000:>14.2f}")
+        total = sum(own for _, own, _ in times)
+        self.stdout.write(
+            f"{len(selected)} / {len(times)} modules, "
+            f"{', '.join(packages)}: {sum(own for _, own, _ in selected) * 1000:.1f} ms, all: {total * 1000:.1f} ms"
+        )
@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import WSGIRequestHandler, get_internal_wsgi_application
+
+from startup.prefork import PreforkServer, check_shared_state, choose_workers, listen, process_local_caches
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "本番用のプリフォーク WSGI サーバーを起動します。"
+        "SIGHUP で新しいコードのワーカーに入れ替え、SIGTERM で処理中のリクエストを返してから止まります。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bind", default=getattr(settings, "SERVER_BIND", "127.0.0.1:8000"), help="host:port")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=getattr(settings, "SERVER_WORKERS", None),
+            help="既定は CPU 数（キャッシュがプロセスごとなら 1）",
+        )
+        parser.add_argument(
+            "--max-requests",
+            type=int,
+            default=getattr(settings, "SERVER_MAX_REQUESTS", 1000),
+            help="この件数を処理したワーカーを入れ替える（0 なら入れ替えない）",
+        )
+        parser.add_argument(
+            "--max-requests-jitter", type=int, default=getattr(settings, "SERVER_MAX_REQUESTS_JITTER", 50)
+        )
+        parser.add_argument(
+            "--graceful-timeout",
+            type=float,
+            default=getattr(settings, "SERVER_GRACEFUL_TIMEOUT", 30),
+            help="停止時に処理中のリクエストを待つ秒数",
+        )
+        parser.add_argument("--access-log", action="store_true", help="リクエストごとのログを出す")
+
+    def handle(self, *args, **options):
+        host, _, port = options["bind"].rpartition(":")
+        if not host or not port.isdigit():
+            raise CommandError(f"--bind は host:port で指定してください: {options['bind']}")
+        workers = choose_workers(options["workers"])
+        if not options["workers"] and process_local_caches():
+            self.stderr.write("キャッシュがプロセスごと（LocMemCache）なので、ワーカー 1 個で起動します。")
+        self.check_shared_state(workers)
+        server = PreforkServer(
+            # WSGI_APPLICATION（mysite.wsgi）を読み込むとウォームアップも済む
+            get_internal_wsgi_application,
+            listen(host, int(port)),
+            workers=workers,
+            max_requests=options["max_requests"] or None,
+            max_requests_jitter=options["max_requests_jitter"],
+            graceful_timeout=options["graceful_timeout"],
+            handler_class=WSGIRequestHandler if options["access_log"] else QuietHandler,
+        )
+        self.stdout.write(f"http://{options['bind']}/ でワーカー {workers} 個を起動します")
+        server.run()
+
+    def check_shared_state(self, workers):
+        try:
+            warnings = check_shared_state(workers)
+        except ImproperlyConfigured as e:
+            raise CommandError(e)
+        for warning in warnings:
+            self.stderr.write(warning)
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from startup.first_response import measure
+from startup.warmup import warm_up
+
+
+class Command(BaseCommand):
+    help = "ウォームアップの各ステップにかかる時間を表示します。--measure で最初のレスポンスまでの時間を比べます。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--measure", action="store_true", help="新しいプロセスで最初のレスポンスまでの時間を測る")
+        parser.add_argument("--path", default="/accounts/login/", help="測定に使う URL のパス")
+        parser.add_argument("--repeat", type=int, default=3, help="測定の繰り返し回数（中央値を表示する）")
+
+    def handle(self, *args, **options):
+        for name, (count, seconds) in warm_up().items():
+            self.stdout.write(f"{name:<12} {count:>5} 件 {seconds * 1000:>9.1f} ms")
+        if not options["measure"]:
+            return
+
+        self.stdout.write("")
+        self.stdout.write(
+            f"{'warm-up':<8} {'startup':>9} {'warmup':>9} {'1st req':>9} {'2nd req':>9} {'to 1st':>9} {'total':>9}"
+        )
+        for warm in (False, True):
+            runs = [measure(options["path"], warm, cwd=settings.BASE_DIR) for _ in range(options["repeat"])]
+            median = {key: sorted(run[key] for run in runs)[len(runs) // 2] for key in runs[0] if key != "status"}
+            self.stdout.write(
+                f"{'on' if warm else 'off':<8}"
+                + "".join(
+                    f" {median[key] * 1000:>6.1f} ms"
+                    for key in ("startup", "warmup", "first_response", "second_response", "time_to_first_response")
+                )
+                + f" {median['total'] * 1000:>6.1f} ms"
+            )
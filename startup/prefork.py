@@ -0,0 +1,256 @@
+import gc
+import logging
+import os
+import random
+import select
+import signal
+import socket
+import sys
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.servers.basehttp import WSGIRequestHandler, WSGIServer
+from django.db import connections
+from django.dispatch import Signal
+
+from metrics.registry import REGISTRY
+from ratelimit.stores import LocalTokenBucketStore, get_store
+
+logger = logging.getLogger(__name__)
+
+# master がアプリを読み込んでウォームアップを済ませてから fork し、ワーカーはそのメモリをコピーオンライトで共有する。
+# ワーカーは同じ待ち受けソケットから accept する。max_requests 件処理したワーカーは終了し、master が新しく fork する。
+# SIGTERM / SIGINT: 処理中のリクエストを返してから止まる（graceful_timeout を過ぎたら SIGKILL）。
+# SIGHUP: 待ち受けソケットを開いたまま master を exec し直し、新しいコードのワーカーに入れ替える。
+
+LISTEN_FD_ENV = "PREFORK_LISTEN_FD"
+
+# ワーカーが os._exit する直前に送る。atexit は動かないので、プロセス内に貯めたものはここで書き出す
+worker_exit = Signal()
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def process_local_caches():
+    """ワーカーの間で共有されない（LocMemCache の）キャッシュの別名。"""
+    return [alias for alias in settings.CACHES if isinstance(caches[alias], LocMemCache)]
+
+
+def choose_workers(workers=None):
+    """ワーカー数。指定がなければ CPU 数だが、キャッシュがプロセスごとなら 1 にする。"""
+    if workers:
+        return workers
+    return 1 if process_local_caches() else default_workers()
+
+
+def check_shared_state(workers):
+    """workers 個のワーカーで動かせるか確かめ、注意することがあれば文のリストで返す。
+
+    キャッシュがプロセスごとだと、キャッシュの無効化・スナップショット・いいねの Idempotency-Key が
+    ほかのワーカーに届かないので ImproperlyConfigured を送出する。
+    """
+    if workers <= 1:
+        return []
+    local = process_local_caches()
+    if local:
+        raise ImproperlyConfigured(
+            f"キャッシュ {', '.join(local)} が LocMemCache なので、ワーカーの間で共有されません。"
+            "CACHES に FileBasedCache や DatabaseCache などの共有できるバックエンドを設定するか、ワーカーを 1 個にしてください。"
+        )
+    if isinstance(get_store(), LocalTokenBucketStore):
+        return [
+            "RATELIMIT_STORE が LocalTokenBucketStore なので、回数の制限はワーカーごとに数えます"
+            "（共有するには ratelimit.stores.CacheSlidingWindowStore を使ってください）。"
+        ]
+    return []
+
+
+def listen(host, port, backlog=1024):
+    """SIGHUP で exec し直した master なら引き継いだソケットを、そうでなければ新しいソケットを返す。"""
+    fd = os.environ.pop(LISTEN_FD_ENV, None)
+    sock = socket.socket(fileno=int(fd)) if fd is not None else socket.create_server((host, port), backlog=backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class WorkerServer(WSGIServer):
+    """親から受け取ったソケットで待ち受け、処理したリクエストの数を数える。"""
+
+    handled = 0
+
+    def __init__(self, sock, handler_class):
+        super().__init__(sock.getsockname()[:2], handler_class, bind_and_activate=False)
+        self.socket.close()
+        self.socket = sock
+        self.server_name, self.server_port = sock.getsockname()[:2]
+        self.setup_environ()
+
+    def process_request(self, request, client_address):
+        self.handled += 1
+        super().process_request(request, client_address)
+
+
+class Worker:
+    def __init__(self, sock, app, max_requests, handler_class):
+        self.sock = sock
+        self.app = app
+        self.max_requests = max_requests
+        self.handler_class = handler_class
+        self.alive = True
+
+    def stop(self, signum, frame):
+        self.alive = False
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        # Ctrl-C や SIGHUP は master が受けてワーカーに SIGTERM を送る
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        server = WorkerServer(self.sock, self.handler_class)
+        server.set_app(self.app)
+        while self.alive and (self.max_requests is None or server.handled < self.max_requests):
+            try:
+                ready, _, _ = select.select([self.sock], [], [], 1.0)
+            except InterruptedError:
+                continue
+            if ready:
+                # 他のワーカーが先に accept した場合は何もせずに戻る
+                server._handle_request_noblock()
+
+
+class PreforkServer:
+    def __init__(
+        self,
+        load_app,
+        sock,
+        workers=None,
+        max_requests=None,
+        max_requests_jitter=0,
+        graceful_timeout=30,
+        handler_class=WSGIRequestHandler,
+    ):
+        self.load_app = load_app
+        self.sock = sock
+        self.worker_count = workers or default_workers()
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.handler_class = handler_class
+        self.workers = set()
+        self.signals = []
+
+    def preload(self):
+        self.app = self.load_app()
+        # ワーカーに DB の接続を持ち越さない（各ワーカーが最初のクエリで開き直す）
+        connections.close_all()
+        # 読み込んだオブジェクトを GC の対象から外し、ワーカーで参照カウント以外のページがコピーされないようにする
+        gc.collect()
+        gc.freeze()
+        self.sock.setblocking(False)
+
+    def spawn(self):
+        max_requests = self.max_requests
+        if max_requests:
+            # 全ワーカーが同時に入れ替わらないようにずらす
+            max_requests += random.randint(0, self.max_requests_jitter)
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                signal.set_wakeup_fd(-1)
+                os.close(self.wakeup[0])
+                os.close(self.wakeup[1])
+                # master で数えた値（ウォームアップなど）を各ワーカーで重ねて数えない
+                REGISTRY.start()
+                Worker(self.sock, self.app, max_requests, self.handler_class).run()
+            except Exception:
+                logger.exception("prefork worker crashed")
+                code = 1
+            finally:
+                # os._exit では atexit が動かないので、ここで書き出す
+                for receiver, result in worker_exit.send_robust(sender=PreforkServer):
+                    if isinstance(result, Exception):
+                        logger.error("worker_exit receiver %s failed", receiver, exc_info=result)
+                try:
+                    REGISTRY.flush()
+                except Exception:
+                    logger.exception("failed to flush metrics")
+                os._exit(code)
+        self.workers.add(pid)
+        return pid
+
+    def reap(self):
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            # exec し直す前のワーカーは self.workers にないので、回収するだけ
+            self.workers.discard(pid)
+
+    def kill_workers(self, signum):
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                self.workers.discard(pid)
+
+    def handle_signal(self, signum, frame):
+        self.signals.append(signum)
+
+    def install_signals(self):
+        self.wakeup = os.pipe()
+        for fd in self.wakeup:
+            os.set_blocking(fd, False)
+        signal.set_wakeup_fd(self.wakeup[1])
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGCHLD):
+            signal.signal(signum, self.handle_signal)
+
+    def wait(self, timeout):
+        try:
+            select.select([self.wakeup[0]], [], [], timeout)
+            os.read(self.wakeup[0], 1024)
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def run(self):
+        self.preload()
+        self.install_signals()
+        logger.info("prefork master %s: %s workers on %s", os.getpid(), self.worker_count, self.sock.getsockname())
+        while True:
+            self.reap()
+            while self.signals:
+                signum = self.signals.pop(0)
+                if signum in (signal.SIGTERM, signal.SIGINT):
+                    return self.stop()
+                if signum == signal.SIGHUP:
+                    return self.reload()
+            while len(self.workers) < self.worker_count:
+                self.spawn()
+            self.wait(1.0)
+
+    def stop(self):
+        """ワーカーに処理中のリクエストを返させてから止める。"""
+        self.kill_workers(signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            self.wait(0.1)
+            self.reap()
+        self.kill_workers(signal.SIGKILL)
+        while self.workers:
+            self.reap()
+            self.wait(0.1)
+        self.sock.close()
+
+    def reload(self):
+        """同じ引数で master を exec し直す。待ち受けソケットは閉じないので、その間の接続はバックログで待つ。"""
+        self.kill_workers(signal.SIGTERM)
+        os.environ[LISTEN_FD_ENV] = str(self.sock.fileno())
+        os.execv(sys.executable, [sys.executable] + sys.argv)
@@ -0,0 +1,110 @@
+import os
+import signal
+import socket
+import threading
+import time
+import urllib.request
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.template import engines
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from startup.first_response import measure
+from startup.management.commands import serve
+from startup.prefork import PreforkServer, choose_workers, default_workers
+from startup.warmup import template_names, warm_up
+
+
+class TestWarmUp(TestCase):
+    databases = {"default", "archive", "likes_0", "likes_1"}
+
+    def test_success_warm_up(self):
+        results = warm_up()
+        self.assertEqual(list(results), ["templates", "urls", "translations", "connections"])
+        self.assertGreater(results["urls"][0], 0)
+        self.assertIn("tweets/home.html", template_names(engines["django"]))
+
+    def test_success_measure_first_response(self):
+        timings = measure("/accounts/login/", warm=True)
+        self.assertEqual(timings["status"], "200 OK")
+        self.assertGreaterEqual(timings["time_to_first_response"], timings["first_response"])
+
+
+class TestAuditImports(TestCase):
+    def test_success_report(self):
+        out = StringIO()
+        call_command("audit_imports", "tweets", limit=50, stdout=out)
+        self.assertIn("tweets.models", out.getvalue())
+        self.assertNotIn("accounts.models", out.getvalue())
+
+
+def pid_app(environ, start_response):
+    if environ["PATH_INFO"] == "/slow":
+        time.sleep(0.5)
+    start_response("200 OK", [("Content-Type", "text/plain")])
+    return [str(os.getpid()).encode()]
+
+
+class TestPreforkServer(SimpleTestCase):
+    def start(self, **kwargs):
+        sock = socket.create_server(("127.0.0.1", 0))
+        pid = os.fork()
+        if pid == 0:
+            try:
+                PreforkServer(lambda: pid_app, sock, **kwargs).run()
+            finally:
+                os._exit(0)
+        port = sock.getsockname()[1]
+        sock.close()
+        self.addCleanup(self.stop, pid)
+        return pid, port
+
+    def stop(self, pid):
+        try:
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+        except (ProcessLookupError, ChildProcessError):
+            pass
+
+    def get(self, port, path="/"):
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=5) as response:
+            return response.read().decode()
+
+    def test_failure_serve_workers_with_local_cache(self):
+        with self.assertRaisesMessage(CommandError, "LocMemCache"):
+            call_command("serve", "--workers", "2", "--bind", "127.0.0.1:0")
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": "/tmp"}}
+    )
+    def test_success_serve_check_shared_cache(self):
+        stderr = StringIO()
+        serve.Command(stderr=stderr).check_shared_state(2)
+        self.assertIn("LocalTokenBucketStore", stderr.getvalue())
+        self.assertEqual(choose_workers(), default_workers())
+
+    def test_success_default_one_worker_with_local_cache(self):
+        self.assertEqual(choose_workers(), 1)
+        self.assertEqual(choose_workers(3), 3)
+
+    def test_success_recycle_workers(self):
+        _, port = self.start(workers=1, max_requests=2)
+        pids = [self.get(port) for _ in range(6)]
+        self.assertEqual(len(set(pids)), 3)
+        self.assertEqual(pids[0], pids[1])
+
+    def test_success_graceful_stop(self):
+        pid, port = self.start(workers=2, graceful_timeout=5)
+        self.get(port)
+        results = []
+        thread = threading.Thread(target=lambda: results.append(self.get(port, "/slow")))
+        thread.start()
+        time.sleep(0.2)
+        os.kill(pid, signal.SIGTERM)
+        thread.join()
+        # 処理中のリクエストは最後まで返してから止まる
+        self.assertEqual(len(results), 1)
+        os.waitpid(pid, 0)
+        with self.assertRaises(OSError):
+            self.get(port)
@@ -0,0 +1,91 @@
+import os
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.template import engines
+from django.template.backends.django import DjangoTemplates
+from django.template.loaders.app_directories import get_app_template_dirs
+from django.urls import URLResolver, get_resolver
+from django.utils import translation
+
+
+def template_names(engine):
+    """DIRS とアプリの templates ディレクトリにあるテンプレート名をすべて返す。"""
+    dirs = list(engine.dirs)
+    if engine.app_dirs:
+        dirs += get_app_template_dirs("templates")
+    names = set()
+    for directory in dirs:
+        for root, _, filenames in os.walk(directory):
+            for filename in filenames:
+                if filename.endswith((".html", ".txt", ".xml")):
+                    names.add(os.path.relpath(os.path.join(root, filename), directory).replace(os.sep, "/"))
+    return sorted(names)
+
+
+def precompile_templates():
+    """テンプレートを読み込んでおく。キャッシュするローダーなら最初のリクエストでのコンパイルがなくなる。"""
+    count = 0
+    for engine in engines.all():
+        if not isinstance(engine, DjangoTemplates):
+            continue
+        for name in template_names(engine):
+            engine.get_template(name)
+            count += 1
+    return count
+
+
+def resolve_urls(resolver=None):
+    """URL パターンの正規表現をコンパイルし、reverse() 用の辞書を作っておく。"""
+    resolver = resolver or get_resolver()
+    # reverse_dict を読むと resolver の中身が作られる
+    resolver.reverse_dict
+    count = 0
+    for pattern in resolver.url_patterns:
+        pattern.pattern.regex
+        if isinstance(pattern, URLResolver):
+            count += resolve_urls(pattern)
+        else:
+            count += 1
+    return count
+
+
+def open_connections():
+    """すべてのデータベースに接続しておく。CONN_MAX_AGE が 0 だと最初のリクエストの後で閉じられる。"""
+    for connection in connections.all():
+        connection.ensure_connection()
+    return len(connections.all())
+
+
+def load_translations():
+    """LANGUAGE_CODE の翻訳カタログを読み込んでおく（最初に有効にしたときに全アプリ分を読む）。"""
+    with translation.override(settings.LANGUAGE_CODE):
+        translation.gettext("")
+    return 1
+
+
+STEPS = [
+    ("templates", precompile_templates),
+    ("urls", resolve_urls),
+    ("translations", load_translations),
+    ("connections", open_connections),
+]
+
+
+def warm_up():
+    """ワーカーがリクエストを受ける前に、最初のリクエストで払うコストを先に払っておく。
+
+    {ステップ名: (件数, 秒数)} を返す。
+    """
+    results = {}
+    for name, step in STEPS:
+        started = time.perf_counter()
+        count = step()
+        results[name] = (count, time.perf_counter() - started)
+    return results
+
+
+def warm_up_on_startup():
+    if getattr(settings, "WARMUP_ON_STARTUP", False):
+        warm_up()
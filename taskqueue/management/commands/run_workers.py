@@ -0,0 +1,68 @@
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from taskqueue.queue import claim, execute, metrics, stats
+
+logger = logging.getLogger(__name__)
+
+
+def _run(task_obj):
+    try:
+        execute(task_obj)
+    finally:
+        # ワーカースレッドごとの DB 接続を閉じる
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "キューテーブルに登録されたタスクをワーカープールで実行します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument(
+            "--batch", type=int, default=None, help="一度に取り出すタスク数（既定はワーカー数の 2 倍）"
+        )
+        parser.add_argument("--poll-interval", type=float, default=1.0)
+        parser.add_argument("--once", action="store_true", help="実行可能なタスクがなくなったら終了する")
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        batch = options["batch"] or workers * 2
+        self.stdout.write(f"{workers} ワーカーで起動しました。")
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                while True:
+                    close_old_connections()
+                    tasks = claim(batch)
+                    if tasks:
+                        done, _ = wait([pool.submit(_run, task_obj) for task_obj in tasks])
+                        self.report_errors(done)
+                        continue
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll_interval"])
+        except KeyboardInterrupt:
+            pass
+        self.report()
+
+    def report_errors(self, futures):
+        # execute() はタスクの例外を記録するので、ここに来るのは結果を保存できなかったときなど
+        for future in futures:
+            error = future.exception()
+            if error is not None:
+                logger.error("task worker crashed", exc_info=error)
+                self.stderr.write(f"ワーカーでエラーが起きました: {error!r}")
+
+    def report(self):
+        for name, values in sorted(metrics.snapshot().items()):
+            self.stdout.write(
+                f"{name}: runs={values['runs']} done={values.get('done', 0)} retried={values.get('retried', 0)} "
+                f"failed={values.get('failed', 0)} avg={values['avg_seconds'] * 1000:.1f}ms"
+            )
+        for row in stats():
+            self.stdout.write(f"[queue] {row['name']} {row['status']}: {row['count']}")
@@ -0,0 +1,175 @@
+import logging
+import threading
+import time
+import traceback
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Count, Max, Q
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+def task(name, max_attempts=5):
+    """関数をタスクとして登録するデコレータ。payload はキーワード引数として渡される。"""
+
+    def decorator(func):
+        _registry[name] = (func, max_attempts)
+        return func
+
+    return decorator
+
+
+def get_handler(name):
+    return _registry[name][0]
+
+
+def enqueue(name, payload=None, *, idempotency_key=None, run_at=None, max_attempts=None):
+    if name not in _registry:
+        raise KeyError(f"未登録のタスクです: {name}")
+    if max_attempts is None:
+        max_attempts = _registry[name][1]
+    fields = {
+        "name": name,
+        "payload": payload or {},
+        "max_attempts": max_attempts,
+        "run_at": run_at or timezone.now(),
+    }
+    if idempotency_key is None:
+        return Task.objects.create(**fields)
+    try:
+        with transaction.atomic():
+            return Task.objects.create(idempotency_key=idempotency_key, **fields)
+    except IntegrityError:
+        return Task.objects.get(idempotency_key=idempotency_key)
+
+
+def enqueue_on_commit(name, payload=None, **kwargs):
+    """現在のトランザクションがコミットされた後にタスクを登録する。"""
+    transaction.on_commit(lambda: enqueue(name, payload, **kwargs))
+
+
+def backoff(attempts):
+    base = getattr(settings, "TASKQUEUE_RETRY_BACKOFF", 2)
+    limit = getattr(settings, "TASKQUEUE_RETRY_BACKOFF_MAX", 600)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), limit))
+
+
+def claim(limit=10):
+    """実行可能なタスクを最大 limit 件取り出して running にする。
+
+    ワーカーが落ちて running のまま残ったタスクは TASKQUEUE_LEASE 秒経つと再び取り出される。
+    """
+    now = timezone.now()
+    lease = timedelta(seconds=getattr(settings, "TASKQUEUE_LEASE", 300))
+    candidates = (
+        Task.objects.filter(
+            Q(status=Task.Status.PENDING, run_at__lte=now) | Q(status=Task.Status.RUNNING, updated_at__lt=now - lease)
+        )
+        .order_by("run_at")
+        .values_list("pk", "status", "updated_at")[:limit]
+    )
+    claimed = []
+    for pk, status, updated_at in candidates:
+        # 他のワーカーと取り合いになった場合は UPDATE の件数が 0 になる
+        updated = Task.objects.filter(pk=pk, status=status, updated_at=updated_at).update(
+            status=Task.Status.RUNNING, updated_at=now
+        )
+        if updated:
+            claimed.append(pk)
+    return list(Task.objects.filter(pk__in=claimed).order_by("run_at"))
+
+
+def execute(task_obj):
+    task_obj.attempts += 1
+    started = time.perf_counter()
+    try:
+        handler = get_handler(task_obj.name)
+    except KeyError:
+        # 登録がなくなったタスクはやり直しても実行できないので、すぐに失敗にする
+        task_obj.duration = 0.0
+        task_obj.last_error = f"未登録のタスクです: {task_obj.name}"
+        task_obj.status = Task.Status.FAILED
+        metrics.record(task_obj.name, "failed", task_obj.duration)
+        logger.error("task %s is not registered", task_obj)
+        return _save(task_obj)
+    try:
+        handler(**task_obj.payload)
+    except Exception:
+        task_obj.duration = time.perf_counter() - started
+        task_obj.last_error = traceback.format_exc()
+        if task_obj.attempts >= task_obj.max_attempts:
+            task_obj.status = Task.Status.FAILED
+            metrics.record(task_obj.name, "failed", task_obj.duration)
+            logger.error("task %s failed permanently", task_obj)
+        else:
+            task_obj.status = Task.Status.PENDING
+            task_obj.run_at = timezone.now() + backoff(task_obj.attempts)
+            metrics.record(task_obj.name, "retried", task_obj.duration)
+            logger.warning("task %s failed, retrying at %s", task_obj, task_obj.run_at)
+    else:
+        task_obj.duration = time.perf_counter() - started
+        task_obj.status = Task.Status.DONE
+        task_obj.last_error = ""
+        metrics.record(task_obj.name, "done", task_obj.duration)
+    return _save(task_obj)
+
+
+def _save(task_obj):
+    task_obj.updated_at = timezone.now()
+    task_obj.save(update_fields=["status", "attempts", "run_at", "last_error", "duration", "updated_at"])
+    return task_obj
+
+
+def run_pending(limit=100):
+    """実行可能なタスクをこのスレッドでまとめて実行する。テストや cron から使う。"""
+    return [execute(task_obj) for task_obj in claim(limit)]
+
+
+class TaskMetrics:
+    """プロセス内でのタスク名ごとの実行回数と実行時間の集計。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._counts = defaultdict(lambda: defaultdict(int))
+        self._durations = defaultdict(float)
+
+    def record(self, name, outcome, duration):
+        with self._lock:
+            self._counts[name][outcome] += 1
+            self._durations[name] += duration
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for name, counts in self._counts.items():
+                runs = sum(counts.values())
+                result[name] = {
+                    **counts,
+                    "runs": runs,
+                    "total_seconds": self._durations[name],
+                    "avg_seconds": self._durations[name] / runs if runs else 0.0,
+                }
+            return result
+
+
+metrics = TaskMetrics()
+
+
+def stats():
+    """キューテーブル全体のタスク名・状態ごとの件数と平均実行時間。"""
+    return list(
+        Task.objects.values("name", "status")
+        .annotate(count=Count("pk"), avg_duration=Avg("duration"), max_attempts=Max("attempts"))
+        .order_by("name", "status")
+    )
@@ -0,0 +1,108 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from taskqueue.models import Task
+from taskqueue.queue import enqueue, enqueue_on_commit, metrics, run_pending, task
+from tweets.models import Like, Tweet
+
+User = get_user_model()
+
+calls = []
+
+
+@task("tests.record")
+def record(value):
+    calls.append(value)
+
+
+@task("tests.fail", max_attempts=2)
+def fail():
+    raise ValueError("boom")
+
+
+class TestTaskQueue(TestCase):
+    def setUp(self):
+        calls.clear()
+        metrics.reset()
+
+    def test_success_run_pending(self):
+        enqueue("tests.record", {"value": 1})
+        run_pending()
+        self.assertEqual(calls, [1])
+        self.assertEqual(Task.objects.get().status, Task.Status.DONE)
+        self.assertEqual(metrics.snapshot()["tests.record"]["done"], 1)
+
+    def test_success_enqueue_with_idempotency_key(self):
+        first = enqueue("tests.record", {"value": 1}, idempotency_key="key")
+        second = enqueue("tests.record", {"value": 2}, idempotency_key="key")
+        self.assertEqual(first.pk, second.pk)
+        run_pending()
+        self.assertEqual(calls, [1])
+
+    def test_success_enqueue_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            enqueue_on_commit("tests.record", {"value": 1})
+            self.assertFalse(Task.objects.exists())
+        for callback in callbacks:
+            callback()
+        self.assertTrue(Task.objects.filter(name="tests.record").exists())
+
+    def test_success_not_run_before_run_at(self):
+        enqueue("tests.record", {"value": 1}, run_at=timezone.now() + timedelta(minutes=1))
+        run_pending()
+        self.assertEqual(calls, [])
+
+    def test_failure_retry_with_backoff(self):
+        enqueue("tests.fail")
+        run_pending()
+        task_obj = Task.objects.get()
+        self.assertEqual(task_obj.status, Task.Status.PENDING)
+        self.assertEqual(task_obj.attempts, 1)
+        self.assertGreater(task_obj.run_at, timezone.now())
+        self.assertIn("ValueError", task_obj.last_error)
+
+        Task.objects.update(run_at=timezone.now())
+        run_pending()
+        task_obj.refresh_from_db()
+        self.assertEqual(task_obj.status, Task.Status.FAILED)
+        self.assertEqual(metrics.snapshot()["tests.fail"]["failed"], 1)
+
+    def test_failure_enqueue_unregistered_task(self):
+        with self.assertRaises(KeyError):
+            enqueue("tests.not_exist")
+
+    def test_failure_run_unregistered_task(self):
+        # 登録を消したタスクが残っていても、running のまま取り出し直され続けない
+        Task.objects.create(name="tests.removed")
+        with self.assertLogs("taskqueue.queue", "ERROR"):
+            run_pending()
+        task_obj = Task.objects.get()
+        self.assertEqual(task_obj.status, Task.Status.FAILED)
+        self.assertEqual(task_obj.attempts, 1)
+        self.assertIn("tests.removed", task_obj.last_error)
+
+    def test_failure_run_workers_reports_errors(self):
+        enqueue("tests.record", {"value": 1})
+        stderr = StringIO()
+        with mock.patch("taskqueue.management.commands.run_workers.execute", side_effect=RuntimeError("boom")):
+            with self.assertLogs("taskqueue.management.commands.run_workers", "ERROR"):
+                call_command("run_workers", "--once", "--workers", "1", stdout=StringIO(), stderr=stderr)
+        self.assertIn("boom", stderr.getvalue())
+
+
+class TestReconcileLikeCounts(TestCase):
+    def test_success_reconcile(self):
+        user = User.objects.create_user(username="tester", password="testpassword")
+        tweet = Tweet.objects.create(user=user, content="test_content")
+        Like.objects.create(user=user, tweet=tweet)
+        Tweet.objects.update(like_count=10)
+        enqueue("tweets.reconcile_like_counts", {"tweet_ids": [tweet.pk]})
+        run_pending()
+        tweet.refresh_from_db()
+        self.assertEqual(tweet.like_count, 1)
@@ -1,6 +1,11 @@
 from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
 
 
 class TweetsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "tweets"
+
+    def ready(self):
+        # 各アプリの stages.py を読み込んでツイート作成後のステージを登録する
+        autodiscover_modules("stages")
@@ -0,0 +1,63 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import HttpResponseBadRequest
+from django.utils import timezone
+
+# タイムラインのキーセットページング用のカーソル。"<created_at のマイクロ秒>_<ツイート ID>" の形にする
+
+
+def encode_cursor(created_at, pk):
+    return f"{int(created_at.timestamp() * 1_000_000)}_{pk}"
+
+
+def decode_cursor(cursor):
+    timestamp, pk = cursor.split("_")
+    return datetime.fromtimestamp(int(timestamp) / 1_000_000, tz=timezone.utc), int(pk)
+
+
+def before_q(before, pk_field="pk"):
+    """(created_at, pk) が before より前の行に絞る Q。before が None なら絞らない。"""
+    if before is None:
+        return Q()
+    created_at, pk = before
+    return Q(created_at__lt=created_at) | Q(created_at=created_at, **{pk_field + "__lt": pk})
+
+
+def order_by_id():
+    """TIMELINE_ORDER_BY_ID なら、ツイートの ID（tweets.ids）が時刻順なので主キーだけで並べ、ページングする。"""
+    return getattr(settings, "TIMELINE_ORDER_BY_ID", False)
+
+
+def tweet_order():
+    return ("-pk",) if order_by_id() else ("-created_at", "-pk")
+
+
+def tweet_before_q(before):
+    """Tweet のタイムライン用の before_q。主キーで並べるときは created_at を見ない（主キーのインデックスだけで済む）。"""
+    if before is not None and order_by_id():
+        return Q(pk__lt=before[1])
+    return before_q(before)
+
+
+def next_cursor(tweets, limit):
+    """limit + 1 件読んだ結果から次のページのカーソルを返す。"""
+    if len(tweets) <= limit:
+        return None
+    return encode_cursor(tweets[limit - 1].created_at, tweets[limit - 1].pk)
+
+
+class CursorMixin:
+    """?before=<カーソル> を self.before に読み込む。不正なカーソルなら 400 を返す。"""
+
+    def get(self, request, *args, **kwargs):
+        cursor = request.GET.get("before")
+        if cursor:
+            try:
+                self.before = decode_cursor(cursor)
+            except ValueError:
+                return HttpResponseBadRequest("不正なカーソルです。")
+        else:
+            self.before = None
+        return super().get(request, *args, **kwargs)
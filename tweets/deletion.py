@@ -0,0 +1,84 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from notifications.models import Notification, NotificationCounter
+from taskqueue.queue import enqueue_on_commit
+from tweets import snapshots
+from tweets.models import Like, Tweet, TweetTag
+from tweets.sharding import like_shards
+from tweets.versions import bump_profile, bump_tweet
+
+
+def chunk_size():
+    return getattr(settings, "DELETION_CHUNK_SIZE", 1000)
+
+
+def iter_pk_chunks(queryset, size=None):
+    """queryset の主キーを size 件ずつ返す。各チャンクを消してから次を読むので、常に先頭から取り直す。"""
+    size = size or chunk_size()
+    while True:
+        pks = list(queryset.order_by("pk").values_list("pk", flat=True)[:size])
+        if not pks:
+            return
+        yield pks
+
+
+def delete_likes(queryset, update_counters=True):
+    """いいねを Python のモデルに読み込まずにチャンクごとに DELETE する。
+
+    いいねをシャーディングしている場合は各シャードで順に消す（ツイートとは別のデータベースなので JOIN しない）。
+    """
+    for alias in like_shards():
+        likes = Like.objects.using(alias)
+        for pks in iter_pk_chunks(queryset.using(alias)):
+            with transaction.atomic(), transaction.atomic(using=alias):
+                if update_counters:
+                    counts = dict(
+                        likes.filter(pk__in=pks).values_list("tweet_id").annotate(count=Count("pk")).order_by()
+                    )
+                    authors = Tweet.all_objects.filter(pk__in=counts).values_list("pk", "user_id")
+                    now = timezone.now()
+                    for tweet_id, user_id in authors:
+                        Tweet.all_objects.filter(pk=tweet_id).update(
+                            like_count=Greatest(F("like_count") - counts[tweet_id], 0), updated_at=now
+                        )
+                        bump_tweet(tweet_id)
+                        bump_profile(user_id)
+                likes.filter(pk__in=pks).delete()
+
+
+def delete_notifications(queryset):
+    for pks in iter_pk_chunks(queryset):
+        with transaction.atomic():
+            unread = (
+                Notification.objects.filter(pk__in=pks, is_read=False)
+                .values("recipient_id")
+                .annotate(count=Count("pk"))
+                .order_by()
+            )
+            for row in unread:
+                NotificationCounter.objects.filter(user_id=row["recipient_id"]).update(
+                    unread=Greatest(F("unread") - row["count"], 0)
+                )
+            Notification.objects.filter(pk__in=pks).delete()
+
+
+def delete_tweets(queryset):
+    """ツイートとそのいいね・通知を消す。ツイート自体のいいね数は消えるので更新しない。"""
+    for pks in iter_pk_chunks(queryset):
+        delete_likes(Like.objects.filter(tweet_id__in=pks), update_counters=False)
+        delete_notifications(Notification.objects.filter(tweet_id__in=pks))
+        TweetTag.objects.filter(tweet_id__in=pks).delete()
+        Tweet.all_objects.filter(pk__in=pks).delete()
+
+
+def soft_delete_tweet(tweet):
+    # すぐにタイムラインから消し、関連する行はバックグラウンドで削除する
+    Tweet.all_objects.filter(pk=tweet.pk).update(deleted_at=timezone.now())
+    bump_tweet(tweet.pk)
+    bump_profile(tweet.user_id)
+    snapshots.remove_tweets([tweet.pk])
+    enqueue_on_commit("tweets.purge_tweet", {"tweet_id": tweet.pk}, idempotency_key=f"purge-tweet:{tweet.pk}")
@@ -0,0 +1,145 @@
+import fcntl
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# 時刻順に並ぶ 64 ビットの ID（Snowflake 形式）。上位から順に
+#   41 ビット: EPOCH からのミリ秒 / 10 ビット: ワーカー ID / 12 ビット: 同じミリ秒の中の連番
+# SNOWFLAKE_IDS に入れたモデル（"tweets.Tweet" / "tweets.Like"）は、作ったときにこの ID を主キーにする。
+# 自動採番の ID はどれも MIN_ID より小さいので、切り替えた後の行は既存の行より後に並ぶ。
+# ワーカー ID は、SNOWFLAKE_WORKER_IDS のうち同じホストの他のプロセスが使っていないものを
+# SNOWFLAKE_LOCK_DIR のファイルロックで取る（ロックはプロセスが終わると外れる）。
+# 複数のホストで動かす場合は、ホストごとに重ならない SNOWFLAKE_WORKER_IDS を設定すること。
+
+EPOCH = datetime(2010, 1, 1, tzinfo=dt_timezone.utc)
+EPOCH_MS = int(EPOCH.timestamp() * 1000)
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+TIME_SHIFT = WORKER_BITS + SEQUENCE_BITS
+MAX_WORKER = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+# EPOCH から約 9 分後の ID。自動採番の ID がここまで大きくなることはない
+MIN_ID = 1 << 41
+
+
+def enabled(label):
+    return label in getattr(settings, "SNOWFLAKE_IDS", ())
+
+
+def is_snowflake(pk):
+    return pk >= MIN_ID
+
+
+def compose(ms, worker_id, sequence):
+    return (max(ms - EPOCH_MS, 0) << TIME_SHIFT) | (worker_id << SEQUENCE_BITS) | sequence
+
+
+def to_ms(dt):
+    return int(dt.timestamp() * 1000)
+
+
+def datetime_of(pk):
+    """ID に埋め込まれた作成時刻（ミリ秒単位）。"""
+    return datetime.fromtimestamp(((pk >> TIME_SHIFT) + EPOCH_MS) / 1000, tz=dt_timezone.utc)
+
+
+def legacy_id(pk, created_at):
+    """自動採番の ID を、created_at の時刻と元の ID の下位 22 ビットから作った ID に置き換える（rekey_tweets 用）。
+
+    同じミリ秒に作られ、元の ID の下位 22 ビットが同じ行がなければ重ならない。
+    """
+    # EPOCH 直後（やそれより前）のツイートも MIN_ID 以上にする
+    return max(compose(to_ms(created_at), 0, 0), MIN_ID) | (pk & ((1 << TIME_SHIFT) - 1))
+
+
+class IdGenerator:
+    def __init__(self, worker_id):
+        if not 0 <= worker_id <= MAX_WORKER:
+            raise ImproperlyConfigured(f"Snowflake のワーカー ID は 0〜{MAX_WORKER} で指定してください: {worker_id}")
+        self.worker_id = worker_id
+        self.lock = threading.Lock()
+        self.last_ms = -1
+        self.sequence = 0
+        self.past_sequence = 0
+
+    def next_id(self):
+        with self.lock:
+            now = to_ms(datetime.now(dt_timezone.utc))
+            if now <= self.last_ms:
+                # 同じミリ秒（または時計が戻った）なら、最後に使った時刻のまま連番を進める
+                now = self.last_ms
+                self.sequence = (self.sequence + 1) & MAX_SEQUENCE
+                if self.sequence == 0:
+                    now = self._wait_after(self.last_ms)
+            else:
+                self.sequence = 0
+            self.last_ms = now
+            return compose(now, self.worker_id, self.sequence)
+
+    def for_datetime(self, dt):
+        """過去の時刻の ID（取り込みなどで created_at の順に並べたい行に使う）。"""
+        with self.lock:
+            self.past_sequence = (self.past_sequence + 1) & MAX_SEQUENCE
+            return compose(to_ms(dt), self.worker_id, self.past_sequence)
+
+    def _wait_after(self, ms):
+        while True:
+            now = to_ms(datetime.now(dt_timezone.utc))
+            if now > ms:
+                return now
+            time.sleep(0.0001)
+
+
+_lock = threading.Lock()
+_generator = None
+_generator_pid = None
+# ワーカー ID のロックを持っているファイル。プロセスが終わるまで閉じない
+_held = []
+
+
+def claim_worker_id():
+    directory = getattr(settings, "SNOWFLAKE_LOCK_DIR", None) or os.path.join(tempfile.gettempdir(), "snowflake-ids")
+    os.makedirs(directory, exist_ok=True)
+    for worker_id in getattr(settings, "SNOWFLAKE_WORKER_IDS", None) or range(MAX_WORKER + 1):
+        fd = os.open(os.path.join(directory, f"{worker_id}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # fork で受け継いだ親のロックとも重なるので、子プロセスは別の ID を取る
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            continue
+        _held.append(fd)
+        return worker_id
+    raise ImproperlyConfigured(
+        "空いている Snowflake のワーカー ID がありません（SNOWFLAKE_WORKER_IDS を広げてください）。"
+    )
+
+
+def generator():
+    """このプロセスの IdGenerator。fork した子プロセスでは別のワーカー ID で作り直す。"""
+    global _generator, _generator_pid
+    with _lock:
+        if _generator is None or _generator_pid != os.getpid():
+            _generator = IdGenerator(claim_worker_id())
+            _generator_pid = os.getpid()
+        return _generator
+
+
+def next_tweet_id():
+    # Tweet の主キーの default。SNOWFLAKE_IDS に入っていなければ None（自動採番）を返す
+    return generator().next_id() if enabled("tweets.Tweet") else None
+
+
+def next_like_id():
+    return generator().next_id() if enabled("tweets.Like") else None
+
+
+def tweet_id_for(dt):
+    """dt に作られたツイートとして並ぶ ID。SNOWFLAKE_IDS に入っていなければ None（自動採番）。"""
+    return generator().for_datetime(dt) if enabled("tweets.Tweet") else None
@@ -0,0 +1,127 @@
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from tweets import ids
+from tweets.models import Like, Tweet
+from tweets.sharding import shard_for
+
+# いいね・いいね解除はそれぞれ最大 2 文で済ませる。
+# 1 文目で Like を INSERT ... ON CONFLICT DO NOTHING / DELETE し、
+# 変化があれば 2 文目の UPDATE ... RETURNING でカウンタを更新しつつ新しい値を読む。
+# 変化がなければ 2 文目は SELECT でカウンタを読むだけになる。
+# いいねが default 以外のシャードにある場合は 1 文目でツイートの存在を確かめられないので、
+# 2 文目で消されたツイートだと分かったら 1 文目を取り消す。
+
+
+def _tables():
+    quote = connection.ops.quote_name
+    return quote(Like._meta.db_table), quote(Tweet._meta.db_table)
+
+
+def _like_values(tweet_id, user_id):
+    """INSERT する列と値。SNOWFLAKE_IDS に "tweets.Like" があれば時刻順の ID も渡す（なければ自動採番）。"""
+    columns = ["tweet_id", "user_id", "created_at"]
+    params = [tweet_id, user_id, timezone.now()]
+    like_id = ids.next_like_id()
+    if like_id is not None:
+        columns.insert(0, "id")
+        params.insert(0, like_id)
+    return ", ".join(columns), ", ".join(["%s"] * len(params)), params
+
+
+def _read_count(cursor, tweet_id):
+    _, tweet_table = _tables()
+    cursor.execute(f"SELECT like_count, user_id FROM {tweet_table} WHERE id = %s AND deleted_at IS NULL", [tweet_id])
+    row = cursor.fetchone()
+    if row is None:
+        raise Tweet.DoesNotExist
+    return row
+
+
+def _update_count(cursor, tweet_id, delta):
+    _, tweet_table = _tables()
+    cursor.execute(
+        f"UPDATE {tweet_table} SET like_count = CASE WHEN like_count + %s > 0 THEN like_count + %s ELSE 0 END, "
+        "updated_at = %s WHERE id = %s AND deleted_at IS NULL RETURNING like_count, user_id",
+        [delta, delta, timezone.now(), tweet_id],
+    )
+    return cursor.fetchone()
+
+
+def _like_on_shard(alias, tweet_id, user_id):
+    like_table, _ = _tables()
+    columns, placeholders, params = _like_values(tweet_id, user_id)
+    with transaction.atomic(using=alias), connections[alias].cursor() as shard:
+        shard.execute(
+            f"INSERT INTO {like_table} ({columns}) VALUES ({placeholders}) ON CONFLICT DO NOTHING",
+            params,
+        )
+        inserted = shard.rowcount > 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            if not inserted:
+                return (False, *_read_count(cursor, tweet_id))
+            row = _update_count(cursor, tweet_id, 1)
+        if row is None:
+            # シャードのトランザクションごと巻き戻す
+            raise Tweet.DoesNotExist
+        return (True, *row)
+
+
+def _unlike_on_shard(alias, tweet_id, user_id):
+    like_table, _ = _tables()
+    with transaction.atomic(using=alias), connections[alias].cursor() as shard:
+        shard.execute(f"DELETE FROM {like_table} WHERE tweet_id = %s AND user_id = %s", [tweet_id, user_id])
+        deleted = shard.rowcount > 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            if not deleted:
+                return (False, *_read_count(cursor, tweet_id))
+            row = _update_count(cursor, tweet_id, -1)
+        if row is None:
+            raise Tweet.DoesNotExist
+        return (True, *row)
+
+
+def like(tweet_id, user_id):
+    """いいねして (いいねが増えたか, いいね数, ツイートの投稿者 ID) を返す。"""
+    alias = shard_for(tweet_id)
+    if alias != "default":
+        return _like_on_shard(alias, tweet_id, user_id)
+    like_table, tweet_table = _tables()
+    columns, placeholders, params = _like_values(tweet_id, user_id)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {like_table} ({columns}) "
+            f"SELECT {placeholders} WHERE EXISTS (SELECT 1 FROM {tweet_table} WHERE id = %s AND deleted_at IS NULL) "
+            "ON CONFLICT DO NOTHING",
+            [*params, tweet_id],
+        )
+        if cursor.rowcount == 0:
+            return (False, *_read_count(cursor, tweet_id))
+        cursor.execute(
+            f"UPDATE {tweet_table} SET like_count = like_count + 1, updated_at = %s "
+            "WHERE id = %s RETURNING like_count, user_id",
+            [timezone.now(), tweet_id],
+        )
+        return (True, *cursor.fetchone())
+
+
+def unlike(tweet_id, user_id):
+    """いいねを解除して (いいねが減ったか, いいね数, ツイートの投稿者 ID) を返す。"""
+    alias = shard_for(tweet_id)
+    if alias != "default":
+        return _unlike_on_shard(alias, tweet_id, user_id)
+    like_table, tweet_table = _tables()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {like_table} WHERE tweet_id = %s AND user_id = %s "
+            f"AND EXISTS (SELECT 1 FROM {tweet_table} WHERE id = %s AND deleted_at IS NULL)",
+            [tweet_id, user_id, tweet_id],
+        )
+        if cursor.rowcount == 0:
+            return (False, *_read_count(cursor, tweet_id))
+        cursor.execute(
+            f"UPDATE {tweet_table} SET like_count = CASE WHEN like_count > 0 THEN like_count - 1 ELSE 0 END, "
+            "updated_at = %s WHERE id = %s RETURNING like_count, user_id",
+            [timezone.now(), tweet_id],
+        )
+        return (True, *cursor.fetchone())
@@ -0,0 +1,73 @@
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+
+from loadtest.runner import cpu_ms
+from tweets.models import Tweet
+from tweets.timeline import timeline_items
+from tweets.viewer import attach_viewer_state
+
+User = get_user_model()
+
+
+def allocated_kb(func):
+    """func() の結果が保持しているメモリと、読み込み中のピーク（KB）。"""
+    tracemalloc.start()
+    try:
+        result = func()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return current / 1024, peak / 1024
+
+
+class Command(BaseCommand):
+    help = "ホームの 1 ページ分のツイートを、モデルのインスタンスと TimelineItem で読んだときのメモリと読み込み・描画時間を比べます。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tweets", type=int, default=50)
+        parser.add_argument("--iterations", type=int, default=200)
+
+    def handle(self, *args, **options):
+        count = options["tweets"]
+        iterations = options["iterations"]
+        # 計測用のデータは最後にロールバックする
+        with transaction.atomic():
+            user = User.objects.create_user(username="bench_timeline_user")
+            Tweet.objects.bulk_create(
+                [Tweet(user=user, content=f"timeline benchmark tweet {i}") for i in range(count)]
+            )
+            queryset = Tweet.objects.filter(user=user).order_by("-created_at", "-pk")
+            request = RequestFactory().get("/tweets/home/")
+            request.user = user
+
+            def load_models():
+                tweets = attach_viewer_state(user, queryset.select_related("user")[:count])
+                for tweet in tweets:
+                    # 以前のテンプレートが tweet.user.username で読んでいたもの
+                    tweet.username = tweet.user.username
+                return tweets
+
+            def load_items():
+                return attach_viewer_state(user, timeline_items(queryset[:count]))
+
+            rows = []
+            for label, load in (("model", load_models), ("item", load_items)):
+                tweets = load()
+                retained_kb, peak_kb = allocated_kb(load)
+                load_ms = cpu_ms(load, iterations)
+                render_ms = cpu_ms(
+                    lambda: render_to_string("tweets/home.html", {"tweets": tweets}, request), iterations
+                )
+                rows.append((label, retained_kb, peak_kb, load_ms, render_ms))
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{count} 件")
+        self.stdout.write(f"{'read model':<10} {'retained KB':>12} {'peak KB':>9} {'load ms':>9} {'render ms':>10}")
+        for label, retained_kb, peak_kb, load_ms, render_ms in rows:
+            self.stdout.write(f"{label:<10} {retained_kb:>12.1f} {peak_kb:>9.1f} {load_ms:>9.3f} {render_ms:>10.3f}")
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from tweets.rekeying import rekey_tweets
+
+
+class Command(BaseCommand):
+    help = (
+        "自動採番の ID のツイートを created_at 順の時刻順 ID に振り直します。"
+        "SNOWFLAKE_IDS に tweets.Tweet を入れた後に実行し、終わったら TIMELINE_ORDER_BY_ID を有効にしてください。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size", type=int, help="1 回に振り直すツイートの件数（既定は DELETION_CHUNK_SIZE）"
+        )
+
+    def handle(self, *args, **options):
+        count = rekey_tweets(options["chunk_size"])
+        self.stdout.write(f"ツイート {count} 件の ID を振り直しました。")
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from tweets.resharding import reshard_likes
+from tweets.sharding import like_shards
+
+
+class Command(BaseCommand):
+    help = "いいねを新しいシャードの並びに移します。移し終えたら LIKE_SHARDS を --to の並びに変えてもう一度実行してください。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="source", help="今の並び（カンマ区切りのエイリアス、既定は LIKE_SHARDS）")
+        parser.add_argument("--to", dest="target", required=True, help="新しい並び（カンマ区切りのエイリアス）")
+        parser.add_argument("--chunk-size", type=int, help="1 回に読むいいねの件数（既定は DELETION_CHUNK_SIZE）")
+
+    def handle(self, *args, **options):
+        source = options["source"].split(",") if options["source"] else like_shards()
+        target = options["target"].split(",")
+        allowed = {"default", *getattr(settings, "LIKE_SHARD_DATABASES", ())}
+        unknown = sorted(set(source + target) - allowed)
+        if unknown:
+            raise CommandError(f"LIKE_SHARD_DATABASES にないデータベースです: {', '.join(unknown)}")
+        moved = reshard_likes(source, target, options["chunk_size"])
+        self.stdout.write(f"いいね {moved} 件を {','.join(target)} の並びに移しました。")
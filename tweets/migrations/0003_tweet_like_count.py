@@ -0,0 +1,27 @@
+# Generated by Django 4.1.13 on 2026-10-18 22:39
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_like_count(apps, schema_editor):
+    Tweet = apps.get_model("tweets", "Tweet")
+    Like = apps.get_model("tweets", "Like")
+    likes = Like.objects.filter(tweet=OuterRef("pk")).order_by().values("tweet").annotate(count=Count("pk"))
+    Tweet.objects.update(like_count=Coalesce(Subquery(likes.values("count")), 0))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tweets", "0002_like_like_onlyonelike"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tweet",
+            name="like_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_like_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.13 on 2026-10-18 22:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tweets", "0003_tweet_like_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tweet",
+            name="deleted_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
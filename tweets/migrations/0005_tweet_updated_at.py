@@ -0,0 +1,24 @@
+# Generated by Django 4.1.13 on 2026-10-18 22:56
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_created_at(apps, schema_editor):
+    Tweet = apps.get_model("tweets", "Tweet")
+    Tweet.objects.update(updated_at=F("created_at"))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tweets", "0004_tweet_deleted_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tweet",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(copy_created_at, migrations.RunPython.noop),
+    ]
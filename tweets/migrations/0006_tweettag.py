@@ -0,0 +1,65 @@
+# Generated by Django 4.1.13 on 2026-10-18 23:03
+
+import re
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# tweets.tags の抽出をこのマイグレーションを書いた時点のまま写したもの（後で tweets.tags が変わっても結果を変えない）
+HASHTAG_RE = re.compile(r"(?<![\w#&])#(\w+)")
+MENTION_RE = re.compile(r"(?<![\w@])@([\w.@+-]+)")
+MAX_LENGTH = 150
+
+
+def extract_tags(content):
+    tags = ["#" + name.casefold()[:MAX_LENGTH] for name in HASHTAG_RE.findall(content)]
+    tags += ["@" + username.rstrip(".")[:MAX_LENGTH] for username in MENTION_RE.findall(content)]
+    return list(dict.fromkeys(tag for tag in tags if len(tag) > 1))
+
+
+def index_existing_tweets(apps, schema_editor):
+    Tweet = apps.get_model("tweets", "Tweet")
+    TweetTag = apps.get_model("tweets", "TweetTag")
+    rows = []
+    # 論理削除されたツイートはタグのタイムラインに出さない
+    tweets = Tweet.objects.filter(deleted_at__isnull=True).only("content", "created_at")
+    for tweet in tweets.iterator(chunk_size=1000):
+        rows += [
+            TweetTag(tag=tag, tweet_id=tweet.pk, created_at=tweet.created_at) for tag in extract_tags(tweet.content)
+        ]
+        if len(rows) >= 1000:
+            TweetTag.objects.bulk_create(rows)
+            rows = []
+    TweetTag.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tweets", "0005_tweet_updated_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TweetTag",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("tag", models.CharField(max_length=151)),
+                ("created_at", models.DateTimeField()),
+                (
+                    "tweet",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="tags", to="tweets.tweet"
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="tweettag",
+            index=models.Index(fields=["tag", "created_at", "tweet"], name="tweettag_timeline"),
+        ),
+        migrations.AddConstraint(
+            model_name="tweettag",
+            constraint=models.UniqueConstraint(fields=("tag", "tweet"), name="OnlyOneTagPerTweet"),
+        ),
+        migrations.RunPython(index_existing_tweets, migrations.RunPython.noop),
+    ]
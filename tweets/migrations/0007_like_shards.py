@@ -0,0 +1,38 @@
+# Generated by Django 4.1.13 on 2026-10-18 23:21
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# いいねをシャードに置けるよう、外部キーの DB の制約を外す。制約は設定によらずモデルで決まるので、
+# シャーディングしない（LIKE_SHARDS が空の）ときも default の参照整合性はデータベースでは保証されない。
+# いいねを残したままツイートやユーザーの行を消さないよう、削除は Django の CASCADE か削除タスクを通すこと。
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("tweets", "0006_tweettag"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="like",
+            name="tweet",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="likes",
+                to="tweets.tweet",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="like",
+            name="user",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="likes_given",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.13 on 2026-10-18 23:48
+
+from django.db import migrations, models
+import tweets.ids
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tweets", "0007_like_shards"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="like",
+            name="id",
+            field=models.BigAutoField(default=tweets.ids.next_like_id, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name="tweet",
+            name="id",
+            field=models.BigAutoField(default=tweets.ids.next_tweet_id, primary_key=True, serialize=False),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.13 on 2026-10-19 00:01
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tweets", "0008_snowflake_ids"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="like",
+            name="created_at",
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AlterField(
+            model_name="tweet",
+            name="created_at",
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
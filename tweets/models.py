@@ -1,21 +1,103 @@
 from django.conf import settings
 from django.db import models
-from django.db.models import UniqueConstraint
+from django.db.models import Count, Index, UniqueConstraint
+from django.utils import timezone
+
+from tweets import ids, sharding
+
+
+class TweetManager(models.Manager):
+    # 論理削除されたツイートはどのタイムラインにも出さない
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
 
 
 class Tweet(models.Model):
+    # SNOWFLAKE_IDS に入っていれば時刻順の ID（tweets.ids）、なければ自動採番
+    id = models.BigAutoField(primary_key=True, default=ids.next_tweet_id)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     content = models.TextField(max_length=200)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # auto_now_add だと取り込みや移し替えで元の時刻を渡せないので、既定値にする
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    # いいね数が変わったときにも更新する（条件付き GET の Last-Modified に使う）
+    updated_at = models.DateTimeField(auto_now=True)
+    # いいね数の非正規化カウンタ。ずれた場合は tweets.reconcile_like_counts タスクで修復する
+    like_count = models.PositiveIntegerField(default=0)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = TweetManager()
+    all_objects = models.Manager()
+
+
+class LikeManager(models.Manager):
+    # LIKE_SHARDS でいいねを分けている場合も、ここを通せばシャードを意識せずに読める
+
+    def create(self, **kwargs):
+        # QuerySet.create() はインスタンスを見ずに書き込み先を決めるので、save() でルーターに振り分けさせる
+        like = self.model(**kwargs)
+        like.save(force_insert=True, using=self._db)
+        return like
+
+    def for_tweet(self, tweet_id):
+        return self.db_manager(sharding.shard_for(tweet_id)).filter(tweet_id=tweet_id)
+
+    def scatter(self, build, aliases=None):
+        """build(各シャードの QuerySet) を並列に評価し、結果をつなげたリストを返す。"""
+        results = sharding.scatter(lambda alias: list(build(self.db_manager(alias).all())), aliases)
+        return [row for rows in results for row in rows]
+
+    def for_tweets(self, tweet_ids, build):
+        """tweet_ids のあるシャードにだけ build(QuerySet) を投げる。"""
+        groups = sharding.group_by_shard(tweet_ids)
+        return self.scatter(lambda queryset: build(queryset.filter(tweet_id__in=groups[queryset.db])), groups)
+
+    def liked_tweet_ids(self, user_id, tweet_ids):
+        return self.for_tweets(
+            tweet_ids, lambda queryset: queryset.filter(user_id=user_id).values_list("tweet_id", flat=True)
+        )
+
+    def given_by(self, user_id):
+        """ユーザーがいいねした (tweet_id, created_at) を新しい順に返す。"""
+        rows = self.scatter(lambda queryset: queryset.filter(user_id=user_id).values_list("tweet_id", "created_at"))
+        return sorted(rows, key=lambda row: row[1], reverse=True)
+
+    def counts(self, tweet_ids=None):
+        """{tweet_id: いいね数} を返す。tweet_ids を省略するとすべてのツイートを数える。"""
+
+        def build(queryset):
+            return queryset.order_by().values_list("tweet_id").annotate(count=Count("pk"))
+
+        rows = self.scatter(build) if tweet_ids is None else self.for_tweets(tweet_ids, build)
+        return dict(rows)
 
 
 class Like(models.Model):
-    tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE, related_name="likes")
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="likes_given")
-    created_at = models.DateTimeField(auto_now_add=True)
+    # 時刻順の ID はシャードをまたいでも重ならない
+    id = models.BigAutoField(primary_key=True, default=ids.next_like_id)
+    # シャードには tweets_tweet や accounts_user のテーブルがないので、外部キーに DB の制約を付けない。
+    # シャーディングしない場合も制約はないので、Tweet や User を消すときは Django の CASCADE（削除タスク）に任せる
+    tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE, related_name="likes", db_constraint=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="likes_given", db_constraint=False
+    )
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    objects = LikeManager()
 
     class Meta:
         constraints = [UniqueConstraint(fields=["tweet", "user"], name="OnlyOneLike")]
 
     def __str__(self):
         return f"{self.user}が{self.tweet.user}のツイートをいいねした：「{self.tweet.content}」"
+
+
+class TweetTag(models.Model):
+    # ハッシュタグ（"#python"、小文字にそろえる）とメンション（"@username"）からツイートを引く転置インデックス
+    tag = models.CharField(max_length=151)
+    tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE, related_name="tags")
+    # ツイートの created_at をコピーしておき、(tag, created_at, tweet_id) のキーセットでページングする
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [UniqueConstraint(fields=["tag", "tweet"], name="OnlyOneTagPerTweet")]
+        indexes = [Index(fields=["tag", "created_at", "tweet"], name="tweettag_timeline")]
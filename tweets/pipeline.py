@@ -0,0 +1,72 @@
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from metrics.collectors import record_pipeline_stage
+from taskqueue.queue import enqueue
+
+logger = logging.getLogger(__name__)
+
+# ツイートを作った後の副作用（タグの索引、キャッシュの無効化など）をステージとして登録し、コミット後に実行する。
+# ステージは func(tweets) の形で、同じ呼び出しで作ったツイートをまとめて受け取る。
+# TWEET_PIPELINE でステージごとに "inline"（コミット直後にその場で）か "deferred"（taskqueue のワーカーで）かを選ぶ。
+# deferred のステージは失敗するとまとめてやり直されるので、どのステージも何度実行してもよいように書くこと。
+
+INLINE = "inline"
+DEFERRED = "deferred"
+
+_stages = {}
+
+
+def stage(name, mode=INLINE):
+    """func(tweets) をツイート作成後のステージとして登録するデコレータ。各アプリの stages.py で使う。"""
+
+    def decorator(func):
+        _stages[name] = (func, mode)
+        return func
+
+    return decorator
+
+
+def stage_mode(name):
+    return getattr(settings, "TWEET_PIPELINE", {}).get(name, _stages[name][1])
+
+
+def run_stage(name, tweets, mode):
+    started = time.perf_counter()
+    try:
+        _stages[name][0](tweets)
+    finally:
+        record_pipeline_stage(name, mode, time.perf_counter() - started)
+
+
+def run_inline(tweets, names):
+    for name in names:
+        try:
+            run_stage(name, tweets, INLINE)
+        except Exception:
+            # ツイートはもう保存されているので、1 つのステージの失敗で投稿を失敗にしない
+            logger.exception("tweet pipeline stage %s failed", name)
+
+
+def run_deferred(tweets, names):
+    for name in names:
+        run_stage(name, tweets, DEFERRED)
+
+
+def tweets_created(tweets):
+    """作ったツイートをパイプラインに渡す。ステージはトランザクションがコミットされた後に実行する。"""
+    tweets = list(tweets)
+    if not tweets:
+        return
+    inline = [name for name in _stages if stage_mode(name) == INLINE]
+    deferred = [name for name in _stages if stage_mode(name) == DEFERRED]
+
+    def run():
+        run_inline(tweets, inline)
+        if deferred:
+            enqueue("tweets.run_pipeline", {"tweet_ids": [tweet.pk for tweet in tweets], "stages": deferred})
+
+    transaction.on_commit(run)
@@ -0,0 +1,54 @@
+from django.db import transaction
+
+from notifications.delivery import aggregation_key
+from notifications.models import Notification
+from tweets import snapshots
+from tweets.deletion import chunk_size
+from tweets.ids import MIN_ID, legacy_id
+from tweets.models import Like, Tweet, TweetTag
+from tweets.sharding import shard_for
+
+
+def move_likes(mapping):
+    """いいねの tweet_id を新しい ID に書き換える。置き場所のシャードが変わるものは、コピーしてから元のシャードから消す。"""
+    for old, new in mapping.items():
+        source, target = shard_for(old), shard_for(new)
+        if source == target:
+            Like.objects.using(source).filter(tweet_id=old).update(tweet_id=new)
+            continue
+        rows = list(Like.objects.using(source).filter(tweet_id=old).values_list("user_id", "created_at"))
+        if not rows:
+            continue
+        with transaction.atomic(using=target):
+            Like.objects.using(target).bulk_create(
+                [Like(tweet_id=new, user_id=user_id, created_at=created_at) for user_id, created_at in rows],
+                ignore_conflicts=True,
+            )
+        Like.objects.using(source).filter(tweet_id=old).delete()
+
+
+def rekey_tweets(size=None):
+    """自動採番の ID のツイートを created_at から作った時刻順の ID（tweets.ids.legacy_id）に振り直し、件数を返す。
+
+    新しい ID は元の ID と created_at だけで決まるので、途中で止まっても同じ引数でやり直せる。
+    いいねを先に移してから、ツイート・タグ・通知の ID をチャンクごとに 1 つのトランザクションで書き換える。
+    振り直したツイートの URL は変わる。アーカイブ済みのツイートは元の ID のまま残す。
+    """
+    size = size or chunk_size()
+    count = 0
+    while True:
+        rows = list(Tweet.all_objects.filter(pk__lt=MIN_ID).order_by("pk").values_list("pk", "created_at")[:size])
+        if not rows:
+            return count
+        mapping = {pk: legacy_id(pk, created_at) for pk, created_at in rows}
+        move_likes(mapping)
+        with transaction.atomic():
+            for old, new in mapping.items():
+                Tweet.all_objects.filter(pk=old).update(id=new)
+                TweetTag.objects.filter(tweet_id=old).update(tweet_id=new)
+                Notification.objects.filter(tweet_id=old).update(
+                    tweet_id=new, aggregation_key=aggregation_key(Notification.Verb.LIKE, new)
+                )
+        # 古い ID の行を持つホームのスナップショットは捨てて作り直させる
+        snapshots.remove_tweets(mapping)
+        count += len(mapping)
@@ -0,0 +1,48 @@
+from collections import defaultdict
+
+from django.db import transaction
+
+from tweets.deletion import chunk_size
+from tweets.models import Like
+from tweets.sharding import shard_for
+
+
+def reshard_likes(source, target, size=None):
+    """source の並びで置いたいいねを target の並びに移し、移した件数を返す。
+
+    各シャードのいいねを主キー順に読み、置き場所が変わる行だけを新しいシャードにコピーしてから元のシャードから消す。
+    コピーは (tweet, user) の重複を無視するので、途中で止まっても同じ引数でやり直せる。
+    移している間に古い並びに書かれたいいねは、LIKE_SHARDS を target に切り替えた後にもう一度実行して移す。
+    """
+    size = size or chunk_size()
+    moved = 0
+    for alias in source:
+        last_pk = 0
+        while True:
+            rows = list(
+                Like.objects.using(alias)
+                .filter(pk__gt=last_pk)
+                .order_by("pk")
+                .values_list("pk", "tweet_id", "user_id", "created_at")[:size]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            by_shard = defaultdict(list)
+            for row in rows:
+                new_alias = shard_for(row[1], target)
+                if new_alias != alias:
+                    by_shard[new_alias].append(row)
+            for new_alias, rows in by_shard.items():
+                # 主キーは移し先で振り直す（シャードごとの自動採番は重なりうる）
+                with transaction.atomic(using=new_alias):
+                    Like.objects.using(new_alias).bulk_create(
+                        [
+                            Like(tweet_id=tweet_id, user_id=user_id, created_at=created_at)
+                            for _, tweet_id, user_id, created_at in rows
+                        ],
+                        ignore_conflicts=True,
+                    )
+                Like.objects.using(alias).filter(pk__in=[row[0] for row in rows]).delete()
+                moved += len(rows)
+    return moved
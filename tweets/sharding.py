@@ -0,0 +1,102 @@
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connections
+
+# いいね（tweets.Like）を tweet_id のハッシュで LIKE_SHARDS のデータベースに振り分ける。
+# 1 つのツイートのいいねは必ず同じシャードにあるので、ツイート単位の読み書きは 1 つのシャードで済む。
+# 「ユーザーがいいねしたツイート」のようにシャードをまたぐ読み取りは scatter で各シャードに並列に投げて集める。
+# LIKE_SHARDS が空なら default だけを使う（シャーディングしない）。
+
+
+def like_shards():
+    return list(getattr(settings, "LIKE_SHARDS", None) or ["default"])
+
+
+def is_sharded():
+    return like_shards() != ["default"]
+
+
+def shard_for(tweet_id, shards=None):
+    """tweet_id のいいねを置くデータベースのエイリアス。プロセスをまたいで同じ値になるよう crc32 を使う。"""
+    shards = shards or like_shards()
+    if len(shards) == 1:
+        return shards[0]
+    return shards[zlib.crc32(str(tweet_id).encode()) % len(shards)]
+
+
+def group_by_shard(tweet_ids, shards=None):
+    """{エイリアス: [tweet_id, ...]} を返す。"""
+    groups = defaultdict(list)
+    for tweet_id in tweet_ids:
+        groups[shard_for(tweet_id, shards)].append(tweet_id)
+    return dict(groups)
+
+
+@lru_cache(maxsize=None)
+def _executor(workers):
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="like-shard")
+
+
+def _run_in_thread(func, alias):
+    try:
+        return func(alias)
+    finally:
+        # ワーカースレッドの接続はリクエストの終わりに閉じられないので、ここで閉じる
+        connections[alias].close()
+
+
+def scatter(func, aliases=None):
+    """func(alias) を各シャードで並列に実行し、結果を aliases の順に返す。
+
+    シャードが 1 つならスレッドを使わずにその場で実行する（呼び出し元のトランザクションから読める）。
+    """
+    aliases = list(aliases) if aliases is not None else like_shards()
+    if len(aliases) <= 1:
+        return [func(alias) for alias in aliases]
+    executor = _executor(getattr(settings, "LIKE_SHARD_WORKERS", 8))
+    return list(executor.map(lambda alias: _run_in_thread(func, alias), aliases))
+
+
+class LikeShardRouter:
+    """Like の読み書きを、インスタンスから分かるツイートのシャードに振り分ける。
+
+    インスタンスのヒントがない読み取り（Like.objects.filter(user=...) など）は振り分けられないので、
+    シャーディング中は Like.objects.for_tweet() / scatter() を使うこと。
+    """
+
+    def _is_like(self, model):
+        return model._meta.label_lower == "tweets.like"
+
+    def db_for_read(self, model, **hints):
+        if not self._is_like(model):
+            return None
+        # like.save() では Like、tweet.likes.all() ではツイートがヒントになる
+        instance = hints.get("instance")
+        if instance is not None and self._is_like(instance):
+            return shard_for(instance.tweet_id)
+        if instance is not None and instance._meta.label_lower == "tweets.tweet":
+            return shard_for(instance.pk)
+        shards = like_shards()
+        return shards[0] if len(shards) == 1 else None
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if self._is_like(obj1) or self._is_like(obj2):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label != "tweets":
+            return None
+        if db in getattr(settings, "LIKE_SHARD_DATABASES", ()):
+            # シャードには Like のテーブルだけを作る（LIKE_SHARDS に入れる前に、並べ替え先にも作っておく）
+            return model_name == "like"
+        if model_name == "like":
+            # default にも空のテーブルを置き、ツイートやユーザーを消すときの CASCADE の検索が失敗しないようにする
+            return db == "default"
+        return None
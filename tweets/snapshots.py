@@ -0,0 +1,303 @@
+import struct
+import time
+from array import array
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from accounts.models import FriendShip, User
+from metrics.collectors import record_cache, record_snapshot_age, record_snapshot_lag
+from tweets.cursors import order_by_id
+from tweets.models import Tweet
+from tweets.timeline import TimelineItem
+
+# ホームをよく開くユーザー（HOME_SNAPSHOT_MIN_READS 回 / 分以上）ごとに、ホームの 1 ページ目をキャッシュに詰めておく。
+# 新しいツイートや閲覧者自身のいいね・フォローのたびに作り直さず、キャッシュにあるスナップショットの行を書き換える。
+# いいね数は誰のいいねでも変わるので持たず、読むときに 1 クエリで重ねる（いいねのたびに全員分を書き換えない）。
+# 行を消す必要がある変更（ツイートの削除など）ではスナップショットを捨て、次に開いたときに作り直す。
+# 書き換えは読んで書き戻すだけなので、同時に書き換えると片方が失われうる。HOME_SNAPSHOT_TIMEOUT で作り直して追いつく。
+#
+# スナップショットを持つユーザーは、HOME_SNAPSHOT_MAX_USERS 個の枠（user_id で決まる）のキーに 1 人ずつ置く。
+# 枠を奪われたユーザーのスナップショットは書き換えの対象から外れるので、読むときに枠が自分のものか確かめる。
+
+SNAPSHOT_KEY = "timeline:snapshot:{}"
+READS_KEY = "timeline:reads:{}"
+HOT_KEY = "timeline:hot:{}"
+
+LIKED = 1
+FOLLOWED = 2
+
+# (形式のバージョン, 行数, 作った時刻, 最後に書き換えた時刻)
+HEADER = struct.Struct("<BIdd")
+VERSION = 2
+# 行の数値の列と、その array の型
+NUMBER_COLUMNS = ("q", "q", "q", "B")
+
+
+def page_size():
+    return getattr(settings, "HOME_PAGE_SIZE", 20)
+
+
+def _timeout():
+    return getattr(settings, "HOME_SNAPSHOT_TIMEOUT", 300)
+
+
+class Snapshot:
+    """ホームの 1 ページ目。rows は [ツイート ID, 投稿者 ID, 作成日時（マイクロ秒）, フラグ, 投稿者名, 本文]。"""
+
+    __slots__ = ("rows", "built_at", "updated_at")
+
+    def __init__(self, rows, built_at=None, updated_at=None):
+        self.rows = rows
+        self.built_at = built_at or time.time()
+        self.updated_at = updated_at or self.built_at
+
+    @classmethod
+    def from_tweets(cls, tweets):
+        return cls(
+            [
+                [
+                    tweet.pk,
+                    tweet.user_id,
+                    int(tweet.created_at.timestamp() * 1_000_000),
+                    (LIKED if tweet.liked_by_user else 0) | (FOLLOWED if tweet.author_followed else 0),
+                    tweet.username,
+                    tweet.content,
+                ]
+                for tweet in tweets
+            ]
+        )
+
+    def tweets(self):
+        """TimelineItem に戻す。DB には問い合わせない（いいね数は 0 のまま）。"""
+        tweets = []
+        for pk, user_id, created_at, flags, username, content in self.rows:
+            created_at = datetime.fromtimestamp(created_at / 1_000_000, tz=timezone.utc)
+            tweet = TimelineItem(pk, user_id, content, created_at, 0, username)
+            tweet.liked_by_user = bool(flags & LIKED)
+            tweet.author_followed = bool(flags & FOLLOWED)
+            tweets.append(tweet)
+        return tweets
+
+    def pack(self):
+        """列ごとに array に詰めたバイト列にする。文字列は長さの配列と UTF-8 をつなげたものにする。"""
+        columns = list(zip(*self.rows)) or [()] * (len(NUMBER_COLUMNS) + 2)
+        parts = [HEADER.pack(VERSION, len(self.rows), self.built_at, self.updated_at)]
+        parts += [array(typecode, column).tobytes() for typecode, column in zip(NUMBER_COLUMNS, columns)]
+        for column in columns[len(NUMBER_COLUMNS) :]:
+            encoded = [value.encode() for value in column]
+            parts += [array("I", map(len, encoded)).tobytes(), b"".join(encoded)]
+        return b"".join(parts)
+
+    @classmethod
+    def unpack(cls, data):
+        version, count, built_at, updated_at = HEADER.unpack_from(data)
+        if version != VERSION:
+            return None
+        offset = HEADER.size
+        columns = []
+
+        def read_array(typecode):
+            nonlocal offset
+            column = array(typecode)
+            column.frombytes(data[offset : offset + column.itemsize * count])
+            offset += column.itemsize * count
+            return column
+
+        for typecode in NUMBER_COLUMNS:
+            columns.append(read_array(typecode))
+        for _ in range(2):
+            values = []
+            for length in read_array("I"):
+                values.append(data[offset : offset + length].decode())
+                offset += length
+            columns.append(values)
+        return cls([list(row) for row in zip(*columns)], built_at, updated_at)
+
+
+def row_order():
+    """ホームと同じ並び（新しい順）にするための行のキー。"""
+    if order_by_id():
+        return lambda row: row[0]
+    return lambda row: (row[2], row[0])
+
+
+def record_read(user_id):
+    """ホームを開いた回数を数え、スナップショットを持たせるユーザーなら True を返す。"""
+    key = READS_KEY.format(user_id)
+    cache.add(key, 0, 60)
+    try:
+        reads = cache.incr(key)
+    except ValueError:
+        return False
+    return reads >= getattr(settings, "HOME_SNAPSHOT_MIN_READS", 3)
+
+
+def _slot_count():
+    return getattr(settings, "HOME_SNAPSHOT_MAX_USERS", 100)
+
+
+def _slot_key(user_id):
+    return HOT_KEY.format(user_id % _slot_count())
+
+
+def _hot_users():
+    return list(cache.get_many([HOT_KEY.format(slot) for slot in range(_slot_count())]).values())
+
+
+def _with_like_counts(tweets):
+    """いいね数を DB から 1 クエリで重ねる。消されたツイートが混ざっていれば None を返す。"""
+    if not tweets:
+        return tweets
+    counts = dict(Tweet.objects.filter(pk__in=[tweet.pk for tweet in tweets]).values_list("pk", "like_count"))
+    if len(counts) < len(tweets):
+        return None
+    for tweet in tweets:
+        tweet.like_count = counts[tweet.pk]
+    return tweets
+
+
+def first_page(user_id):
+    """スナップショットの 1 ページ目（HOME_PAGE_SIZE + 1 件）をいいね数を重ねて返す。なければ None。"""
+    key = SNAPSHOT_KEY.format(user_id)
+    found = cache.get_many([key, _slot_key(user_id)])
+    # 枠を他のユーザーに奪われていれば、新しいツイートが足されていない
+    data = found.get(key) if found.get(_slot_key(user_id)) == user_id else None
+    record_cache("home_snapshot", data is not None)
+    snapshot = Snapshot.unpack(data) if data is not None else None
+    if snapshot is None:
+        return None
+    record_snapshot_age(time.time() - snapshot.built_at)
+    return _with_like_counts(snapshot.tweets())
+
+
+def save(user_id, tweets):
+    """DB から読んだ 1 ページ目（閲覧者の状態つき）をスナップショットにして、書き換えの対象に加える。
+
+    枠のキーを書くだけなので、他のユーザーの save と読み書きが重なって取り消し合うことはない。
+    """
+    cache.set_many(
+        {SNAPSHOT_KEY.format(user_id): Snapshot.from_tweets(tweets).pack(), _slot_key(user_id): user_id}, _timeout()
+    )
+
+
+def _rewrite(func, user_ids=None):
+    """func(user_id, snapshot) でスナップショットを書き換える。
+
+    func が True を返したものは書き戻し、None を返したものは捨てる。
+    """
+    user_ids = list(_hot_users()) if user_ids is None else user_ids
+    keys = {SNAPSHOT_KEY.format(user_id): user_id for user_id in user_ids}
+    changed = {}
+    dropped = []
+    for key, data in cache.get_many(keys).items():
+        snapshot = Snapshot.unpack(data)
+        result = func(keys[key], snapshot) if snapshot is not None else None
+        if result is None:
+            dropped.append(key)
+        elif result:
+            snapshot.updated_at = time.time()
+            changed[key] = snapshot.pack()
+    if changed:
+        cache.set_many(changed, _timeout())
+    if dropped:
+        cache.delete_many(dropped)
+
+
+def add_tweets(tweets):
+    """新しいツイートを各スナップショットのホームと同じ並びの位置に足す。
+
+    取り込んだ古いツイートなど、1 ページ目が埋まっていてその最後の行より古いものは足さない（2 ページ目以降に出る）。
+    """
+    hot = _hot_users()
+    if not tweets or not hot:
+        return
+    authors = {tweet.user_id for tweet in tweets}
+    follows = set(
+        FriendShip.objects.filter(following_id__in=hot, followed_id__in=authors).values_list(
+            "following_id", "followed_id"
+        )
+    )
+    usernames = dict(User.objects.filter(pk__in=authors).values_list("pk", "username"))
+    limit = page_size() + 1
+    key = row_order()
+    # どれかのスナップショットの先頭に入ったツイート。遅れはこれだけで測る（取り込んだ古いツイートを数えない）
+    newest = set()
+
+    def merge(user_id, snapshot):
+        # タスクのやり直しなどで同じツイートが 2 回来ても重ねない
+        present = {row[0] for row in snapshot.rows}
+        head = key(snapshot.rows[0]) if snapshot.rows else None
+        last = key(snapshot.rows[-1]) if len(snapshot.rows) >= limit else None
+        changed = False
+        for tweet in tweets:
+            if tweet.pk in present:
+                continue
+            flags = FOLLOWED if (user_id, tweet.user_id) in follows else 0
+            created_at = int(tweet.created_at.timestamp() * 1_000_000)
+            row = [
+                tweet.pk,
+                tweet.user_id,
+                created_at,
+                flags,
+                usernames[tweet.user_id],
+                tweet.content,
+            ]
+            if last is not None and key(row) < last:
+                continue
+            if head is None or key(row) > head:
+                newest.add(tweet.pk)
+            snapshot.rows.append(row)
+            changed = True
+        if changed:
+            snapshot.rows.sort(key=key, reverse=True)
+            del snapshot.rows[limit:]
+        return changed
+
+    _rewrite(merge, hot)
+    now = timezone.now()
+    for tweet in tweets:
+        if tweet.pk in newest:
+            record_snapshot_lag((now - tweet.created_at).total_seconds())
+
+
+def update_like(tweet_id, user_id, liked):
+    """いいねしたユーザーのスナップショットで、いいね済みの印を書き換える（いいね数は読むときに重ねる）。"""
+
+    def update(viewer_id, snapshot):
+        changed = False
+        for row in snapshot.rows:
+            if row[0] == tweet_id:
+                row[3] = row[3] | LIKED if liked else row[3] & ~LIKED
+                changed = True
+        return changed
+
+    _rewrite(update, [user_id])
+
+
+def update_follow(following_id, followed_id, followed):
+    """フォローしたユーザーのスナップショットで、相手のツイートのフォロー中の印を書き換える。"""
+
+    def update(viewer_id, snapshot):
+        changed = False
+        for row in snapshot.rows:
+            if row[1] == followed_id:
+                row[3] = row[3] | FOLLOWED if followed else row[3] & ~FOLLOWED
+                changed = True
+        return changed
+
+    _rewrite(update, [following_id])
+
+
+def remove_tweets(tweet_ids=(), user_id=None):
+    """消したツイート（または user_id のツイートすべて）を含むスナップショットを捨てる。"""
+    tweet_ids = set(tweet_ids)
+
+    def drop(viewer_id, snapshot):
+        if any(row[0] in tweet_ids or row[1] == user_id for row in snapshot.rows):
+            return None
+        return False
+
+    _rewrite(drop)
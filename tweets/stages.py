@@ -0,0 +1,19 @@
+from tweets import snapshots
+from tweets.pipeline import stage
+from tweets.tags import index_tweets
+from tweets.versions import bump_profile
+
+
+@stage("index_tags")
+def index_tags(tweets):
+    index_tweets(tweets)
+
+
+@stage("bump_profile")
+def bump_profiles(tweets):
+    bump_profile(*{tweet.user_id for tweet in tweets})
+
+
+@stage("home_snapshots")
+def add_to_home_snapshots(tweets):
+    snapshots.add_tweets(tweets)
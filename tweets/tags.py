@@ -0,0 +1,62 @@
+import re
+
+from django.conf import settings
+
+from archive.models import ArchivedTweetTag
+from archive.reads import read_through
+from tweets.cursors import before_q, next_cursor
+from tweets.models import TweetTag
+from tweets.timeline import archived_items, timeline_items
+
+HASHTAG_RE = re.compile(r"(?<![\w#&])#(\w+)")
+# ユーザー名に使える文字（英数字と @ . + - _）。末尾のピリオドは文の区切りとみなす
+MENTION_RE = re.compile(r"(?<![\w@])@([\w.@+-]+)")
+MAX_LENGTH = TweetTag._meta.get_field("tag").max_length - 1
+
+
+def hashtag(name):
+    return "#" + name.casefold()[:MAX_LENGTH]
+
+
+def mention(username):
+    return "@" + username[:MAX_LENGTH]
+
+
+def extract_tags(content):
+    """本文からハッシュタグとメンションを取り出し、重複を除いて出現順に返す。"""
+    tags = [hashtag(name) for name in HASHTAG_RE.findall(content)]
+    tags += [mention(username.rstrip(".")) for username in MENTION_RE.findall(content)]
+    return list(dict.fromkeys(tag for tag in tags if len(tag) > 1))
+
+
+def index_tweets(tweets):
+    """ツイートのハッシュタグとメンションを転置インデックスにまとめて書き込む。"""
+    rows = [
+        TweetTag(tag=tag, tweet_id=tweet.pk, created_at=tweet.created_at)
+        for tweet in tweets
+        for tag in extract_tags(tweet.content)
+    ]
+    TweetTag.objects.bulk_create(
+        rows, batch_size=getattr(settings, "TAG_INDEX_BATCH_SIZE", 500), ignore_conflicts=True
+    )
+    return len(rows)
+
+
+def tag_timeline(tag, before=None, limit=20):
+    """tag の付いたツイートを新しい順に最大 limit 件と、次のページのカーソルを返す。
+
+    本文を LIKE で探さず、(tag, created_at, tweet_id) のインデックスをキーセットでたどる。
+    ページがアーカイブの境界を越える場合は、アーカイブのインデックスからも読む。
+    """
+    entries = TweetTag.objects.filter(before_q(before, "tweet_id"), tag=tag, tweet__deleted_at__isnull=True).order_by(
+        "-created_at", "-tweet_id"
+    )
+    archived = ArchivedTweetTag.objects.filter(before_q(before, "tweet_id"), tag=tag).order_by(
+        "-created_at", "-tweet_id"
+    )
+    tweets = read_through(
+        timeline_items(entries[: limit + 1], "tweet__"),
+        limit,
+        lambda count: archived_items(archived[:count], "tweet__"),
+    )
+    return tweets[:limit], next_cursor(tweets, limit)
@@ -0,0 +1,44 @@
+from collections import defaultdict
+
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from taskqueue.queue import task
+from tweets.deletion import delete_tweets
+from tweets.models import Like, Tweet
+from tweets.pipeline import run_deferred
+from tweets.sharding import is_sharded
+
+
+def like_count_subquery():
+    likes = Like.objects.filter(tweet=OuterRef("pk")).order_by().values("tweet").annotate(count=Count("pk"))
+    return Coalesce(Subquery(likes.values("count")), 0)
+
+
+@task("tweets.reconcile_like_counts")
+def reconcile_like_counts(tweet_ids=None):
+    tweets = Tweet.objects.all()
+    if tweet_ids is not None:
+        tweets = tweets.filter(pk__in=tweet_ids)
+    if not is_sharded():
+        return tweets.update(like_count=like_count_subquery())
+    # いいねが別のデータベースにあるのでサブクエリにできない。各シャードで数えてから、同じ数のツイートをまとめて更新する
+    counts = Like.objects.counts(tweet_ids)
+    by_count = defaultdict(list)
+    for tweet_id, count in counts.items():
+        by_count[count].append(tweet_id)
+    updated = tweets.exclude(pk__in=counts).update(like_count=0)
+    for count, ids in by_count.items():
+        updated += tweets.filter(pk__in=ids).update(like_count=count)
+    return updated
+
+
+@task("tweets.run_pipeline")
+def run_pipeline(tweet_ids, stages):
+    # 実行までに消されたツイートは処理しない
+    run_deferred(list(Tweet.objects.filter(pk__in=tweet_ids)), stages)
+
+
+@task("tweets.purge_tweet")
+def purge_tweet(tweet_id):
+    delete_tweets(Tweet.all_objects.filter(pk=tweet_id, deleted_at__isnull=False))
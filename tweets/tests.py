@@ -1,16 +1,42 @@
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
 
 # from django.contrib.auth import SESSION_KEY,
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
-from tweets.models import Like, Tweet
+from accounts.models import FriendShip
+from metrics.collectors import HOME_SNAPSHOT_LAG, PIPELINE_STAGE_SECONDS
+from metrics.querybudget import QueryBudgetTestMixin
+from notifications.models import Notification
+from ratelimit.stores import get_store
+from taskqueue.queue import run_pending
+from tweets import ids, likes, pipeline, snapshots
+from tweets.deletion import delete_tweets, soft_delete_tweet
+from tweets.models import Like, Tweet, TweetTag
+from tweets.rekeying import rekey_tweets
+from tweets.sharding import shard_for
+from tweets.snapshots import Snapshot
+from tweets.tags import extract_tags, index_tweets
+from tweets.tasks import reconcile_like_counts
+from tweets.timeline import TimelineItem, timeline_items
+from tweets.viewer import attach_viewer_state, resolve_viewer_state
 
 User = get_user_model()
 
 
 class TestHomeView(TestCase):
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(username="tester", password="testpassword")
         self.client.login(username="tester", password="testpassword")
         self.tweet = Tweet.objects.create(user=self.user, content="TestContent")
@@ -22,7 +48,15 @@ class TestHomeView(TestCase):
         response = self.client.get(self.url)
         context_tweets = response.context["tweets"]
         db_tweets = Tweet.objects.all().order_by("-created_at")
-        self.assertEqual(list(context_tweets), list(db_tweets))
+        self.assertEqual([tweet.pk for tweet in context_tweets], [tweet.pk for tweet in db_tweets])
+
+    def test_success_pages(self):
+        with self.settings(HOME_PAGE_SIZE=1):
+            response = self.client.get(self.url)
+            self.assertEqual([tweet.content for tweet in response.context["tweets"]], ["OtherTestContent"])
+            response = self.client.get(self.url, {"before": response.context["next_cursor"]})
+        self.assertEqual([tweet.content for tweet in response.context["tweets"]], ["TestContent"])
+        self.assertIsNone(response.context["next_cursor"])
 
 
 class TestTweetCreateView(TestCase):
@@ -74,6 +108,38 @@ class TestTweetDetailView(TestCase):
         self.assertEqual(response.context["tweet"], self.tweet)
 
 
+class TestTweetDetailConditionalGet(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", email="test@test.com", password="testpassword")
+        self.tweet = Tweet.objects.create(user=self.user, content="test_content")
+        self.url = reverse("tweets:detail", args=[str(self.tweet.id)])
+
+    def test_success_not_modified_without_queries(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Last-Modified", response)
+        self.assertIn("s-maxage", response["Cache-Control"])
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_after_like(self):
+        self.client.login(username="testuser", password="testpassword")
+        etag = self.client.get(self.url)["ETag"]
+        self.assertIn("private", self.client.get(self.url)["Cache-Control"])
+        self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_etag_differs_per_viewer(self):
+        anonymous_etag = self.client.get(self.url)["ETag"]
+        self.client.login(username="testuser", password="testpassword")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=anonymous_etag)
+        self.assertEqual(response.status_code, 200)
+
+
 class TestTweetDeleteView(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username="testuser", email="test@test.com", password="testpassword")
@@ -87,6 +153,17 @@ class TestTweetDeleteView(TestCase):
         self.assertRedirects(response, reverse("tweets:home"))
         self.assertFalse(Tweet.objects.filter(id=self.tweet.id).exists())
 
+    def test_success_purge_after_post(self):
+        Like.objects.create(user=self.user, tweet=self.tweet)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url)
+        self.assertTrue(Tweet.all_objects.filter(id=self.tweet.id).exists())
+        self.assertEqual(self.client.get(reverse("tweets:detail", args=(self.tweet.id,))).status_code, 404)
+
+        run_pending()
+        self.assertFalse(Tweet.all_objects.filter(id=self.tweet.id).exists())
+        self.assertFalse(Like.objects.exists())
+
     def test_failure_post_with_not_exist_tweet(self):
         not_exist_tweet_id = self.tweet.id + 1
         url = reverse("tweets:delete", args=(not_exist_tweet_id,))
@@ -120,6 +197,8 @@ class TestLikeView(TestCase):
         response = self.client.post(self.url)
         self.assertEqual(response.status_code, 200)
         self.assertTrue(Like.objects.filter(user=self.user).exists())
+        self.another_user_tweet.refresh_from_db()
+        self.assertEqual(self.another_user_tweet.like_count, 1)
 
     def test_failure_post_with_not_exist_tweet(self):
         response = self.client.post(self.non_exist_url)
@@ -160,3 +239,483 @@ class TestUnLikeView(TestCase):
 
         response = self.client.post(self.url)
         self.assertEqual(response.status_code, 200)
+
+
+class TestLikeToggle(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.another_user = User.objects.create_user(username="another_testuser", password="testpassword")
+        self.tweet = Tweet.objects.create(user=self.another_user, content="test_content")
+        self.client.login(username="testuser", password="testpassword")
+        cache.clear()
+
+    def assertStatements(self, func, count):
+        with CaptureQueriesContext(connection) as context:
+            result = func(self.tweet.id, self.user.id)
+        statements = [query for query in context.captured_queries if "SAVEPOINT" not in query["sql"]]
+        self.assertEqual(len(statements), count)
+        return result
+
+    def test_success_like_and_unlike(self):
+        self.assertEqual(self.assertStatements(likes.like, 2), (True, 1, self.another_user.id))
+        self.assertEqual(self.assertStatements(likes.like, 2), (False, 1, self.another_user.id))
+        self.assertEqual(self.assertStatements(likes.unlike, 2), (True, 0, self.another_user.id))
+        self.assertEqual(self.assertStatements(likes.unlike, 2), (False, 0, self.another_user.id))
+
+    def test_failure_like_deleted_tweet(self):
+        Tweet.objects.filter(id=self.tweet.id).update(deleted_at=self.tweet.created_at)
+        with self.assertRaises(Tweet.DoesNotExist):
+            likes.like(self.tweet.id, self.user.id)
+        self.assertFalse(Like.objects.exists())
+
+    def test_success_post_returns_state(self):
+        response = self.client.post(reverse("tweets:like", args=(self.tweet.id,)))
+        self.assertEqual(response.json(), {"liked": True, "likes_count": 1})
+        response = self.client.post(reverse("tweets:unlike", args=(self.tweet.id,)))
+        self.assertEqual(response.json(), {"liked": False, "likes_count": 0})
+
+    def test_success_post_with_idempotency_key(self):
+        url = reverse("tweets:like", args=(self.tweet.id,))
+        self.client.post(url, HTTP_IDEMPOTENCY_KEY="key")
+        Like.objects.all().delete()
+        response = self.client.post(url, HTTP_IDEMPOTENCY_KEY="key")
+        self.assertEqual(response.json(), {"liked": True, "likes_count": 1})
+        self.assertFalse(Like.objects.exists())
+
+
+class TestTagTimeline(TestCase):
+    def setUp(self):
+        get_store().reset()
+        self.addCleanup(get_store().reset)
+        self.user = User.objects.create_user(username="testuser", email="test@test.com", password="testpassword")
+        self.client.login(username="testuser", password="testpassword")
+
+    def post_tweet(self, content):
+        # タグの索引はコミット後のパイプラインで書き込まれる
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("tweets:create"), {"content": content})
+
+    def test_extract_tags(self):
+        self.assertEqual(
+            extract_tags("#Django と #django、@alice. さん a@b.com #日本語 &#39;"),
+            ["#django", "#日本語", "@alice"],
+        )
+
+    def test_success_index_on_create(self):
+        self.post_tweet("#Python の話 @testuser")
+        tweet = Tweet.objects.get()
+        self.assertQuerysetEqual(
+            TweetTag.objects.filter(tweet=tweet).order_by("tag").values_list("tag", "created_at"),
+            [("#python", tweet.created_at), ("@testuser", tweet.created_at)],
+            transform=tuple,
+        )
+
+    def test_success_keyset_pages(self):
+        for i in range(5):
+            self.post_tweet(f"#django {i}")
+        Tweet.objects.create(user=self.user, content="#djangoのない本文 django")
+        url = reverse("tweets:hashtag", kwargs={"tag": "Django"})
+        seen = []
+        with self.settings(TAG_TIMELINE_PAGE_SIZE=2):
+            response = self.client.get(url)
+            while True:
+                seen += [tweet.content for tweet in response.context["tweets"]]
+                if response.context["next_cursor"] is None:
+                    break
+                response = self.client.get(url, {"before": response.context["next_cursor"]})
+        self.assertEqual(seen, [f"#django {i}" for i in reversed(range(5))])
+
+    def test_success_mention_excludes_deleted(self):
+        self.post_tweet("@testuser こんにちは")
+        self.post_tweet("@testuser さようなら")
+        Tweet.objects.filter(content__startswith="@testuser さよう").update(deleted_at=self.user.date_joined)
+        response = self.client.get(reverse("tweets:mention", kwargs={"username": "testuser"}))
+        self.assertEqual([tweet.content for tweet in response.context["tweets"]], ["@testuser こんにちは"])
+
+    def test_failure_bad_cursor(self):
+        response = self.client.get(reverse("tweets:hashtag", kwargs={"tag": "django"}), {"before": "x"})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestViewerState(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", email="test@test.com", password="testpassword")
+        self.followed = User.objects.create_user(username="followed", email="a@test.com", password="testpassword")
+        self.other = User.objects.create_user(username="other", email="b@test.com", password="testpassword")
+        FriendShip.objects.create(following=self.user, followed=self.followed)
+        self.liked_tweet = Tweet.objects.create(user=self.followed, content="liked")
+        self.other_tweet = Tweet.objects.create(user=self.other, content="other")
+        Like.objects.create(user=self.user, tweet=self.liked_tweet)
+        Like.objects.create(user=self.other, tweet=self.other_tweet)
+
+    def test_success_two_queries(self):
+        tweet_ids = [self.liked_tweet.pk, self.other_tweet.pk]
+        with self.assertNumQueries(2):
+            state = resolve_viewer_state(self.user, tweet_ids, [self.followed.pk, self.other.pk])
+        self.assertEqual(state.liked_tweet_ids, {self.liked_tweet.pk})
+        self.assertEqual(state.followed_user_ids, {self.followed.pk})
+
+    def test_success_anonymous_without_queries(self):
+        with self.assertNumQueries(0):
+            tweets = attach_viewer_state(AnonymousUser(), [self.liked_tweet])
+        self.assertFalse(tweets[0].liked_by_user)
+        self.assertFalse(tweets[0].author_followed)
+
+    def test_success_home_view(self):
+        self.client.login(username="testuser", password="testpassword")
+        response = self.client.get(reverse("tweets:home"))
+        state = {tweet.content: (tweet.liked_by_user, tweet.author_followed) for tweet in response.context["tweets"]}
+        self.assertEqual(state, {"liked": (True, True), "other": (False, False)})
+        self.assertContains(response, "（フォロー中）", count=1)
+
+
+@override_settings(LIKE_SHARDS=["likes_0", "likes_1"])
+class TestLikeShards(TransactionTestCase):
+    # シャードを読むスレッドからも見えるように、トランザクションで囲まずに書き込む
+    databases = {"default", "likes_0", "likes_1"}
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.author = User.objects.create_user(username="author", password="testpassword")
+        self.tweets = [Tweet.objects.create(user=self.author, content=f"tweet {i}") for i in range(8)]
+        self.shards = {shard_for(tweet.pk) for tweet in self.tweets}
+        cache.clear()
+
+    def test_success_like_on_shard(self):
+        tweet = self.tweets[0]
+        self.assertEqual(likes.like(tweet.pk, self.user.pk), (True, 1, self.author.pk))
+        self.assertEqual(likes.like(tweet.pk, self.user.pk), (False, 1, self.author.pk))
+        self.assertEqual(Like.objects.for_tweet(tweet.pk).count(), 1)
+        self.assertEqual(tweet.likes.count(), 1)
+        self.assertFalse(Like.objects.using("default").exists())
+        self.assertEqual(likes.unlike(tweet.pk, self.user.pk), (True, 0, self.author.pk))
+        self.assertFalse(Like.objects.for_tweet(tweet.pk).exists())
+
+    def test_failure_like_deleted_tweet(self):
+        tweet = self.tweets[0]
+        Tweet.objects.filter(pk=tweet.pk).update(deleted_at=tweet.created_at)
+        with self.assertRaises(Tweet.DoesNotExist):
+            likes.like(tweet.pk, self.user.pk)
+        self.assertFalse(Like.objects.for_tweet(tweet.pk).exists())
+
+    def test_success_scatter_reads(self):
+        self.assertEqual(self.shards, {"likes_0", "likes_1"})
+        for tweet in self.tweets[::2]:
+            likes.like(tweet.pk, self.user.pk)
+        liked = {tweet.pk for tweet in self.tweets[::2]}
+        state = resolve_viewer_state(self.user, [tweet.pk for tweet in self.tweets], [self.author.pk])
+        self.assertEqual(state.liked_tweet_ids, liked)
+        self.assertEqual({tweet_id for tweet_id, _ in Like.objects.given_by(self.user.pk)}, liked)
+        self.assertEqual(Like.objects.counts(), dict.fromkeys(liked, 1))
+
+    def test_success_reconcile_and_delete(self):
+        for tweet in self.tweets:
+            Like.objects.create(user=self.user, tweet=tweet)
+        self.assertEqual(reconcile_like_counts(), len(self.tweets))
+        self.assertEqual(set(Tweet.objects.values_list("like_count", flat=True)), {1})
+        delete_tweets(Tweet.all_objects.all())
+        self.assertEqual(Like.objects.counts(), {})
+
+    def test_success_reshard(self):
+        with self.settings(LIKE_SHARDS=[]):
+            for tweet in self.tweets:
+                Like.objects.create(user=self.user, tweet=tweet)
+        call_command("reshard_likes", "--from", "default", "--to", "likes_0,likes_1", stdout=StringIO())
+        self.assertFalse(Like.objects.using("default").exists())
+        self.assertEqual(Like.objects.counts(), {tweet.pk: 1 for tweet in self.tweets})
+
+
+class TestTweetPipeline(TestCase):
+    def setUp(self):
+        get_store().reset()
+        self.addCleanup(get_store().reset)
+        PIPELINE_STAGE_SECONDS.reset()
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.login(username="testuser", password="testpassword")
+
+    def post_tweet(self, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("tweets:create"), {"content": content})
+        return Tweet.objects.latest("pk")
+
+    def test_success_inline_stages_timed(self):
+        tweet = self.post_tweet("#python")
+        self.assertTrue(TweetTag.objects.filter(tweet=tweet, tag="#python").exists())
+        timed = {tuple(key) for key, _ in PIPELINE_STAGE_SECONDS.dump()}
+        self.assertEqual(timed, {("index_tags", "inline"), ("bump_profile", "inline"), ("home_snapshots", "inline")})
+
+    def test_success_deferred_stage(self):
+        with self.settings(TWEET_PIPELINE={"index_tags": "deferred"}):
+            tweet = self.post_tweet("#python")
+        self.assertFalse(TweetTag.objects.exists())
+        run_pending()
+        self.assertTrue(TweetTag.objects.filter(tweet=tweet, tag="#python").exists())
+        self.assertIn(["index_tags", "deferred"], [key for key, _ in PIPELINE_STAGE_SECONDS.dump()])
+
+    def test_failure_stage_does_not_block_others(self):
+        def broken(tweets):
+            raise RuntimeError
+
+        pipeline.stage("broken")(broken)
+        self.addCleanup(pipeline._stages.pop, "broken")
+        with self.assertLogs("tweets.pipeline", "ERROR"):
+            tweet = self.post_tweet("#python")
+        self.assertTrue(TweetTag.objects.filter(tweet=tweet).exists())
+
+
+@override_settings(HOME_SNAPSHOT_MIN_READS=2)
+class TestHomeSnapshot(TestCase):
+    def setUp(self):
+        cache.clear()
+        get_store().reset()
+        self.addCleanup(get_store().reset)
+        self.user = User.objects.create_user(username="tester", password="testpassword")
+        self.author = User.objects.create_user(username="author", password="testpassword")
+        FriendShip.objects.create(following=self.user, followed=self.author)
+        self.tweet = Tweet.objects.create(user=self.author, content="最初のツイート")
+        self.client.login(username="tester", password="testpassword")
+        self.url = reverse("tweets:home")
+        # 2 回目でスナップショットが作られる
+        self.client.get(self.url)
+        self.client.get(self.url)
+
+    def get_from_snapshot(self):
+        # セッションとユーザーの読み込みのほかは、いいね数を重ねる 1 クエリだけ
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        return [
+            (tweet.content, tweet.like_count, tweet.liked_by_user, tweet.author_followed)
+            for tweet in response.context["tweets"]
+        ]
+
+    def test_pack_round_trip(self):
+        rows = [[2, 1, 1_700_000_000_000_000, 1, "author", "こんにちは #python"], [1, 2, 0, 0, "", ""]]
+        snapshot = Snapshot.unpack(Snapshot(rows, 1.5).pack())
+        self.assertEqual(snapshot.rows, rows)
+        self.assertEqual((snapshot.built_at, snapshot.updated_at), (1.5, 1.5))
+        self.assertEqual(Snapshot.unpack(Snapshot([]).pack()).rows, [])
+
+    def test_success_served_without_queries(self):
+        self.assertEqual(self.get_from_snapshot(), [("最初のツイート", 0, False, True)])
+
+    def test_success_incremental_updates(self):
+        self.client.post(reverse("tweets:like", args=(self.tweet.pk,)))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("tweets:create"), {"content": "自分のツイート"})
+        self.client.post(reverse("accounts:unfollow", args=("author",)))
+        self.assertEqual(
+            self.get_from_snapshot(), [("自分のツイート", 0, False, False), ("最初のツイート", 1, True, False)]
+        )
+
+    def test_success_like_by_other_user_rewrites_only_their_snapshot(self):
+        liker = User.objects.create_user(username="liker", password="testpassword")
+        snapshots.save(liker.pk, attach_viewer_state(liker, snapshots.first_page(self.user.pk)))
+        before = cache.get(snapshots.SNAPSHOT_KEY.format(self.user.pk))
+        self.client.login(username="liker", password="testpassword")
+        self.client.post(reverse("tweets:like", args=(self.tweet.pk,)))
+        self.assertEqual(cache.get(snapshots.SNAPSHOT_KEY.format(self.user.pk)), before)
+        self.assertTrue(snapshots.first_page(liker.pk)[0].liked_by_user)
+        self.client.login(username="tester", password="testpassword")
+        self.assertEqual(self.get_from_snapshot(), [("最初のツイート", 1, False, True)])
+
+    @override_settings(HOME_SNAPSHOT_MAX_USERS=1)
+    def test_success_snapshot_dropped_when_slot_taken(self):
+        other = User.objects.create_user(username="other", password="testpassword")
+        snapshots.save(other.pk, [])
+        self.assertIsNone(snapshots.first_page(self.user.pk))
+        self.assertEqual(snapshots.first_page(other.pk), [])
+
+    @override_settings(HOME_PAGE_SIZE=1)
+    def test_success_backdated_tweets_merged_in_order(self):
+        def add(content, age):
+            tweet = Tweet.objects.create(user=self.author, content=content, created_at=timezone.now() - age)
+            snapshots.add_tweets([tweet])
+
+        def lag_count():
+            return sum(sum(state[:-1]) for _, state in HOME_SNAPSHOT_LAG.dump())
+
+        before = lag_count()
+        add("取り込んだツイート", timedelta(days=2))
+        # 1 ページ目（と次のページの有無を見る 1 件）が埋まった後は、最後の行より古いものは足さない
+        add("もっと古いツイート", timedelta(days=3))
+        add("新しいツイート", timedelta(0))
+        self.assertEqual(
+            [row[5] for row in Snapshot.unpack(cache.get(snapshots.SNAPSHOT_KEY.format(self.user.pk))).rows],
+            ["新しいツイート", "最初のツイート"],
+        )
+        # 遅れは先頭に入った新しいツイートの分だけ測る
+        self.assertEqual(lag_count(), before + 1)
+
+    def test_success_delete_drops_snapshot(self):
+        soft_delete_tweet(self.tweet)
+        response = self.client.get(self.url)
+        self.assertEqual(list(response.context["tweets"]), [])
+
+
+class TestQueryBudgets(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        get_store().reset()
+        self.addCleanup(get_store().reset)
+        self.user = User.objects.create_user(username="tester", password="testpassword")
+        self.author = User.objects.create_user(username="author", password="testpassword")
+        FriendShip.objects.create(following=self.user, followed=self.author)
+        self.tweet = Tweet.objects.create(user=self.author, content="#python @tester")
+        index_tweets([self.tweet])
+        self.client.login(username="tester", password="testpassword")
+
+    def test_success_pages_within_budget(self):
+        paths = [
+            reverse("tweets:home"),
+            reverse("tweets:detail", args=(self.tweet.pk,)),
+            reverse("tweets:hashtag", kwargs={"tag": "python"}),
+            reverse("tweets:mention", kwargs={"username": "tester"}),
+        ]
+        for path in paths:
+            with self.subTest(path=path):
+                cache.clear()
+                self.assertEqual(self.assertWithinViewBudget(path).status_code, 200)
+
+    def test_success_writes_within_budget(self):
+        for name in ("tweets:like", "tweets:unlike"):
+            path = reverse(name, args=(self.tweet.pk,))
+            self.assertWithinViewBudget(path, lambda: self.client.post(path))
+
+        def create():
+            # コミット後のパイプラインのステージも数える
+            with self.captureOnCommitCallbacks(execute=True):
+                return self.client.post(reverse("tweets:create"), {"content": "#python"})
+
+        self.assertWithinViewBudget(reverse("tweets:create"), create)
+        own = Tweet.objects.get(user=self.user)
+        path = reverse("tweets:delete", args=(own.pk,))
+        self.assertWithinViewBudget(path, lambda: self.client.post(path))
+
+    def test_success_home_queries_constant(self):
+        def grow(size):
+            tweets = Tweet.objects.bulk_create(
+                [Tweet(user=self.author, content=f"tweet {i}") for i in range(Tweet.objects.count(), size)]
+            )
+            Like.objects.bulk_create([Like(user=self.user, tweet=tweet) for tweet in tweets[::3]])
+
+        def request():
+            cache.clear()
+            self.client.get(reverse("tweets:home"))
+
+        self.assertConstantQueries(request, grow)
+
+
+class TestTimelineItems(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="tester", password="testpassword")
+        self.tweet = Tweet.objects.create(user=self.user, content="#python こんにちは")
+        index_tweets([self.tweet])
+
+    def test_success_timeline_items(self):
+        with self.assertNumQueries(1):
+            items = timeline_items(Tweet.objects.order_by("-created_at"))
+        self.assertEqual(
+            [(item.pk, item.username, item.content) for item in items],
+            [(self.tweet.pk, "tester", "#python こんにちは")],
+        )
+        self.assertFalse(items[0].is_archived)
+        with self.assertRaises(AttributeError):
+            items[0].user
+
+    def test_success_timeline_items_through_tags(self):
+        items = timeline_items(TweetTag.objects.filter(tag="#python"), "tweet__")
+        self.assertEqual([(item.pk, item.user_id) for item in items], [(self.tweet.pk, self.user.pk)])
+
+    def test_success_snapshot_returns_items(self):
+        self.tweet.username = "tester"
+        self.tweet.liked_by_user = True
+        self.tweet.author_followed = False
+        item = Snapshot.unpack(Snapshot.from_tweets([self.tweet]).pack()).tweets()[0]
+        self.assertIsInstance(item, TimelineItem)
+        self.assertEqual((item.pk, item.user_id, item.username), (self.tweet.pk, self.user.pk, "tester"))
+        self.assertTrue(item.liked_by_user)
+
+    def test_bench_timeline_command(self):
+        out = StringIO()
+        call_command("bench_timeline", tweets=5, iterations=1, stdout=out)
+        self.assertIn("item", out.getvalue())
+        self.assertEqual(Tweet.objects.count(), 1)
+
+
+@override_settings(SNOWFLAKE_LOCK_DIR=tempfile.mkdtemp())
+class TestSnowflakeIds(TestCase):
+    databases = {"default", "likes_0", "likes_1"}
+
+    def setUp(self):
+        cache.clear()
+        get_store().reset()
+        self.addCleanup(get_store().reset)
+        self.user = User.objects.create_user(username="tester", password="testpassword")
+
+    def test_success_generator(self):
+        generator = ids.IdGenerator(5)
+        pks = [generator.next_id() for _ in range(10000)]
+        self.assertEqual(pks, sorted(set(pks)))
+        self.assertTrue(all(ids.is_snowflake(pk) and (pk >> ids.SEQUENCE_BITS) & ids.MAX_WORKER == 5 for pk in pks))
+        self.assertLess(abs(ids.datetime_of(pks[-1]) - timezone.now()), timedelta(seconds=5))
+
+    def test_success_claim_distinct_workers(self):
+        # ロックはファイルを開くたびに別なので、同じプロセスでも 2 つ目は別の ID になる
+        self.assertNotEqual(ids.claim_worker_id(), ids.claim_worker_id())
+
+    def test_success_disabled_uses_autoincrement(self):
+        tweet = Tweet.objects.create(user=self.user, content="自動採番")
+        self.assertFalse(ids.is_snowflake(tweet.pk))
+
+    @override_settings(SNOWFLAKE_IDS=["tweets.Like"])
+    def test_success_like_view_uses_snowflake_ids(self):
+        tweets = [Tweet.objects.create(user=self.user, content=f"tweet {i}") for i in range(2)]
+        self.client.login(username="tester", password="testpassword")
+        self.client.post(reverse("tweets:like", args=(tweets[0].pk,)))
+        with self.settings(LIKE_SHARDS=["likes_0", "likes_1"]):
+            self.client.post(reverse("tweets:like", args=(tweets[1].pk,)))
+            like = Like.objects.using(shard_for(tweets[1].pk)).get()
+        self.assertTrue(ids.is_snowflake(Like.objects.using("default").get().pk))
+        self.assertTrue(ids.is_snowflake(like.pk))
+
+    @override_settings(SNOWFLAKE_IDS=["tweets.Tweet", "tweets.Like"], TIMELINE_ORDER_BY_ID=True, HOME_PAGE_SIZE=1)
+    def test_success_timeline_by_id(self):
+        tweets = [Tweet.objects.create(user=self.user, content=f"tweet {i}") for i in range(3)]
+        self.assertTrue(all(ids.is_snowflake(tweet.pk) for tweet in tweets))
+        self.assertTrue(ids.is_snowflake(Like.objects.create(tweet=tweets[0], user=self.user).pk))
+        self.client.login(username="tester", password="testpassword")
+        seen, cursor = [], None
+        with CaptureQueriesContext(connection) as context:
+            while True:
+                response = self.client.get(reverse("tweets:home"), {"before": cursor} if cursor else {})
+                seen += [tweet.content for tweet in response.context["tweets"]]
+                cursor = response.context["next_cursor"]
+                if cursor is None:
+                    break
+        self.assertEqual(seen, ["tweet 2", "tweet 1", "tweet 0"])
+        # 主キーだけで並べ、絞り込む
+        sql = [query["sql"] for query in context.captured_queries if 'FROM "tweets_tweet"' in query["sql"]][-1]
+        self.assertIn('"tweets_tweet"."id" < ', sql)
+        self.assertTrue(sql.endswith('ORDER BY "tweets_tweet"."id" DESC LIMIT 2'))
+
+    def test_success_rekey(self):
+        now = timezone.now()
+        first = Tweet.objects.create(user=self.user, content="#python 後から取り込んだ古いツイート")
+        second = Tweet.objects.create(user=self.user, content="新しいツイート")
+        Tweet.objects.filter(pk=first.pk).update(created_at=now - timedelta(days=1))
+        Tweet.objects.filter(pk=second.pk).update(created_at=now)
+        index_tweets([Tweet.objects.get(pk=first.pk)])
+        Like.objects.create(tweet=first, user=self.user)
+        Notification.objects.create(recipient=self.user, verb="like", aggregation_key=f"like:{first.pk}", tweet=first)
+
+        self.assertEqual(rekey_tweets(size=1), 2)
+        self.assertEqual(rekey_tweets(), 0)
+        tweets = list(Tweet.objects.order_by("-pk"))
+        self.assertEqual(
+            [tweet.content for tweet in tweets], ["新しいツイート", "#python 後から取り込んだ古いツイート"]
+        )
+        self.assertTrue(all(ids.is_snowflake(tweet.pk) for tweet in tweets))
+        old = tweets[1]
+        self.assertEqual(list(TweetTag.objects.values_list("tweet_id", flat=True)), [old.pk])
+        self.assertEqual(list(Like.objects.values_list("tweet_id", flat=True)), [old.pk])
+        self.assertEqual(Notification.objects.get().aggregation_key, f"like:{old.pk}")
@@ -0,0 +1,51 @@
+from accounts.models import User
+
+# ホーム・プロフィール・タグのタイムラインの 1 行。Tweet と User のインスタンス（パスワードのハッシュなど全列）を作らず、
+# テンプレートで出す列だけを values_list で読む。
+
+COLUMNS = ("id", "user_id", "content", "created_at", "like_count")
+
+
+class TimelineItem:
+    """タイムラインに出すツイート。liked_by_user と author_followed は attach_viewer_state で付ける。"""
+
+    __slots__ = (
+        "pk",
+        "user_id",
+        "content",
+        "created_at",
+        "like_count",
+        "username",
+        "is_archived",
+        "liked_by_user",
+        "author_followed",
+    )
+
+    def __init__(self, pk, user_id, content, created_at, like_count, username, is_archived=False):
+        self.pk = pk
+        self.user_id = user_id
+        self.content = content
+        self.created_at = created_at
+        self.like_count = like_count
+        self.username = username
+        self.is_archived = is_archived
+        self.liked_by_user = False
+        self.author_followed = False
+
+    def __repr__(self):
+        return f"<TimelineItem {self.pk}>"
+
+
+def timeline_items(queryset, prefix=""):
+    """queryset（Tweet か、prefix でツイートをたどれるモデル）を読み、投稿者名は JOIN で一緒に読む。"""
+    columns = [prefix + column for column in COLUMNS] + [prefix + "user__username"]
+    return [TimelineItem(*row) for row in queryset.values_list(*columns)]
+
+
+def archived_items(queryset, prefix=""):
+    """アーカイブのツイートを読む。投稿者は default のデータベースにあるので、名前はまとめて別に読む。"""
+    rows = list(queryset.values_list(*[prefix + column for column in COLUMNS]))
+    if not rows:
+        return []
+    usernames = dict(User.objects.filter(pk__in={row[1] for row in rows}).values_list("pk", "username"))
+    return [TimelineItem(*row, usernames.get(row[1], ""), is_archived=True) for row in rows]
@@ -11,4 +11,6 @@ urlpatterns = [
     path("<int:pk>/delete/", views.TweetDeleteView.as_view(), name="delete"),
     path("<int:pk>/like/", views.LikeView.as_view(), name="like"),
     path("<int:pk>/unlike/", views.UnlikeView.as_view(), name="unlike"),
+    path("hashtag/<str:tag>/", views.TagTimelineView.as_view(), name="hashtag"),
+    path("mention/<str:username>/", views.TagTimelineView.as_view(), name="mention"),
 ]
@@ -0,0 +1,112 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from accounts.models import FriendShip
+from tweets.models import Tweet
+
+# ツイート詳細とプロフィールのページごとのバージョン（Last-Modified と ETag の元）をキャッシュに置く。
+# 書き込み時に bump_* で新しいバージョンにするので、変更がなければ条件付き GET は DB に触れずに 304 を返せる。
+# 複数プロセスで動かす場合は CACHES に共有キャッシュを設定すること。
+
+TWEET_KEY = "version:tweet:{}"
+PROFILE_KEY = "version:profile:{}"
+
+
+def _timeout():
+    return getattr(settings, "PAGE_VERSION_TIMEOUT", 86400)
+
+
+def _new_stamp():
+    now = timezone.now()
+    return {"last_modified": now, "etag": str(now.timestamp())}
+
+
+def bump_tweet(tweet_id):
+    cache.set(TWEET_KEY.format(tweet_id), _new_stamp(), _timeout())
+
+
+def bump_profile(*user_ids):
+    stamp = _new_stamp()
+    cache.set_many({PROFILE_KEY.format(user_id): stamp for user_id in user_ids}, _timeout())
+
+
+def tweet_stamp(tweet_id):
+    key = TWEET_KEY.format(tweet_id)
+    stamp = cache.get(key)
+    if stamp is None:
+        row = Tweet.objects.filter(pk=tweet_id).values_list("updated_at", "like_count").first()
+        if row is None:
+            return None
+        updated_at, like_count = row
+        stamp = {"last_modified": updated_at, "etag": f"{updated_at.timestamp()}-{like_count}"}
+        cache.set(key, stamp, _timeout())
+    return stamp
+
+
+def profile_stamp(user_id):
+    key = PROFILE_KEY.format(user_id)
+    stamp = cache.get(key)
+    if stamp is None:
+        tweets = Tweet.objects.filter(user_id=user_id).aggregate(
+            last=Max("updated_at"), count=Count("pk"), likes=Sum("like_count")
+        )
+        friendships = FriendShip.objects.filter(Q(following_id=user_id) | Q(followed_id=user_id)).aggregate(
+            last=Max("created_at"), count=Count("pk")
+        )
+        last_modified = max(filter(None, [tweets["last"], friendships["last"]]), default=None)
+        etag = f"{tweets['count']}-{tweets['likes']}-{friendships['count']}-{last_modified}"
+        stamp = {"last_modified": last_modified, "etag": etag}
+        cache.set(key, stamp, _timeout())
+    return stamp
+
+
+def conditional_page(stamp_func):
+    """stamp_func(request, **kwargs) が返すバージョンで ETag / Last-Modified を付け、変わっていなければ 304 を返す。
+
+    ETag には閲覧者を含める（ログイン中のユーザーごとに「いいね済み」の表示が変わるため）。
+    未ログインの閲覧には共有キャッシュ向けの Cache-Control を付ける。
+    """
+
+    def get_stamp(request, **kwargs):
+        if not hasattr(request, "_page_stamp"):
+            request._page_stamp = stamp_func(request, **kwargs)
+        return request._page_stamp
+
+    def etag_func(request, *args, **kwargs):
+        stamp = get_stamp(request, **kwargs)
+        if stamp is None:
+            return None
+        viewer = request.user.pk if request.user.is_authenticated else "anonymous"
+        # ページ送りのカーソルなどクエリ文字列ごとに内容が違う
+        return hashlib.md5(f"{stamp['etag']}:{viewer}:{request.GET.urlencode()}".encode()).hexdigest()
+
+    def last_modified_func(request, *args, **kwargs):
+        stamp = get_stamp(request, **kwargs)
+        return stamp["last_modified"] if stamp is not None else None
+
+    def decorator(view_func):
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view_func)
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                if request.user.is_authenticated:
+                    patch_cache_control(response, private=True, no_cache=True)
+                else:
+                    patch_cache_control(
+                        response, public=True, max_age=0, s_maxage=getattr(settings, "PAGE_SHARED_MAX_AGE", 60)
+                    )
+                patch_vary_headers(response, ["Cookie"])
+            return response
+
+        return wrapper
+
+    return decorator
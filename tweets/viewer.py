@@ -0,0 +1,44 @@
+from accounts.models import FriendShip
+from tweets.models import Like
+
+
+class ViewerState:
+    """閲覧者がいいねしたツイートの ID と、フォローしている投稿者の ID。"""
+
+    __slots__ = ("liked_tweet_ids", "followed_user_ids")
+
+    def __init__(self, liked_tweet_ids=(), followed_user_ids=()):
+        self.liked_tweet_ids = frozenset(liked_tweet_ids)
+        self.followed_user_ids = frozenset(followed_user_ids)
+
+    def liked(self, tweet_id):
+        return tweet_id in self.liked_tweet_ids
+
+    def follows(self, user_id):
+        return user_id in self.followed_user_ids
+
+
+def resolve_viewer_state(viewer, tweet_ids, author_ids):
+    """ページに出すツイートと投稿者について、閲覧者の状態を values_list の 2 クエリで読む。"""
+    tweet_ids = set(tweet_ids)
+    author_ids = set(author_ids)
+    if not viewer.is_authenticated:
+        return ViewerState()
+    # いいねをシャーディングしている場合は、ツイートのあるシャードごとに並列に読む
+    liked = Like.objects.liked_tweet_ids(viewer.pk, tweet_ids) if tweet_ids else ()
+    followed = (
+        FriendShip.objects.filter(following=viewer, followed_id__in=author_ids).values_list("followed_id", flat=True)
+        if author_ids
+        else ()
+    )
+    return ViewerState(liked, followed)
+
+
+def attach_viewer_state(viewer, tweets):
+    """tweets の各要素に liked_by_user と author_followed を付ける。Like や FriendShip のインスタンスは作らない。"""
+    tweets = list(tweets)
+    state = resolve_viewer_state(viewer, (tweet.pk for tweet in tweets), (tweet.user_id for tweet in tweets))
+    for tweet in tweets:
+        tweet.liked_by_user = state.liked(tweet.pk)
+        tweet.author_followed = state.follows(tweet.user_id)
+    return tweets
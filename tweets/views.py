@@ -1,29 +1,64 @@
 # from django.shortcuts import render
 from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.db.models import Prefetch
+from django.core.cache import cache
 from django.http import Http404, JsonResponse
+from django.shortcuts import redirect
 from django.urls import reverse_lazy
-from django.views.generic import DeleteView, DetailView, ListView, View
+from django.utils.decorators import method_decorator
+from django.views.generic import DeleteView, DetailView, TemplateView, View
 from django.views.generic.edit import CreateView
 
-from tweets.models import Like, Tweet
-
-
-class HomeView(LoginRequiredMixin, ListView):
-    model = Tweet
-    context_object_name = "tweets"
+from archive.models import ArchivedTweet
+from archive.reads import archived_tweet, read_through
+from metrics.collectors import record_cache, record_write
+from notifications.delivery import notify
+from notifications.models import Notification
+from ratelimit.mixins import RateLimitMixin
+from tweets import likes, snapshots
+from tweets.cursors import CursorMixin, before_q, next_cursor, tweet_before_q, tweet_order
+from tweets.deletion import soft_delete_tweet
+from tweets.models import Tweet
+from tweets.pipeline import tweets_created
+from tweets.tags import hashtag, mention, tag_timeline
+from tweets.timeline import archived_items, timeline_items
+from tweets.versions import bump_profile, bump_tweet, conditional_page, tweet_stamp
+from tweets.viewer import attach_viewer_state
+
+
+class HomeView(LoginRequiredMixin, CursorMixin, TemplateView):
+    # リクエストあたりのクエリ数の上限。metrics.querybudget を使ったテストで確かめる
+    # （アーカイブの境界がキャッシュになければ、その読み込みも含む）
+    query_budget = 6
     template_name = "tweets/home.html"
-    queryset = Tweet.objects.select_related("user").order_by("-created_at")
-
-    def get_queryset(self):
-        queryset = self.queryset.prefetch_related(
-            Prefetch("likes", queryset=Like.objects.filter(user=self.request.user), to_attr="liked_by_user")
-        )
-        return queryset
-
 
-class TweetCreateView(CreateView):
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        user = self.request.user
+        limit = snapshots.page_size()
+        # よく開くユーザーには 1 ページ目をスナップショットから返す
+        hot = self.before is None and snapshots.record_read(user.pk)
+        tweets = snapshots.first_page(user.pk) if hot else None
+        if tweets is None:
+            tweets = Tweet.objects.filter(tweet_before_q(self.before)).order_by(*tweet_order())
+            # 境界を越えたら、アーカイブに移した古いツイートを同じ条件で続けて読む
+            archived = ArchivedTweet.objects.filter(before_q(self.before)).order_by("-created_at", "-pk")
+            tweets = read_through(
+                timeline_items(tweets[: limit + 1]), limit, lambda count: archived_items(archived[:count])
+            )
+            tweets = attach_viewer_state(user, tweets)
+            # アーカイブのツイートはいいね数を重ねられないので、それを含むページは持たない
+            if hot and not any(tweet.is_archived for tweet in tweets):
+                snapshots.save(user.pk, tweets)
+        context["next_cursor"] = next_cursor(tweets, limit)
+        context["tweets"] = tweets[:limit]
+        return context
+
+
+class TweetCreateView(RateLimitMixin, CreateView):
+    # コミット後のパイプラインのステージを含む
+    query_budget = 6
+    ratelimits = [("user", "10/m"), ("ip", "60/m")]
     model = Tweet
     fields = ["content"]
     template_name = "tweets/create.html"
@@ -31,15 +66,59 @@ class TweetCreateView(CreateView):
 
     def form_valid(self, form):
         form.instance.user = self.request.user
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        record_write("tweet")
+        # タグの索引やキャッシュの無効化はコミット後にパイプラインのステージで行う
+        tweets_created([self.object])
+        return response
+
+
+class TagTimelineView(CursorMixin, TemplateView):
+    """ハッシュタグ・メンションの付いたツイートを転置インデックスからキーセットでページングして表示する。"""
 
+    query_budget = 6
+    template_name = "tweets/tag_timeline.html"
 
+    def get_tag(self):
+        if "username" in self.kwargs:
+            return mention(self.kwargs["username"])
+        return hashtag(self.kwargs["tag"])
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["tag"] = self.get_tag()
+        tweets, context["next_cursor"] = tag_timeline(
+            context["tag"], self.before, getattr(settings, "TAG_TIMELINE_PAGE_SIZE", 20)
+        )
+        context["tweets"] = attach_viewer_state(self.request.user, tweets)
+        return context
+
+
+def tweet_detail_stamp(request, pk):
+    return tweet_stamp(pk)
+
+
+@method_decorator(conditional_page(tweet_detail_stamp), name="dispatch")
 class TweetDetailView(DetailView):
+    query_budget = 4
     model = Tweet
+    queryset = Tweet.objects.select_related("user")
+    context_object_name = "tweet"
     template_name = "tweets/detail.html"
 
+    def get_object(self, queryset=None):
+        try:
+            return super().get_object(queryset)
+        except Http404:
+            # アーカイブ済みのツイートは読み取り専用で表示する
+            tweet = archived_tweet(self.kwargs["pk"])
+            if tweet is None:
+                raise
+            return tweet
+
 
 class TweetDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
+    query_budget = 6
     model = Tweet
     template_name = "tweets/delete.html"
     success_url = reverse_lazy(settings.LOGIN_REDIRECT_URL)
@@ -48,32 +127,62 @@ class TweetDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
         tweet = self.get_object()
         return tweet.user == self.request.user
 
+    def form_valid(self, form):
+        # 関連するいいねの削除はバックグラウンドで行う
+        soft_delete_tweet(self.object)
+        return redirect(self.get_success_url())
+
+
+class BaseLikeView(LoginRequiredMixin, RateLimitMixin, View):
+    # サブクラスで toggle(tweet_id, user_id) を実装し、(変わったか, いいね数, 投稿者の ID) を返す
+    query_budget = 4
+    ratelimits = [("user", "60/m"), ("ip", "300/m")]
+    liked = None
+
+    def changed(self, tweet_id, user_id, author_id):
+        pass
 
-class LikeView(LoginRequiredMixin, View):
     def post(self, request, *args, **kwargs):
         target_tweet_id = self.kwargs.get("pk")
 
+        # 同じ Idempotency-Key の再送には DB に触れずに前回と同じ結果を返す
+        idempotency_key = request.headers.get("Idempotency-Key") or request.POST.get("idempotency_key")
+        if idempotency_key:
+            cache_key = f"like-idempotency:{request.user.pk}:{target_tweet_id}:{idempotency_key}"
+            context = cache.get(cache_key)
+            record_cache("like_idempotency", context is not None)
+            if context is not None:
+                return JsonResponse(context)
+
         try:
-            target_tweet = Tweet.objects.get(pk=target_tweet_id)
+            changed, likes_count, author_id = self.toggle(target_tweet_id, request.user.pk)
         except Tweet.DoesNotExist:
             raise Http404("Tweet not found")
-
-        liked_by_user = request.user
-        Like.objects.get_or_create(tweet=target_tweet, user=liked_by_user)
-        context = {"likes_count": target_tweet.likes.count()}
+        if changed:
+            record_write("like" if self.liked else "unlike")
+            bump_tweet(target_tweet_id)
+            bump_profile(author_id)
+            snapshots.update_like(target_tweet_id, request.user.pk, self.liked)
+            self.changed(target_tweet_id, request.user.pk, author_id)
+
+        context = {"liked": self.liked, "likes_count": likes_count}
+        if idempotency_key:
+            cache.set(cache_key, context, getattr(settings, "LIKE_IDEMPOTENCY_TIMEOUT", 300))
         return JsonResponse(context)
 
 
-class UnlikeView(LoginRequiredMixin, View):
-    def post(self, request, *args, **kwargs):
-        target_tweet_id = self.kwargs.get("pk")
+class LikeView(BaseLikeView):
+    liked = True
 
-        try:
-            target_tweet = Tweet.objects.get(pk=target_tweet_id)
-        except Tweet.DoesNotExist:
-            raise Http404("Tweet not found")
+    def toggle(self, tweet_id, user_id):
+        return likes.like(tweet_id, user_id)
 
-        liked_by_user = request.user
-        Like.objects.filter(tweet=target_tweet, user=liked_by_user).delete()
-        context = {"likes_count": target_tweet.likes.count()}
-        return JsonResponse(context)
+    def changed(self, tweet_id, user_id, author_id):
+        notify(Notification.Verb.LIKE, user_id, author_id, tweet_id)
+
+
+class UnlikeView(BaseLikeView):
+    liked = False
+
+    def toggle(self, tweet_id, user_id):
+        return likes.unlike(tweet_id, user_id)